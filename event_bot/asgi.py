@@ -14,3 +14,12 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'event_bot.settings')
 
 application = get_asgi_application()
+
+# В режиме вебхука обновления Telegram принимает этот процесс. Без WEBHOOK_URL
+# (только админка, бот работает через runbot) потоки бота не запускаются
+from django.conf import settings  # noqa: E402
+
+if settings.WEBHOOK_URL:
+    from main.bot_handlers import start_webhook_worker
+
+    start_webhook_worker()
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -16,10 +17,88 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 
 TOKENBOT = os.getenv('TOKENBOT')
 
+# Адрес Bot API в формате telebot ("http://host:port/bot{0}/{1}"), например
+# локальный сервер из команды loadtest; по умолчанию api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Telegram webhook: полный публичный URL вебхука и секрет для заголовка
+# X-Telegram-Bot-Api-Secret-Token (без секрета вебхук отклоняет все запросы)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+# Пул обработки обновлений: число потоков и максимальная длина очереди
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', 4))
+BOT_QUEUE_SIZE = int(os.getenv('BOT_QUEUE_SIZE', 1000))
+
+# Очередь исходящих сообщений: лимиты Telegram (~30 сообщений/с на бота,
+# ~1 сообщение/с в один чат), число потоков, длина очереди и число повторов
+OUTBOX_GLOBAL_RATE = float(os.getenv('OUTBOX_GLOBAL_RATE', 30))
+OUTBOX_CHAT_RATE = float(os.getenv('OUTBOX_CHAT_RATE', 1))
+OUTBOX_CHAT_BURST = int(os.getenv('OUTBOX_CHAT_BURST', 3))
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 4))
+OUTBOX_QUEUE_SIZE = int(os.getenv('OUTBOX_QUEUE_SIZE', 5000))
+OUTBOX_MAX_RETRIES = int(os.getenv('OUTBOX_MAX_RETRIES', 3))
+
+# Навигация по меню правкой нажатого сообщения вместо удаления и новой отправки
+BOT_EDIT_IN_PLACE = os.getenv('BOT_EDIT_IN_PLACE', 'true').lower() in ('1', 'true', 'yes')
+
+# Напоминания участникам: за сколько минут до начала (через запятую), размер
+# пачки участников, скорость рассылки (сообщений/с, меньше OUTBOX_GLOBAL_RATE,
+# чтобы оставалось место для ответов) и период проверки в секундах.
+# REMINDERS_ENABLED=false отключает поток в процессе бота (см. команду sendreminders)
+REMINDERS_ENABLED = os.getenv('REMINDERS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+REMINDER_OFFSETS = [int(offset) for offset in os.getenv('REMINDER_OFFSETS', '1440,60').split(',') if offset]
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', 200))
+REMINDER_RATE = float(os.getenv('REMINDER_RATE', 20))
+REMINDER_POLL_INTERVAL = float(os.getenv('REMINDER_POLL_INTERVAL', 60))
+
+# Хранилище состояний диалога: 'memory' (LRU/TTL в процессе) или 'cache'
+# (кэш Django BOT_STATE_CACHE_ALIAS, общий для нескольких процессов бота)
+BOT_STATE_BACKEND = os.getenv('BOT_STATE_BACKEND', 'memory')
+BOT_STATE_CACHE_ALIAS = os.getenv('BOT_STATE_CACHE_ALIAS', 'shared')
+BOT_STATE_MAX_USERS = int(os.getenv('BOT_STATE_MAX_USERS', 10000))
+
+# Как часто (в секундах) процесс бота перечитывает поколения кэша,
+# которые увеличивает админка при изменении мероприятий
+CACHE_BUS_POLL_INTERVAL = float(os.getenv('CACHE_BUS_POLL_INTERVAL', 1.0))
+
+# Метрики Prometheus: в режиме вебхука - /metrics/ Django-процесса, для runbot -
+# отдельный порт METRICS_PORT (0 - не запускать) на METRICS_HOST. /metrics/
+# требует заголовок Authorization: Bearer <METRICS_TOKEN>; без METRICS_TOKEN
+# он отключён (404)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Число мероприятий на странице списков в боте
+EVENTS_PAGE_SIZE = int(os.getenv('EVENTS_PAGE_SIZE', 10))
+
+# Поиск мероприятий (FTS5): сколько последних совпадений ранжировать по bm25
+SEARCH_MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', 1000))
+
+# Inline-режим (@бот запрос): сколько секунд запоминать выдачу по запросу (и
+# столько же её кэширует Telegram), результатов на странице (не больше 50)
+# и всего результатов на запрос
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', 60))
+INLINE_PAGE_SIZE = int(os.getenv('INLINE_PAGE_SIZE', 20))
+INLINE_MAX_RESULTS = int(os.getenv('INLINE_MAX_RESULTS', 200))
+
+# Размер пачки bulk_create при импорте мероприятий из CSV
+CSV_IMPORT_BATCH_SIZE = int(os.getenv('CSV_IMPORT_BATCH_SIZE', 1000))
+
+# Списки админки: сколько секунд кэшировать число строк (COUNT(*) по
+# миллионам записей) и с какого размера таблицы PostgreSQL показывать
+# оценку планировщика вместо точного числа
+ADMIN_COUNT_CACHE_SECONDS = int(os.getenv('ADMIN_COUNT_CACHE_SECONDS', 60))
+ADMIN_ESTIMATED_COUNT_MIN = int(os.getenv('ADMIN_ESTIMATED_COUNT_MIN', 100000))
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# DEBUG=false - для продакшена (вместе с ALLOWED_HOSTS). В режиме DEBUG Django
+# запоминает выполненные SQL-запросы; процесс бота сбрасывает их после
+# каждого обновления (reset_queries в handle_update)
+DEBUG = os.getenv('DEBUG', 'true').lower() in ('1', 'true', 'yes')
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.getenv('ALLOWED_HOSTS', '').split(',') if host]
 
 
 # Application definition
@@ -70,12 +149,141 @@ WSGI_APPLICATION = 'event_bot.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# DB_ENGINE=sqlite (по умолчанию) или postgres (нужен пакет psycopg).
+# SQLite работает в режиме WAL: чтение не блокирует запись, а транзакции
+# начинаются с BEGIN IMMEDIATE (main.backends.sqlite3), поэтому бот и админка
+# пишут одновременно, ожидая друг друга не дольше SQLITE_BUSY_TIMEOUT мс.
+# Соединения постоянные (CONN_MAX_AGE); бот закрывает устаревшие и
+# сломанные соединения после каждого обновления, как Django - после запроса
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'event_bot'),
+            'USER': os.getenv('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            # Перед повторным использованием соединение проверяется
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'main.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            # Соединение с файлом не истекает (None): PRAGMA не выполняются заново
+            'CONN_MAX_AGE': None,
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join([
+                    'PRAGMA journal_mode=WAL',
+                    'PRAGMA synchronous=NORMAL',
+                    f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}',
+                    f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+                ]),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_ENGINE {DB_ENGINE!r} (expected 'sqlite' or 'postgres')")
+
+# Реплика для чтения в боте (main.routers.ReplicaRouter): чтение обработчиков
+# (поиск, карточки, списки пользователя) идёт с неё, записи, чтение после записи
+# и загрузка общих кэшей процесса (индекс мероприятий) - с основной БД. Пользователь,
+# который что-то записал, REPLICA_PIN_SECONDS секунд читает с основной БД
+# (окно должно быть больше отставания реплики). Для SQLite реплика - копия
+# файла, которую обновляет команда syncreplica; для PostgreSQL - хост реплики
+SQLITE_REPLICA_PATH = os.getenv('SQLITE_REPLICA_PATH')
+POSTGRES_REPLICA_HOST = os.getenv('POSTGRES_REPLICA_HOST')
+REPLICA_PIN_SECONDS = float(os.getenv('REPLICA_PIN_SECONDS', 10))
+
+if DB_ENGINE == 'sqlite' and SQLITE_REPLICA_PATH:
+    DATABASES['replica'] = {**DATABASES['default'], 'NAME': SQLITE_REPLICA_PATH, 'TEST': {'MIRROR': 'default'}}
+elif DB_ENGINE == 'postgres' and POSTGRES_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': POSTGRES_REPLICA_HOST,
+        'PORT': os.getenv('POSTGRES_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# 'shared' хранится в таблице SQLite и виден всем процессам
+# (таблица создаётся командой createcachetable)
 
-DATABASES = {
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'bot_shared_cache',
+    },
+}
+
+
+# Logging
+# https://docs.djangoproject.com/en/4.2/topics/logging/
+# Записи пишутся фоновым потоком (main.logs.BackgroundHandler). LOG_FORMAT=json -
+# одна JSON-строка на запись. Частые записи о состоянии пользователей
+# (логгер main.bot_handlers.state) проходят выборкой: доля LOG_STATE_SAMPLE_RATE
+# и не больше LOG_STATE_RATE_LIMIT записей в секунду
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+LOG_STATE_SAMPLE_RATE = float(os.getenv('LOG_STATE_SAMPLE_RATE', 0.01))
+LOG_STATE_RATE_LIMIT = float(os.getenv('LOG_STATE_RATE_LIMIT', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {
+            'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        },
+        'json': {
+            '()': 'main.logs.JsonFormatter',
+        },
+    },
+    'filters': {
+        'state_sampling': {
+            '()': 'main.logs.SamplingFilter',
+            'sample_rate': LOG_STATE_SAMPLE_RATE,
+            'per_second': LOG_STATE_RATE_LIMIT,
+        },
+    },
+    'handlers': {
+        'background': {
+            '()': 'main.logs.BackgroundHandler',
+            'formatter': LOG_FORMAT,
+            'max_queue': LOG_QUEUE_SIZE,
+        },
+    },
+    'loggers': {
+        'main.bot_handlers.state': {
+            'filters': ['state_sampling'],
+        },
+    },
+    'root': {
+        'handlers': ['background'],
+        'level': LOG_LEVEL,
+    },
 }
 
 
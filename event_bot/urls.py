@@ -17,6 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from main.views import telegram_webhook, metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('telegram/webhook/', telegram_webhook, name='telegram-webhook'),
+    path('metrics/', metrics, name='metrics'),
 ]
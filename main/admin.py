@@ -1,15 +1,65 @@
+import hashlib
+
 from django.contrib import admin
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from .models import User, Event, Attendance, TelegramChannel
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from main.bot_handlers import invalidate_event_cache
-import csv
-from django.http import HttpResponse, HttpResponseRedirect
+from main.bot_handlers import invalidate_event_cache, event_index, invalidate_user_cache, invalidate_channels_keyboard
+from main.importer import EventCSVImporter
+from main.attendance import recount_attendees
+from event_bot import settings
+from django.http import HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import path
 from django.contrib import messages
-from django.utils import timezone
-from datetime import datetime
+
+# Сколько ошибок/предупреждений импорта показывать в сообщениях админки
+MAX_IMPORT_MESSAGES = 20
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator списков админки без COUNT(*) на каждой странице.
+
+    Число строк кэшируется на ADMIN_COUNT_CACHE_SECONDS по SQL запроса
+    (у каждого фильтра и поиска свой ключ), поэтому после изменений оно
+    может отставать. Для таблицы PostgreSQL без фильтров, в которой больше
+    ADMIN_ESTIMATED_COUNT_MIN строк, берётся оценка планировщика.
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        try:
+            sql, params = query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        key = "admin_count:" + hashlib.md5(f"{sql}{params}".encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = None if query.where else self._estimated_count()
+            if count is None:
+                count = self.object_list.count()
+            cache.set(key, count, settings.ADMIN_COUNT_CACHE_SECONDS)
+        return count
+
+    def _estimated_count(self):
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [self.object_list.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < settings.ADMIN_ESTIMATED_COUNT_MIN:
+            return None
+        return row[0]
 
 
 @admin.register(User)
@@ -17,24 +67,54 @@ class UserAdmin(admin.ModelAdmin):
     list_display = ('telegram_id', 'username', 'is_admin', 'created_at')
     search_fields = ('telegram_id', 'username')
     list_filter = ('is_admin', 'created_at')
+    # Порядок для постраничного поиска в autocomplete_fields (по уникальному индексу)
+    ordering = ('telegram_id',)
+
 
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache_on_change(sender, instance, **kwargs):
+    invalidate_user_cache(instance.telegram_id, instance.pk)
+
+@receiver(post_save, sender=TelegramChannel)
+@receiver(post_delete, sender=TelegramChannel)
+def invalidate_channels_keyboard_on_change(sender, instance, **kwargs):
+    invalidate_channels_keyboard()
 
 @receiver(post_save, sender=Event)
 def invalidate_event_cache_on_save(sender, instance, **kwargs):
+    event_index.upsert(instance)
     invalidate_event_cache(instance.event_type, instance.category)
 
 @receiver(post_delete, sender=Event)
 def invalidate_event_cache_on_delete(sender, instance, **kwargs):
+    event_index.remove(instance.id)
     invalidate_event_cache(instance.event_type, instance.category)
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
-    list_display = ('name', 'event_type', 'category', 'date_time', 'location', 'is_private', 'channel')
+    list_display = ('name', 'event_type', 'category', 'date_time', 'location', 'is_private', 'channel', 'attendee_count', 'capacity')
+    list_select_related = ('channel',)
     search_fields = ('name', 'location', 'address')
-    list_filter = ('event_type', 'category', 'is_private', 'channel')
-    date_hierarchy = 'date_time'
+    # Фильтр по дате вместо date_hierarchy: та строит список месяцев
+    # SELECT DISTINCT по всей таблице - секунды на миллионе мероприятий
+    list_filter = ('event_type', 'category', 'is_private', 'channel', ('date_time', admin.DateFieldListFilter))
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ('attendee_count',)
     change_list_template = 'admin/events_change_list.html'
 
+    def save_model(self, request, obj, form, change):
+        if not change:
+            super().save_model(request, obj, form, change)
+            return
+        # Счётчик участников в форме загружен при открытии страницы и мог
+        # измениться с тех пор (записи через бота): его не перезаписываем
+        obj.save(update_fields=[
+            field.name for field in obj._meta.concrete_fields
+            if not field.primary_key and field.name != 'attendee_count'
+        ])
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
@@ -50,42 +130,22 @@ class EventAdmin(admin.ModelAdmin):
                 return HttpResponseRedirect("..")
             
             try:
-                csv_data = csv.reader(csv_file.read().decode('utf-8').splitlines())
-                next(csv_data)  # Skip header row
-                
-                for row in csv_data:
-                    if len(row) >= 9:  # Ensure we have all required fields
-                        try:
-                            date_time = datetime.strptime(row[5], '%Y-%m-%d %H:%M:%S')
-                            is_private = row[8].lower() == 'true' if len(row) > 8 else False
-                            
-                            # Get channel if event is private and channel name is provided
-                            channel = None
-                            if is_private and len(row) > 9 and row[9].strip():
-                                try:
-                                    channel = TelegramChannel.objects.get(name=row[9].strip())
-                                except TelegramChannel.DoesNotExist:
-                                    messages.warning(request, f"Channel '{row[9]}' not found for event '{row[0]}'. Event will be created without channel.")
-                            
-                            Event.objects.create(
-                                name=row[0],
-                                location=row[1],
-                                address=row[2],
-                                event_type=row[3],
-                                category=row[4],
-                                date_time=date_time,
-                                details=row[6] if len(row) > 6 else None,
-                                link_2gis=row[7] if len(row) > 7 else None,
-                                is_private=is_private,
-                                channel=channel
-                            )
-                        except Exception as e:
-                            messages.error(request, f"Error importing row: {row}. Error: {str(e)}")
-                            continue
-                
-                messages.success(request, "Events imported successfully")
+                result = EventCSVImporter(batch_size=settings.CSV_IMPORT_BATCH_SIZE).run(csv_file)
             except Exception as e:
                 messages.error(request, f"Error processing CSV file: {str(e)}")
+                return HttpResponseRedirect("..")
+
+            for warning in result.warnings[:MAX_IMPORT_MESSAGES]:
+                messages.warning(request, warning)
+            for error in result.errors[:MAX_IMPORT_MESSAGES]:
+                messages.error(request, f"Error importing {error}")
+            if len(result.errors) > MAX_IMPORT_MESSAGES:
+                messages.error(request, f"... and {len(result.errors) - MAX_IMPORT_MESSAGES} more rows with errors")
+            messages.success(
+                request,
+                f"Imported {result.created} of {result.rows} events in {result.elapsed:.1f}s "
+                f"({result.rows_per_second:.0f} rows/s)"
+            )
             
             return HttpResponseRedirect("..")
         
@@ -95,8 +155,29 @@ class EventAdmin(admin.ModelAdmin):
 @admin.register(Attendance)
 class AttendanceAdmin(admin.ModelAdmin):
     list_display = ('user', 'event', 'status', 'created_at')
+    list_select_related = ('user', 'event')
     search_fields = ('user__telegram_id', 'user__username', 'event__name')
     list_filter = ('status', 'created_at')
+    # Поиск вместо <select> со всеми пользователями и мероприятиями
+    autocomplete_fields = ('user', 'event')
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+    # Записи из админки не проверяют число мест, но счётчики участников
+    # затронутых мероприятий пересчитываются
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        event_ids = {obj.event_id, form.initial.get('event')} if change else {obj.event_id}
+        recount_attendees(Event.objects.filter(id__in=event_ids))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recount_attendees(Event.objects.filter(id=obj.event_id))
+
+    def delete_queryset(self, request, queryset):
+        event_ids = set(queryset.values_list('event_id', flat=True))
+        super().delete_queryset(request, queryset)
+        recount_attendees(Event.objects.filter(id__in=event_ids))
 
 
 @admin.register(TelegramChannel)
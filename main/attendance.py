@@ -0,0 +1,71 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from main.models import Event, Attendance
+
+
+class EventFull(Exception):
+    """На мероприятии не осталось мест"""
+
+    def __init__(self, event):
+        super().__init__(f"Event {event.id} is full ({event.attendee_count}/{event.capacity})")
+        self.event = event
+
+
+def join_event(user_pk, event_id):
+    """Запись на мероприятие: (мероприятие со свежим счётчиком, записан ли только что).
+
+    Место занимается одним UPDATE ... SET attendee_count = attendee_count + 1
+    WHERE attendee_count < capacity: проверка и увеличение не разделены,
+    поэтому одновременные нажатия не превышают capacity. Attendance создаётся
+    в той же транзакции; если пользователь уже записан, она откатывается
+    вместе с увеличением счётчика.
+    EventFull, если мест нет; Event.DoesNotExist, если мероприятия нет.
+    """
+    try:
+        with transaction.atomic():
+            taken = Event.objects.filter(
+                Q(capacity__isnull=True) | Q(attendee_count__lt=F("capacity")),
+                id=event_id
+            ).update(attendee_count=F("attendee_count") + 1)
+            if not taken:
+                event = Event.objects.get(id=event_id)
+                if Attendance.objects.filter(user_id=user_pk, event_id=event_id).exists():
+                    return event, False
+                raise EventFull(event)
+            Attendance.objects.create(user_id=user_pk, event_id=event_id, status="going")
+            return Event.objects.get(id=event_id), True
+    except IntegrityError:
+        # Уже записан (unique_together user, event)
+        return Event.objects.get(id=event_id), False
+
+
+def leave_event(user_pk, event_id):
+    """Отмена участия с освобождением места; False, если пользователь не был записан"""
+    with transaction.atomic():
+        deleted, _ = Attendance.objects.filter(user_id=user_pk, event_id=event_id).delete()
+        if deleted:
+            Event.objects.filter(id=event_id, attendee_count__gt=0).update(attendee_count=F("attendee_count") - 1)
+    return bool(deleted)
+
+
+def actual_attendee_count():
+    """Выражение: число участников мероприятия по таблице Attendance"""
+    going = Attendance.objects.filter(
+        event=OuterRef("pk"),
+        status="going"
+    ).order_by().values("event").annotate(count=Count("pk")).values("count")
+    return Coalesce(Subquery(going), 0)
+
+
+def recount_attendees(events=None):
+    """Пересчёт счётчиков участников одним UPDATE; число исправленных мероприятий.
+
+    events - queryset мероприятий (по умолчанию все). Меняются только
+    разошедшиеся счётчики, подзапрос идёт по индексу (event, status, id).
+    """
+    if events is None:
+        events = Event.objects.all()
+    actual = actual_attendee_count()
+    return events.exclude(attendee_count=actual).update(attendee_count=actual)
@@ -0,0 +1,36 @@
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite с командами инициализации соединения и режимом транзакций.
+
+    Настройки в OPTIONS (как в Django 5.1, где они появились в стандартном бэкенде):
+    init_command - команды через ";", выполняемые на каждом новом соединении
+    (PRAGMA журнала, синхронизации, mmap, ожидания блокировки);
+    transaction_mode - как начинается transaction.atomic(). При IMMEDIATE
+    блокировка записи берётся в начале транзакции, и пишущие процессы
+    (бот и админка) ждут друг друга busy_timeout, а не получают
+    "database is locked" при попытке записать после чтения.
+    """
+    init_command = None
+    transaction_mode = 'DEFERRED'
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.init_command = params.pop('init_command', None)
+        self.transaction_mode = (params.pop('transaction_mode', None) or 'DEFERRED').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ValueError(f"Unsupported SQLite transaction_mode {self.transaction_mode!r}")
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for command in (self.init_command or '').split(';'):
+            if command.strip():
+                conn.execute(command)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
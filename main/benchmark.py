@@ -0,0 +1,184 @@
+import itertools
+import json
+import random
+import threading
+from datetime import timedelta
+
+from django.utils import timezone
+from telebot import apihelper
+from telebot.types import Message, CallbackQuery, InlineQuery
+
+from main.models import User, Event, Attendance, TelegramChannel
+from main.attendance import recount_attendees
+
+# Ответ на ошибку в handle_error - по нему бенчмарк замечает упавший обработчик
+ERROR_TEXT = "Произошла ошибка"
+
+
+class _Response:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.text = json.dumps(payload)
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class StubBotAPI:
+    """Подмена Telegram Bot API внутри процесса (через CUSTOM_REQUEST_SENDER).
+
+    Отвечает успехом на любой метод и запоминает вызовы.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1000)
+        self._previous_sender = None
+
+    def __enter__(self):
+        self._previous_sender = apihelper.CUSTOM_REQUEST_SENDER
+        apihelper.CUSTOM_REQUEST_SENDER = self.send
+        return self
+
+    def __exit__(self, *exc_info):
+        apihelper.CUSTOM_REQUEST_SENDER = self._previous_sender
+
+    def send(self, method, url, params=None, files=None, **kwargs):
+        method_name = url.rsplit("/", 1)[-1]
+        params = dict(params or {})
+        with self._lock:
+            self.calls.append((method_name, params))
+        if method_name in ("sendMessage", "editMessageText"):
+            return _Response({"ok": True, "result": {
+                "message_id": next(self._message_ids),
+                "date": 0,
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            }})
+        return _Response({"ok": True, "result": True})
+
+    def reset(self):
+        with self._lock:
+            calls, self.calls = self.calls, []
+        return calls
+
+    def texts(self, calls):
+        """Тексты отправленных сообщений и ответов на inline-запросы"""
+        return [str(params.get("text") or params.get("results") or "") for method, params in calls]
+
+    def errors(self, calls):
+        return [params.get("text") for method, params in calls if ERROR_TEXT in str(params.get("text", ""))]
+
+
+_ids = itertools.count(1)
+
+
+def _user_payload(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"}
+
+
+def make_message(text, user_id):
+    """Синтетическое входящее сообщение"""
+    return Message.de_json({
+        "message_id": next(_ids),
+        "date": 0,
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user_payload(user_id),
+        "text": text,
+    })
+
+
+def make_callback(data, user_id):
+    """Синтетическое нажатие inline-кнопки"""
+    return CallbackQuery.de_json({
+        "id": str(next(_ids)),
+        "chat_instance": "bench",
+        "data": data,
+        "from": _user_payload(user_id),
+        "message": {
+            "message_id": next(_ids),
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Bot"},
+            "text": "",
+        },
+    })
+
+
+def make_inline_query(query, user_id, offset=""):
+    """Синтетический inline-запрос"""
+    return InlineQuery.de_json({
+        "id": str(next(_ids)),
+        "from": _user_payload(user_id),
+        "query": query,
+        "offset": offset,
+    })
+
+
+def create_dataset(size, telegram_id, attending_share=0.1, min_per_list=0):
+    """Заполнение БД: size мероприятий по всем типам и категориям, канал и записи пользователя.
+
+    min_per_list - не меньше стольких публичных мероприятий в каждом списке
+    (тип, категория): на малых размерах недостающие добавляются в конец.
+    """
+    Attendance.objects.all().delete()
+    Event.objects.all().delete()
+    TelegramChannel.objects.all().delete()
+    User.objects.all().delete()
+
+    user = User.objects.create(telegram_id=str(telegram_id), username=f"bench{telegram_id}")
+    channel = TelegramChannel.objects.create(channel_id="bench", name="Bench")
+    combinations = [
+        (event_type, category)
+        for event_type, _ in Event.EVENT_TYPE_CHOICES
+        for category, _ in Event.CATEGORY_CHOICES
+    ]
+    start = timezone.now() + timedelta(days=1)
+    events = []
+    for i in range(size):
+        event_type, category = combinations[i % len(combinations)]
+        is_private = i % 5 == 0
+        events.append(Event(
+            name=f"Event {i}",
+            location="Location",
+            address="Address",
+            event_type=event_type,
+            category=category,
+            date_time=start + timedelta(minutes=i),
+            details="Details",
+            is_private=is_private,
+            channel=channel if is_private else None,
+        ))
+    public = {combination: 0 for combination in combinations}
+    for event in events:
+        if not event.is_private:
+            public[(event.event_type, event.category)] += 1
+    for (event_type, category), count in public.items():
+        for _ in range(min_per_list - count):
+            i = len(events)
+            events.append(Event(
+                name=f"Event {i}",
+                location="Location",
+                address="Address",
+                event_type=event_type,
+                category=category,
+                date_time=start + timedelta(minutes=i),
+                details="Details",
+            ))
+    Event.objects.bulk_create(events, batch_size=1000)
+    event_ids = list(Event.objects.order_by("id").values_list("id", flat=True))
+    attending = int(len(event_ids) * attending_share)
+    if attending:
+        # Случайная (но воспроизводимая) выборка: каждое step-е мероприятие
+        # совпадает с чередованием типов, категорий и приватных, и целые
+        # списки оказались бы скрыты как уже выбранные
+        Attendance.objects.bulk_create(
+            [Attendance(user=user, event_id=event_id, status="going")
+             for event_id in random.Random(size).sample(event_ids, attending)],
+            batch_size=1000
+        )
+        recount_attendees()
+    return user, channel
@@ -1,10 +1,10 @@
 import telebot
 import logging
+from telebot import apihelper
 from django.core.management.base import BaseCommand
-from telebot.types import Message, CallbackQuery
-from main.models import User, Event, Attendance, TelegramChannel
+from telebot.types import Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from main.models import Event, Attendance, TelegramChannel
 from event_bot import settings
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from main.keyboards import (
     main_menu_keyboard,
     category_keyboard,
@@ -13,191 +13,538 @@ from main.keyboards import (
     my_events_keyboard,
     my_events_category_keyboard,
     my_event_actions_keyboard,
-    private_channels_keyboard
+    events_page_keyboard,
+    categories_keyboard,
+    private_types_keyboard,
+    private_categories_keyboard,
+    search_page_keyboard,
+    ChannelsKeyboard
 )
-from datetime import datetime, timedelta
 import calendar
-from django.db import transaction
+import html
+from django.db import transaction, close_old_connections, reset_queries
+from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.cache import cache
 import threading
 import time
-from functools import lru_cache
+from functools import lru_cache, wraps
 from django.db.models import Q
+from main.dispatch import UpdateDispatcher, LANE_PRIORITY, LANE_DEFAULT
+from main.state import LastMessageStore, create_state_store
+from main.invalidation import InvalidationBus
+from main.cache_namespaces import CacheNamespace
+from main.pagination import fetch_page, encode_cursor, PAGE_NEXT
+from main.outbox import Outbox
+from main.reminders import ReminderScheduler
+from main.event_index import EventIndex, pair_name
+from main.users import UserResolver
+from main.metrics import REGISTRY, cache_lookup, instrumented, start_metrics_server
+from main import callbacks
+from main.callbacks import CallbackRouter
+from main.search import MIN_QUERY_LENGTH, search_events
+from main.inline import InlineResults
+from main.attendance import EventFull, join_event, leave_event
+from main.routers import replica_reads, use_primary
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Логирование настраивается в settings.LOGGING (фоновая запись, выборка частых записей)
 logger = logging.getLogger(__name__)
-bot = telebot.TeleBot(settings.TOKENBOT, parse_mode="HTML")
+# Записи о каждом чтении и изменении состояния пользователя (проходят выборкой)
+state_logger = logging.getLogger(f"{__name__}.state")
+
+
+def update_user_id(update):
+    """Пользователь, от которого пришло обновление (None, если неизвестен)"""
+    for item in (update.message, update.callback_query, update.inline_query):
+        if item is not None and item.from_user is not None:
+            return item.from_user.id
+    return None
+
+
+class DispatchingTeleBot(telebot.TeleBot):
+    """TeleBot, передающий обновления в пул UpdateDispatcher"""
+    dispatcher = None
+
+    def process_new_updates(self, updates):
+        if self.dispatcher is None:
+            return super().process_new_updates(updates)
+        for update in updates:
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            self.dispatcher.submit(update)
+
+    def handle_update(self, update):
+        """Обработка одного обновления в рабочем потоке диспетчера"""
+        # Как вокруг HTTP-запроса в Django: журнал запросов не копится, а
+        # соединение с ошибкой или старше CONN_MAX_AGE переоткрывается
+        reset_queries()
+        close_old_connections()
+        try:
+            # Просмотр - с реплики (если она настроена), см. main.routers
+            with replica_reads(update_user_id(update)):
+                super().process_new_updates([update])
+        finally:
+            close_old_connections()
+
+    def add_message_handler(self, handler_dict):
+        super().add_message_handler(self._instrumented(handler_dict))
+
+    def add_callback_query_handler(self, handler_dict):
+        super().add_callback_query_handler(self._instrumented(handler_dict))
+
+    def add_inline_handler(self, handler_dict):
+        super().add_inline_handler(self._instrumented(handler_dict))
+
+    def process_new_callback_query(self, new_callback_queries):
+        # Нажатия маршрутизируются по типу кнопки, без перебора предикатов telebot
+        for call in new_callback_queries:
+            if not callback_router.dispatch(call):
+                logger.warning("Unknown callback data %r from user %s", call.data, call.from_user.id)
+                chat_id = call.message.chat.id if call.message else call.from_user.id
+                outbox.answer_callback(chat_id, call.id)
+
+    @staticmethod
+    def _instrumented(handler_dict):
+        """Обработчик с учётом времени, SQL-запросов и исключений в метриках"""
+        return dict(handler_dict, function=instrumented(handler_dict["function"]))
+
+
+if settings.TELEGRAM_API_URL:
+    apihelper.API_URL = settings.TELEGRAM_API_URL
+
+# Обработчики выполняются в потоках диспетчера, поэтому собственный пул telebot не нужен
+bot = DispatchingTeleBot(settings.TOKENBOT, parse_mode="HTML", threaded=False)
 
-# Глобальный словарь для хранения состояний пользователей
-user_selection = {}
 # Время жизни состояния пользователя (в секундах)
 STATE_LIFETIME = 3600  # 1 час
+# Хранилище состояний пользователей (в памяти процесса или в общем кэше)
+state_store = create_state_store(
+    settings.BOT_STATE_BACKEND,
+    STATE_LIFETIME,
+    max_size=settings.BOT_STATE_MAX_USERS,
+    cache_alias=settings.BOT_STATE_CACHE_ALIAS
+)
+# id последнего меню чата: тот же бэкенд, что у состояний, но свой объём,
+# чтобы записи меню не вытесняли состояния пользователей
+last_message_store = create_state_store(
+    settings.BOT_STATE_BACKEND,
+    STATE_LIFETIME,
+    max_size=settings.BOT_STATE_MAX_USERS,
+    cache_alias=settings.BOT_STATE_CACHE_ALIAS
+)
+# Исходящие сообщения уходят через очередь с учётом лимитов Telegram
+outbox = Outbox(
+    bot,
+    global_rate=settings.OUTBOX_GLOBAL_RATE,
+    chat_rate=settings.OUTBOX_CHAT_RATE,
+    chat_burst=settings.OUTBOX_CHAT_BURST,
+    num_workers=settings.OUTBOX_WORKERS,
+    max_queue=settings.OUTBOX_QUEUE_SIZE,
+    max_retries=settings.OUTBOX_MAX_RETRIES,
+    max_chats=settings.BOT_STATE_MAX_USERS,
+    last_messages=LastMessageStore(last_message_store)
+)
+
+# Напоминания участникам перед началом мероприятий (через ту же очередь исходящих)
+reminder_scheduler = ReminderScheduler(
+    outbox,
+    offsets=settings.REMINDER_OFFSETS,
+    batch_size=settings.REMINDER_BATCH_SIZE,
+    rate=settings.REMINDER_RATE,
+    poll_interval=settings.REMINDER_POLL_INTERVAL
+)
+
+# Нажатое сообщение текущего обработчика (редактируется вместо удаления и новой отправки)
+_navigation = threading.local()
+
+# Обработчики нажатий по типу кнопки (main.callbacks)
+callback_router = CallbackRouter()
+
+# Действия, которые обрабатываются раньше просмотра списков
+# (для кнопок - флаг priority типа кнопки)
+PRIORITY_COMMANDS = ("/start",)
+
+# Число мероприятий на одной странице списка
+PAGE_SIZE = settings.EVENTS_PAGE_SIZE
+# Результатов на странице inline-выдачи (лимит Telegram - 50)
+INLINE_PAGE_SIZE = min(settings.INLINE_PAGE_SIZE, 50)
 # Время жизни кэша (в секундах)
 CACHE_LIFETIME = 300  # 5 минут
+# Поколения кэша, общие для процессов админки и бота
+invalidation_bus = InvalidationBus(settings.CACHE_BUS_POLL_INTERVAL)
+# Пространство имён кэша мероприятий пользователей: сброс корня инвалидирует все вложенные списки
+user_events_namespace = CacheNamespace("user_events", bus=invalidation_bus, timeout=CACHE_LIFETIME)
+# telegram_id -> pk пользователя без запроса к БД на каждое нажатие
+user_resolver = UserResolver(max_size=settings.BOT_STATE_MAX_USERS, bus=invalidation_bus)
+# Предстоящие мероприятия в памяти процесса: просмотр списков без запросов к БД
+event_index = EventIndex(bus=invalidation_bus)
+# Клавиатура приватных каналов (сбрасывается при изменении TelegramChannel)
+channels_keyboard = ChannelsKeyboard(bus=invalidation_bus)
+# Выдача inline-запросов, запомненная по запросу до изменения мероприятий
+inline_results = InlineResults(
+    event_index,
+    ttl=settings.INLINE_CACHE_TIME,
+    max_results=settings.INLINE_MAX_RESULTS,
+    max_candidates=settings.SEARCH_MAX_CANDIDATES
+)
 
-@lru_cache(maxsize=100)
-def get_event_cache_key(event_type, category):
-    """Генерация ключа кэша для мероприятий"""
-    return f"events_{event_type}_{category}"
-
-def get_cached_events(event_type, category):
-    """Получение мероприятий из кэша или базы данных"""
-    cache_key = get_event_cache_key(event_type, category)
-    events = cache.get(cache_key)
-    
-    if events is None:
-        events = list(Event.objects.filter(
-            event_type=event_type,
-            category=category,
-            date_time__gte=datetime.now()
-        ).order_by("date_time"))
-        cache.set(cache_key, events, CACHE_LIFETIME)
-        logger.info(f"Updated cache for {event_type} {category}")
-    
-    return events
+# Состояние очередей и кэшей в /metrics (читается при запросе метрик)
+REGISTRY.register_stats(
+    "bot_dispatcher",
+    lambda: bot.dispatcher.stats() if bot.dispatcher is not None else {},
+    "Update dispatcher counters",
+    label="lane"
+)
+REGISTRY.register_stats("bot_outbox", outbox.stats, "Outbound message queue counters")
+REGISTRY.register_stats("bot_user_states", state_store.size, "Stored user dialog states")
+REGISTRY.register_stats("bot_last_messages", last_message_store.size, "Stored last menu message ids")
+REGISTRY.register_stats("bot_user_resolver_entries", user_resolver.size, "Cached telegram_id -> pk entries")
+REGISTRY.register_stats("bot_event_index_events", event_index.size, "Upcoming events held in the index")
+REGISTRY.register_stats("bot_inline_results_entries", inline_results.size, "Memoized inline query results")
 
 def invalidate_event_cache(event_type=None, category=None):
-    """Инвалидация кэша мероприятий"""
+    """Перезагрузка мероприятий в индексе (во всех процессах через шину): пары или всего индекса"""
     if event_type and category:
-        cache_key = get_event_cache_key(event_type, category)
-        cache.delete(cache_key)
+        invalidation_bus.publish(pair_name(event_type, category))
     else:
-        # Очистка всего кэша мероприятий
-        for event_type in Event.EVENT_TYPE_CHOICES:
-            for category in Event.CATEGORY_CHOICES:
-                cache_key = get_event_cache_key(event_type[0], category[0])
-                cache.delete(cache_key)
+        invalidation_bus.publish(event_index.root_name)
     logger.info("Event cache invalidated")
 
-@lru_cache(maxsize=100)
-def get_user_events_cache_key(user_id, status):
-    """Генерация ключа кэша для мероприятий пользователя"""
-    return f"user_events_{user_id}_{status}"
+def invalidate_channels_keyboard():
+    """Сброс клавиатуры приватных каналов (во всех процессах через шину)"""
+    channels_keyboard.invalidate()
+    invalidation_bus.publish(channels_keyboard.name)
+
+def invalidate_user_cache(telegram_id=None, pk=None):
+    """Сброс кэша telegram_id -> pk (во всех процессах через шину)"""
+    user_resolver.invalidate(telegram_id, pk)
+    invalidation_bus.publish(user_resolver.name)
+
+@lru_cache(maxsize=1000)
+def get_user_events_namespace(user_id):
+    """Пространство имён кэша мероприятий пользователя"""
+    return CacheNamespace(f"user_events_{user_id}", parent=user_events_namespace, timeout=CACHE_LIFETIME)
 
 def get_cached_user_events(user_id, status):
     """Получение мероприятий пользователя из кэша или базы данных"""
-    cache_key = get_user_events_cache_key(user_id, status)
-    events = cache.get(cache_key)
+    namespace = get_user_events_namespace(str(user_id))
+    events = namespace.get(status)
+    cache_lookup("user_events", events is not None)
     
     if events is None:
         events = list(Event.objects.filter(
             attendance__user__telegram_id=str(user_id),
             attendance__status=status,
-            date_time__gte=datetime.now()
+            date_time__gte=timezone.now()
         ).order_by("date_time"))
-        cache.set(cache_key, events, CACHE_LIFETIME)
-        logger.info(f"Updated user events cache for {user_id} {status}")
+        namespace.set(status, events)
+        logger.info("Updated user events cache for %s %s", user_id, status)
     
     return events
 
 def invalidate_user_events_cache(user_id=None, status=None):
     """Инвалидация кэша мероприятий пользователя"""
     if user_id and status:
-        cache_key = get_user_events_cache_key(user_id, status)
-        cache.delete(cache_key)
+        get_user_events_namespace(str(user_id)).delete(status)
     else:
         # Очистка всего кэша мероприятий пользователей
-        for user in User.objects.all():
-            for status in ['going', 'maybe']:
-                cache_key = get_user_events_cache_key(user.telegram_id, status)
-                cache.delete(cache_key)
+        user_events_namespace.invalidate()
     logger.info("User events cache invalidated")
 
 def cleanup_old_states():
     """Очистка устаревших состояний пользователей"""
-    current_time = time.time()
-    expired_users = [
-        user_id for user_id, state in user_selection.items()
-        if current_time - state.get('timestamp', 0) > STATE_LIFETIME
-    ]
-    for user_id in expired_users:
-        del user_selection[user_id]
-        logger.info(f"Cleaned up state for user {user_id}")
+    expired = state_store.cleanup()
+    if expired:
+        logger.info("Cleaned up %s expired user states", expired)
+    expired = last_message_store.cleanup()
+    if expired:
+        logger.info("Cleaned up %s expired last message ids", expired)
 
 def update_user_state(user_id, data):
     """Обновление состояния пользователя"""
-    user_selection[user_id] = {
-        **data,
-        'timestamp': time.time()
-    }
-    logger.info(f"Updated user {user_id} state: {data}")
+    state_store.set(user_id, data)
+    # Копия: запись форматируется позже, в потоке записи логов
+    state_logger.info("Updated user %s state: %s", user_id, dict(data))
 
 def get_user_state(user_id):
     """Получение состояния пользователя"""
-    state = user_selection.get(user_id)
-    if state and time.time() - state.get('timestamp', 0) > STATE_LIFETIME:
-        del user_selection[user_id]
-        return None
-    logger.info(f"Retrieved user {user_id} state: {state}")
+    state = state_store.get(user_id)
+    state_logger.info("Retrieved user %s state: %s", user_id, dict(state) if state else state)
     return state
 
+def user_pk(telegram_id):
+    """pk зарегистрированного пользователя по telegram_id (User.DoesNotExist, если его нет)"""
+    return user_resolver.resolve(telegram_id).pk
+
+def attending_event_ids(user_id):
+    """id мероприятий, на которые записан пользователь (только id, без загрузки мероприятий)"""
+    return set(Attendance.objects.filter(
+        user_id=user_pk(user_id),
+        status="going"
+    ).values_list("event_id", flat=True))
+
+def event_ids(events):
+    """Компактное представление списка мероприятий для хранения в состоянии"""
+    return tuple(event.id for event in events)
+
+def load_events(ids):
+    """Загрузка мероприятий по id с сохранением порядка"""
+    events = Event.objects.in_bulk(ids)
+    return [events[event_id] for event_id in ids if event_id in events]
+
 def start_cleanup_thread():
     """Запуск потока для периодической очистки состояний"""
     def cleanup_loop():
         while True:
-            cleanup_old_states()
+            try:
+                cleanup_old_states()
+                event_index.sweep()
+            finally:
+                close_old_connections()
             time.sleep(300)  # Проверка каждые 5 минут
 
     thread = threading.Thread(target=cleanup_loop, daemon=True)
     thread.start()
     return thread
 
+def listing_queryset(listing, user_pk):
+    """Запрос мероприятий для списка, описанного в состоянии пользователя"""
+    if listing["kind"] == "my":
+        return Event.objects.filter(
+            attendance__user_id=user_pk,
+            attendance__status="going",
+            category=listing["category"],
+            date_time__gte=timezone.now()
+        )
+    # Исключаем мероприятия, на которые пользователь уже записан
+    attending_events = Attendance.objects.filter(
+        user_id=user_pk,
+        status="going"
+    ).values_list('event_id', flat=True)
+    events = Event.objects.filter(
+        event_type=listing["event_type"],
+        category=listing["category"],
+        date_time__gte=timezone.now()
+    )
+    if listing["kind"] == "private":
+        events = events.filter(channel_id=listing["channel_id"], is_private=True)
+    return events.exclude(id__in=attending_events)
+
+def format_events_page(listing, events, offset):
+    """Текст страницы списка мероприятий (нумерация продолжается между страницами)"""
+    category = dict(Event.CATEGORY_CHOICES).get(listing.get("category"), listing.get("category"))
+    if listing["kind"] == "private":
+        event_type = dict(Event.EVENT_TYPE_CHOICES).get(listing["event_type"], listing["event_type"])
+        text = f"Мероприятия канала {listing['channel_name']} ({event_type}, {category}):\n\n"
+        for i, event in enumerate(events, offset + 1):
+            weekday = calendar.day_name[event.date_time.weekday()]
+            ru_day = {'Saturday': 'Сб', 'Sunday': 'Вс'}.get(weekday, '')
+            date_str = event.date_time.strftime('%d.%m (%H:%M)')
+            date_str += f" <b>{ru_day}</b>" if ru_day else ''
+            text += f"{i}. {date_str} - {event.name}\n"
+        text += "\nНапиши номер мероприятия, чтобы получить подробности."
+        return text
+
+    if listing["kind"] == "my":
+        text = f"Ваши мероприятия в категории {category}:\n\n"
+    elif listing["kind"] == "search":
+        text = f"Найдено по запросу «{listing['query']}»:\n\n"
+    else:
+        text = f"Доступные {listing['category']} мероприятия ({listing['event_type']}):\n\n"
+    for i, event in enumerate(events, offset + 1):
+        text += f"{i}. {event.name}\n"
+        text += f"   📅 {event.date_time.strftime('%d.%m.%Y %H:%M')}\n"
+        text += f"   📍 {event.location}\n"
+        if event.address:
+            text += f"   🏠 {event.address}\n"
+        if event.link_2gis:
+            text += f"   🗺️ {event.link_2gis}\n"
+        text += "\n"
+    return text
+
+def send_events_page(chat_id, user_id, listing, cursor=None, direction=PAGE_NEXT, offset=0):
+    """Отправка страницы списка мероприятий; False, если страница пуста"""
+    if listing["kind"] == "my":
+        events, has_prev, has_next = fetch_page(listing_queryset(listing, user_pk(user_id)), cursor, direction, PAGE_SIZE)
+    else:
+        events, has_prev, has_next = event_index.page(
+            listing, cursor, direction, PAGE_SIZE, exclude=attending_event_ids(user_id)
+        )
+    if not events:
+        return False
+    state = get_user_state(user_id) or {}
+    state["listing"] = listing
+    state["events"] = event_ids(events)
+    state["page_offset"] = offset
+    state["is_private"] = listing["kind"] == "private"
+    update_user_state(user_id, state)
+    send_and_store_message(
+        chat_id,
+        user_id,
+        format_events_page(listing, events, offset),
+        reply_markup=events_page_keyboard(
+            encode_cursor(events[0]) if has_prev else None,
+            encode_cursor(events[-1]) if has_next else None
+        )
+    )
+    return True
+
+def format_event_details(event):
+    """Карточка мероприятия (HTML)"""
+    text = f"<b>{html.escape(event.name)}</b>\n"
+    text += f"📍 {html.escape(event.location)}, {html.escape(event.address)}\n"
+    text += f"📅 {event.date_time.strftime('%d.%m.%Y %H:%M')}\n"
+    if event.details:
+        text += f"📝 {html.escape(event.details)}\n"
+    if event.link_2gis:
+        text += f"🔗 <a href='{html.escape(event.link_2gis)}'>Ссылка на 2ГИС</a>"
+    return text
+
+def format_seats(event):
+    """Строка о местах из счётчика мероприятия (без подсчёта участников); пустая без ограничения"""
+    if event.capacity is None:
+        return ""
+    text = f"👥 {event.attendee_count}/{event.capacity}"
+    if event.is_full:
+        text += " - мест нет"
+    return text
+
+def event_article(event):
+    """Результат inline-запроса: карточка мероприятия"""
+    return InlineQueryResultArticle(
+        id=str(event.id),
+        title=event.name,
+        description=f"📅 {event.date_time.strftime('%d.%m.%Y %H:%M')} 📍 {event.location}",
+        input_message_content=InputTextMessageContent(format_event_details(event), parse_mode="HTML")
+    )
+
+def send_search_page(chat_id, user_id, query, offset=0):
+    """Отправка страницы результатов поиска; False, если страница пуста"""
+    events, has_next = search_events(query, offset, PAGE_SIZE, settings.SEARCH_MAX_CANDIDATES)
+    if not events:
+        return False
+    listing = {"kind": "search", "query": query}
+    state = get_user_state(user_id) or {}
+    state["listing"] = listing
+    state["events"] = event_ids(events)
+    state["page_offset"] = offset
+    state["is_private"] = False
+    update_user_state(user_id, state)
+    send_and_store_message(
+        chat_id,
+        user_id,
+        format_events_page(listing, events, offset),
+        reply_markup=search_page_keyboard(
+            max(offset - PAGE_SIZE, 0) if offset else None,
+            offset + PAGE_SIZE if has_next else None
+        )
+    )
+    return True
+
+def search(message: Message, query):
+    """Ответ на поисковый запрос пользователя"""
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        send_and_store_message(message.chat.id, message.from_user.id, "Напиши, что найти, например: /search концерт")
+        return
+    if not send_search_page(message.chat.id, message.from_user.id, query):
+        send_and_store_message(
+            message.chat.id,
+            message.from_user.id,
+            f"По запросу «{query}» ничего не найдено.",
+            reply_markup=back_to_main_menu_keyboard()
+        )
+
 def handle_error(chat_id, error_message, original_message=None):
     """Обработка ошибок и отправка сообщения пользователю"""
-    logger.error(f"Error in chat {chat_id}: {error_message}")
+    logger.error("Error in chat %s: %s", chat_id, error_message)
     if original_message:
-        logger.error(f"Original message: {original_message}")
-    bot.send_message(chat_id, "Произошла ошибка. Пожалуйста, попробуйте позже или обратитесь к администратору.")
-    bot.send_message(chat_id, "Выбери тип мероприятия:", reply_markup=main_menu_keyboard())
+        logger.error("Original message: %s", original_message)
+    outbox.send(chat_id, "Произошла ошибка. Пожалуйста, попробуйте позже или обратитесь к администратору.")
+    outbox.send(chat_id, "Выбери тип мероприятия:", reply_markup=main_menu_keyboard())
 
-def safe_delete_last_message(chat_id, user_id):
-    state = get_user_state(user_id)
-    if state and state.get('last_message_id'):
+def edit_in_place(handler):
+    """Обработчик кнопки: нажатие подтверждается сразу, а новое меню заменяет текст нажатого сообщения"""
+    @wraps(handler)
+    def wrapper(call, *args):
+        chat_id = call.message.chat.id if call.message else call.from_user.id
+        outbox.answer_callback(chat_id, call.id)
+        if not settings.BOT_EDIT_IN_PLACE or call.message is None:
+            return handler(call, *args)
+        _navigation.message = call.message
+        _navigation.delete_pending = False
         try:
-            bot.delete_message(chat_id, state['last_message_id'])
-        except Exception:
-            pass
+            return handler(call, *args)
+        finally:
+            _navigation.message = None
+            if _navigation.delete_pending:
+                _navigation.delete_pending = False
+                outbox.delete_last(chat_id)
+    return wrapper
+
+def _editable_message(chat_id, keep_message):
+    """Нажатое сообщение, если его можно отредактировать (только для первого сообщения обработчика)"""
+    message = getattr(_navigation, "message", None)
+    if message is None:
+        return None
+    _navigation.message = None
+    if keep_message or not outbox.is_last(chat_id, message.message_id):
+        return None
+    return message
+
+def safe_delete_last_message(chat_id, user_id):
+    """Удаление предыдущего сообщения с меню (или отмена, если оно ещё в очереди)"""
+    message = getattr(_navigation, "message", None)
+    if message is not None and outbox.is_last(chat_id, message.message_id):
+        # Нажатое меню, скорее всего, будет отредактировано: удаление откладывается
+        _navigation.delete_pending = True
+        return
+    outbox.delete_last(chat_id)
 
 def send_and_store_message(chat_id, user_id, *args, keep_message=False, **kwargs):
+    """Постановка сообщения в очередь; без keep_message оно заменит предыдущее"""
+    message = _editable_message(chat_id, keep_message)
+    if message is not None:
+        _navigation.delete_pending = False
+        return outbox.edit(chat_id, message.message_id, *args, **kwargs)
+    if getattr(_navigation, "delete_pending", False):
+        _navigation.delete_pending = False
+        outbox.delete_last(chat_id)
     if not keep_message:
         safe_delete_last_message(chat_id, user_id)
-    msg = bot.send_message(chat_id, *args, **kwargs)
-    if not keep_message:
-        state = get_user_state(user_id) or {}
-        state['last_message_id'] = msg.message_id
-        update_user_state(user_id, state)
-    return msg
+    return outbox.send(chat_id, *args, replace=not keep_message, **kwargs)
 
 @bot.message_handler(commands=["start"])
+@use_primary
 def start(message: Message):
     try:
         telegram_id = str(message.from_user.id)
         username = message.from_user.username
-        with transaction.atomic():
-            user, created = User.objects.get_or_create(
-                telegram_id=telegram_id,
-                defaults={"username": username}
-            )
+        _, created = user_resolver.register(telegram_id, username)
         text = f"Привет, {username or 'пользователь'}! 🎉 Ты зарегистрирован в системе." if created else \
                f"С возвращением, {username or 'пользователь'}! 🔥"
         send_and_store_message(message.chat.id, message.from_user.id, text, keep_message=True)
         send_and_store_message(message.chat.id, message.from_user.id, "Выбери тип мероприятия:", reply_markup=main_menu_keyboard())
-        logger.info(f"User {telegram_id} started the bot")
+        logger.info("User %s started the bot", telegram_id)
+    except Exception as e:
+        handle_error(message.chat.id, str(e), message.text)
+
+@bot.message_handler(commands=["search"])
+def search_command(message: Message):
+    try:
+        search(message, message.text.partition(" ")[2])
     except Exception as e:
         handle_error(message.chat.id, str(e), message.text)
 
-@bot.callback_query_handler(func=lambda call: call.data == "back_main")
+@callback_router.route(callbacks.BACK_MAIN)
+@edit_in_place
 def back_to_main(call: CallbackQuery):
     try:
         safe_delete_last_message(call.message.chat.id, call.from_user.id)
         # Очистить список мероприятий из состояния
         state = get_user_state(call.from_user.id) or {}
         state.pop('events', None)
+        state.pop('listing', None)
+        state.pop('page_offset', None)
         update_user_state(call.from_user.id, state)
         send_and_store_message(
             call.message.chat.id,
@@ -208,12 +555,12 @@ def back_to_main(call: CallbackQuery):
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.message)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("event_type_"))
-def select_event_type(call: CallbackQuery):
+@callback_router.route(callbacks.EVENT_TYPE)
+@edit_in_place
+def select_event_type(call: CallbackQuery, event_type):
     try:
         # Delete the current message
         safe_delete_last_message(call.message.chat.id, call.from_user.id)
-        event_type = call.data.split("_")[2]
         send_and_store_message(
             call.message.chat.id,
             call.from_user.id,
@@ -223,88 +570,103 @@ def select_event_type(call: CallbackQuery):
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.message)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("category_"))
-def select_category(call: CallbackQuery):
+@callback_router.route(callbacks.CATEGORY)
+@edit_in_place
+def select_category(call: CallbackQuery, event_type, category):
     try:
         safe_delete_last_message(call.message.chat.id, call.from_user.id)
-        event_type = call.data.split("_")[1]
-        category = call.data.split("_")[2]
-        user = User.objects.get(telegram_id=str(call.from_user.id))
-        # Исключаем мероприятия, на которые пользователь уже записан
-        attending_events = set(Event.objects.filter(
-            attendance__user=user,
-            attendance__status="going"
-        ).values_list('id', flat=True))
-        events = list(Event.objects.filter(
-            event_type=event_type,
-            category=category,
-            date_time__gte=datetime.now()
-        ).exclude(id__in=attending_events).order_by("date_time"))
-        if not events:
+        listing = {"kind": "category", "event_type": event_type, "category": category}
+        if not send_events_page(call.message.chat.id, call.from_user.id, listing):
             send_and_store_message(
                 call.message.chat.id,
                 call.from_user.id,
                 "На данный момент нет доступных мероприятий в этой категории.",
                 reply_markup=back_to_main_menu_keyboard()
             )
-            return
-        message = f"Доступные {category} мероприятия ({event_type}):\n\n"
-        for i, event in enumerate(events, 1):
-            message += f"{i}. {event.name}\n"
-            message += f"   📅 {event.date_time.strftime('%d.%m.%Y %H:%M')}\n"
-            message += f"   📍 {event.location}\n"
-            if event.address:
-                message += f"   🏠 {event.address}\n"
-            if event.link_2gis:
-                message += f"   🗺️ {event.link_2gis}\n"
-            message += "\n"
-        # Save events in state
-        state = get_user_state(call.from_user.id) or {}
-        state["events"] = events
-        update_user_state(call.from_user.id, state)
-        send_and_store_message(
-            call.message.chat.id,
-            call.from_user.id,
-            message,
-            reply_markup=back_to_main_menu_keyboard()
-        )
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.message)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("going_"))
-def mark_attendance(call: CallbackQuery):
+@callback_router.route(callbacks.PAGE)
+@edit_in_place
+def paginate_events(call: CallbackQuery, direction, cursor):
     try:
         safe_delete_last_message(call.message.chat.id, call.from_user.id)
-        event_id = call.data.replace("going_", "")
-        with transaction.atomic():
-            user = User.objects.get(telegram_id=str(call.from_user.id))
-            event = Event.objects.get(id=int(event_id))
-            attendance, created = Attendance.objects.update_or_create(
-                user=user,
-                event=event,
-                defaults={"status": "going"}
+        state = get_user_state(call.from_user.id)
+        if not state or "listing" not in state:
+            send_and_store_message(call.message.chat.id, call.from_user.id, "Произошла ошибка. Пожалуйста, начните сначала.", reply_markup=main_menu_keyboard())
+            return
+        offset = state.get("page_offset", 0)
+        offset = offset + PAGE_SIZE if direction == PAGE_NEXT else max(offset - PAGE_SIZE, 0)
+        if not send_events_page(call.message.chat.id, call.from_user.id, state["listing"], cursor, direction, offset):
+            send_and_store_message(
+                call.message.chat.id,
+                call.from_user.id,
+                "Больше мероприятий нет.",
+                reply_markup=back_to_main_menu_keyboard()
             )
-        invalidate_user_events_cache(user.telegram_id, "going")
-        send_and_store_message(call.message.chat.id, call.from_user.id, "✅ Ты отметил своё участие.", keep_message=True)
+    except Exception as e:
+        handle_error(call.message.chat.id, str(e), call.data)
+
+@callback_router.route(callbacks.SEARCH_PAGE)
+@edit_in_place
+def paginate_search(call: CallbackQuery, offset):
+    try:
+        safe_delete_last_message(call.message.chat.id, call.from_user.id)
+        state = get_user_state(call.from_user.id)
+        listing = state.get("listing") if state else None
+        if not listing or listing["kind"] != "search":
+            send_and_store_message(call.message.chat.id, call.from_user.id, "Произошла ошибка. Пожалуйста, начните сначала.", reply_markup=main_menu_keyboard())
+            return
+        if not send_search_page(call.message.chat.id, call.from_user.id, listing["query"], offset):
+            send_and_store_message(
+                call.message.chat.id,
+                call.from_user.id,
+                "Больше мероприятий нет.",
+                reply_markup=back_to_main_menu_keyboard()
+            )
+    except Exception as e:
+        handle_error(call.message.chat.id, str(e), call.data)
+
+@callback_router.route(callbacks.GOING)
+@edit_in_place
+@use_primary
+def mark_attendance(call: CallbackQuery, event_id):
+    try:
+        safe_delete_last_message(call.message.chat.id, call.from_user.id)
+        try:
+            event, created = join_event(user_pk(call.from_user.id), event_id)
+        except EventFull as full:
+            send_and_store_message(
+                call.message.chat.id,
+                call.from_user.id,
+                f"🚫 Мест больше нет. {format_seats(full.event)}",
+                reply_markup=main_menu_keyboard()
+            )
+            logger.info("User %s hit full event %s", call.from_user.id, event_id)
+            return
+        invalidate_user_events_cache(call.from_user.id, "going")
+        text = "✅ Ты отметил своё участие."
+        if event.capacity is not None:
+            text += f"\n{format_seats(event)}"
+        send_and_store_message(call.message.chat.id, call.from_user.id, text, keep_message=True)
         send_and_store_message(call.message.chat.id, call.from_user.id, "Выбери тип мероприятия:", reply_markup=main_menu_keyboard())
-        logger.info(f"User {call.from_user.id} marked attendance for event {event_id}")
+        logger.info("User %s marked attendance for event %s", call.from_user.id, event_id)
     except ObjectDoesNotExist:
         handle_error(call.message.chat.id, "Мероприятие или пользователь не найдены", call.data)
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.data)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("edit_status_"))
-def edit_status(call: CallbackQuery):
+@callback_router.route(callbacks.EDIT_STATUS)
+@edit_in_place
+@use_primary
+def edit_status(call: CallbackQuery, action, event_id):
     try:
         # Delete the current message
         safe_delete_last_message(call.message.chat.id, call.from_user.id)
         
-        _, _, action, event_id = call.data.split("_", 3)
-        user = User.objects.get(telegram_id=str(call.from_user.id))
-        
         with transaction.atomic():
             try:
-                attendance = Attendance.objects.get(user=user, event__id=event_id)
+                attendance = Attendance.objects.get(user_id=user_pk(call.from_user.id), event__id=event_id)
             except Attendance.DoesNotExist:
                 send_and_store_message(call.message.chat.id, call.from_user.id, "Участие не найдено.")
                 return
@@ -315,33 +677,34 @@ def edit_status(call: CallbackQuery):
                 attendance.save()
                 
                 # Инвалидация кэша
-                invalidate_user_events_cache(user.telegram_id, "going")
-                invalidate_user_events_cache(user.telegram_id, old_status)
+                invalidate_user_events_cache(call.from_user.id, "going")
+                invalidate_user_events_cache(call.from_user.id, old_status)
                 
                 send_and_store_message(call.message.chat.id, call.from_user.id, "✅ Статус обновлён на 'Иду'.", 
                                reply_markup=main_menu_keyboard())
             elif action == "delete":
                 old_status = attendance.status
-                attendance.delete()
+                leave_event(attendance.user_id, event_id)
                 
                 # Инвалидация кэша
-                invalidate_user_events_cache(user.telegram_id, old_status)
+                invalidate_user_events_cache(call.from_user.id, old_status)
                 
                 send_and_store_message(call.message.chat.id, call.from_user.id, "🗑 Участие удалено.", reply_markup=main_menu_keyboard())
             else:
                 send_and_store_message(call.message.chat.id, call.from_user.id, "Неизвестное действие.")
         
-        logger.info(f"User {call.from_user.id} {action}ed attendance for event {event_id}")
+        logger.info("User %s %sed attendance for event %s", call.from_user.id, action, event_id)
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.data)
 
-@bot.callback_query_handler(func=lambda call: call.data == "maybe_events")
+@callback_router.route(callbacks.MAYBE_EVENTS)
+@edit_in_place
 def show_maybe_categories(call: CallbackQuery):
     try:
         # Delete the current message
         safe_delete_last_message(call.message.chat.id, call.from_user.id)
         
-        user = User.objects.get(telegram_id=str(call.from_user.id))
+        user_pk(call.from_user.id)
         events = get_cached_user_events(call.from_user.id, "maybe")
 
         if not events:
@@ -356,24 +719,20 @@ def show_maybe_categories(call: CallbackQuery):
             categories[event.category].append(event)
 
         # Создаем клавиатуру с категориями
-        markup = InlineKeyboardMarkup()
-        for category in categories.keys():
-            display = dict(Event.CATEGORY_CHOICES).get(category, category)
-            markup.add(InlineKeyboardButton(f"{display}", callback_data=f"maybe_cat_{category}"))
-        markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_main"))
+        markup = categories_keyboard(callbacks.MAYBE_CATEGORY, tuple(categories))
         
         send_and_store_message(call.message.chat.id, call.from_user.id, "Выбери категорию мероприятия:", reply_markup=markup)
-        logger.info(f"User {call.from_user.id} viewed maybe events categories")
+        logger.info("User %s viewed maybe events categories", call.from_user.id)
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.data)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("maybe_cat_"))
-def maybe_category_events(call: CallbackQuery):
+@callback_router.route(callbacks.MAYBE_CATEGORY)
+@edit_in_place
+def maybe_category_events(call: CallbackQuery, category):
     try:
         # Delete the current message
         safe_delete_last_message(call.message.chat.id, call.from_user.id)
         
-        category = call.data.replace("maybe_cat_", "")
         events = get_cached_user_events(call.from_user.id, "maybe")
         
         if not events:
@@ -409,7 +768,8 @@ def maybe_category_events(call: CallbackQuery):
 
         # Save events in state
         state = get_user_state(call.from_user.id) or {}
-        state["events"] = category_events
+        state["events"] = event_ids(category_events)
+        state["page_offset"] = 0
         update_user_state(call.from_user.id, state)
 
         send_and_store_message(
@@ -440,26 +800,28 @@ def handle_event_number(message: Message):
             send_and_store_message(message.chat.id, message.from_user.id, "Пожалуйста, выберите мероприятие из списка.", reply_markup=back_to_main_menu_keyboard())
             return
 
-        if number < 1 or number > len(events):
-            send_and_store_message(message.chat.id, message.from_user.id, f"Пожалуйста, выберите номер от 1 до {len(events)}.")
+        # Номера продолжаются между страницами списка
+        offset = state.get("page_offset", 0)
+        if number <= offset or number > offset + len(events):
+            send_and_store_message(message.chat.id, message.from_user.id, f"Пожалуйста, выберите номер от {offset + 1} до {offset + len(events)}.")
             return
 
-        event = events[number - 1]
+        event = Event.objects.filter(id=events[number - offset - 1]).first()
+        if event is None:
+            send_and_store_message(message.chat.id, message.from_user.id, "Мероприятие больше недоступно.", reply_markup=back_to_main_menu_keyboard())
+            return
 
-        # Формируем текст с информацией о мероприятии
-        text = f"<b>{event.name}</b>\n"
-        text += f"📍 {event.location}, {event.address}\n"
-        text += f"📅 {event.date_time.strftime('%d.%m.%Y %H:%M')}\n"
-        if event.details:
-            text += f"📝 {event.details}\n"
-        if event.link_2gis:
-            text += f"🔗 <a href='{event.link_2gis}'>Ссылка на 2ГИС</a>"
+        text = format_event_details(event)
+        seats = format_seats(event)
+        if seats:
+            text += f"\n{seats}"
 
         # Проверяем, является ли пользователь участником мероприятия
-        try:
-            attendance = Attendance.objects.get(user__telegram_id=str(user_id), event=event)
+        if Attendance.objects.filter(user_id=user_pk(user_id), event=event).exists():
             markup = my_event_actions_keyboard(event.id)
-        except Attendance.DoesNotExist:
+        elif event.is_full:
+            markup = back_to_main_menu_keyboard()
+        else:
             markup = attendance_keyboard(event.id)
 
         send_and_store_message(message.chat.id, message.from_user.id, text, reply_markup=markup, parse_mode="HTML")
@@ -468,10 +830,44 @@ def handle_event_number(message: Message):
 
 @bot.message_handler(func=lambda message: True)
 def fallback_handler(message: Message):
+    # Свободный текст - поисковый запрос
+    if message.text and not message.text.startswith("/"):
+        try:
+            search(message, message.text)
+        except Exception as e:
+            handle_error(message.chat.id, str(e), message.text)
+        return
     send_and_store_message(message.chat.id, message.from_user.id, "⛔️ Неизвестная команда. Пожалуйста, выбери действие с клавиатуры.")
     send_and_store_message(message.chat.id, message.from_user.id, "Выбери тип мероприятия:", reply_markup=main_menu_keyboard())
 
-@bot.callback_query_handler(func=lambda call: call.data == "my_events")
+@bot.inline_handler(func=lambda query: True)
+def inline_events(query: InlineQuery):
+    """Поиск мероприятий в inline-режиме: текст, тип и категория из запроса"""
+    try:
+        offset = int(query.offset) if query.offset and query.offset.isdigit() else 0
+        events, fresh_for = inline_results.get(query.query or "")
+        page = events[offset:offset + INLINE_PAGE_SIZE]
+        next_offset = offset + INLINE_PAGE_SIZE
+        # Telegram кэширует ответ не дольше, чем актуальна запомненная выдача
+        # и пока не началось ближайшее мероприятие страницы (выдача поиска
+        # отсортирована по релевантности, а не по дате)
+        cache_time = fresh_for
+        if page:
+            starts_at = min(event.date_time for event in page)
+            cache_time = min(cache_time, (starts_at - timezone.now()).total_seconds())
+        outbox.answer_inline(
+            query.from_user.id,
+            query.id,
+            [event_article(event) for event in page],
+            cache_time=max(int(cache_time), 0),
+            is_personal=False,
+            next_offset=str(next_offset) if next_offset < len(events) else ""
+        )
+    except Exception as e:
+        logger.error("Error in inline query from user %s: %s", query.from_user.id, e)
+
+@callback_router.route(callbacks.MY_EVENTS)
+@edit_in_place
 def show_my_events_categories(call: CallbackQuery):
     try:
         # Delete the current message
@@ -497,11 +893,7 @@ def show_my_events_categories(call: CallbackQuery):
             categories[event.category].append(event)
             
         # Create keyboard with categories
-        markup = InlineKeyboardMarkup()
-        for category in categories.keys():
-            display = dict(Event.CATEGORY_CHOICES).get(category, category)
-            markup.add(InlineKeyboardButton(display, callback_data=f"my_cat_{category}"))
-        markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_main"))
+        markup = my_events_category_keyboard(categories)
         
         send_and_store_message(
             call.message.chat.id,
@@ -512,57 +904,21 @@ def show_my_events_categories(call: CallbackQuery):
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.message)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("my_cat_"))
-def show_my_category_events(call: CallbackQuery):
+@callback_router.route(callbacks.MY_CATEGORY)
+@edit_in_place
+def show_my_category_events(call: CallbackQuery, category):
     try:
         # Delete the current message
         safe_delete_last_message(call.message.chat.id, call.from_user.id)
         
-        category = call.data.split("_")[2]
-        events = get_cached_user_events(call.from_user.id, "going")
-        
-        if not events:
+        listing = {"kind": "my", "category": category}
+        if not send_events_page(call.message.chat.id, call.from_user.id, listing):
             send_and_store_message(
                 call.message.chat.id,
                 call.from_user.id,
                 "У вас нет мероприятий в этой категории.",
                 reply_markup=back_to_main_menu_keyboard()
             )
-            return
-
-        category_events = [event for event in events if event.category == category]
-        
-        if not category_events:
-            send_and_store_message(
-                call.message.chat.id,
-                call.from_user.id,
-                "У вас нет мероприятий в этой категории.",
-                reply_markup=back_to_main_menu_keyboard()
-            )
-            return
-
-        message = f"Ваши мероприятия в категории {dict(Event.CATEGORY_CHOICES).get(category, category)}:\n\n"
-        for i, event in enumerate(category_events, 1):
-            message += f"{i}. {event.name}\n"
-            message += f"   📅 {event.date_time.strftime('%d.%m.%Y %H:%M')}\n"
-            message += f"   📍 {event.location}\n"
-            if event.address:
-                message += f"   🏠 {event.address}\n"
-            if event.link_2gis:
-                message += f"   🗺️ {event.link_2gis}\n"
-            message += "\n"
-
-        # Save events in state
-        state = get_user_state(call.from_user.id) or {}
-        state["events"] = category_events
-        update_user_state(call.from_user.id, state)
-
-        send_and_store_message(
-            call.message.chat.id,
-            call.from_user.id,
-            message,
-            reply_markup=back_to_main_menu_keyboard()
-        )
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.message)
 
@@ -587,7 +943,7 @@ def show_my_category_events(call: CallbackQuery):
 #                 reply_markup=back_to_main_menu_keyboard()
 #             )
 #     except Exception as e:
-#         logger.error(f"Error in handle_buy_ticket: {str(e)}")
+#         logger.error("Error in handle_buy_ticket: %s", e)
 #         send_and_store_message(
 #             call.message.chat.id,
 #             call.from_user.id,
@@ -595,15 +951,14 @@ def show_my_category_events(call: CallbackQuery):
 #             reply_markup=back_to_main_menu_keyboard()
 #         )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("cancel_attendance_"))
-def handle_cancel_attendance(call: CallbackQuery):
+@callback_router.route(callbacks.CANCEL_ATTENDANCE)
+@edit_in_place
+@use_primary
+def handle_cancel_attendance(call: CallbackQuery, event_id):
     try:
         safe_delete_last_message(call.message.chat.id, call.from_user.id)
-        event_id = call.data.replace("cancel_attendance_", "")
-        user = User.objects.get(telegram_id=str(call.from_user.id))
-        event = Event.objects.get(id=event_id)
-        Attendance.objects.filter(user=user, event=event).delete()
-        invalidate_user_events_cache(user.telegram_id, "going")
+        leave_event(user_pk(call.from_user.id), event_id)
+        invalidate_user_events_cache(call.from_user.id, "going")
         send_and_store_message(
             call.message.chat.id,
             call.from_user.id,
@@ -616,9 +971,9 @@ def handle_cancel_attendance(call: CallbackQuery):
             "Выбери тип мероприятия:",
             reply_markup=main_menu_keyboard()
         )
-        logger.info(f"User {call.from_user.id} cancelled attendance for event {event_id}")
+        logger.info("User %s cancelled attendance for event %s", call.from_user.id, event_id)
     except Exception as e:
-        logger.error(f"Error in handle_cancel_attendance: {str(e)}")
+        logger.error("Error in handle_cancel_attendance: %s", e)
         send_and_store_message(
             call.message.chat.id,
             call.from_user.id,
@@ -626,13 +981,14 @@ def handle_cancel_attendance(call: CallbackQuery):
             reply_markup=back_to_main_menu_keyboard()
         )
 
-@bot.callback_query_handler(func=lambda call: call.data == "private_events")
+@callback_router.route(callbacks.PRIVATE_EVENTS)
+@edit_in_place
 def show_private_channels(call: CallbackQuery):
     try:
         # Delete the current message
         safe_delete_last_message(call.message.chat.id, call.from_user.id)
-        channels = TelegramChannel.objects.all()
-        if not channels:
+        markup = channels_keyboard.get()
+        if markup is None:
             send_and_store_message(
                 call.message.chat.id,
                 call.from_user.id,
@@ -645,63 +1001,51 @@ def show_private_channels(call: CallbackQuery):
             call.message.chat.id,
             call.from_user.id,
             "Выберите приватный канал:",
-            reply_markup=private_channels_keyboard(channels)
+            reply_markup=markup
         )
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.message)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("private_channel_"))
-def show_private_channel_events(call: CallbackQuery):
+@callback_router.route(callbacks.PRIVATE_CHANNEL)
+@edit_in_place
+def show_private_channel_events(call: CallbackQuery, channel_id):
     try:
-        channel_id = call.data.replace("private_channel_", "")
         channel = TelegramChannel.objects.get(id=channel_id)
         
-        # Get user's attending events
-        user = User.objects.get(telegram_id=str(call.from_user.id))
-        attending_events = set(Event.objects.filter(
-            attendance__user=user,
-            attendance__status="going"
-        ).values_list('id', flat=True))
-        
         # Get events for this channel, excluding those user is already attending
-        events = Event.objects.filter(
-            channel=channel,
-            is_private=True,
-            date_time__gte=datetime.now()
-        ).exclude(id__in=attending_events).order_by("date_time")
+        attending_events = attending_event_ids(call.from_user.id)
+        events = [event for event in event_index.channel_events(channel.id) if event.id not in attending_events]
         
         if not events:
             send_and_store_message(call.message.chat.id, call.from_user.id, f"В канале {channel.name} пока нет доступных мероприятий.", reply_markup=back_to_main_menu_keyboard())
             return
             
-        # Группируем мероприятия по типам
+        # Группируем мероприятия по типам и категориям (в состоянии храним только id)
         event_types = {}
         for event in events:
-            if event.event_type not in event_types:
-                event_types[event.event_type] = []
-            event_types[event.event_type].append(event)
+            categories = event_types.setdefault(event.event_type, {})
+            categories.setdefault(event.category, []).append(event.id)
         
         # Создаем клавиатуру с типами мероприятий
-        markup = InlineKeyboardMarkup()
-        for event_type in event_types.keys():
-            display = dict(Event.EVENT_TYPE_CHOICES).get(event_type, event_type)
-            markup.add(InlineKeyboardButton(f"{display}", callback_data=f"private_type_{channel_id}_{event_type}"))
-        markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_main"))
+        markup = private_types_keyboard(channel_id, tuple(event_types))
         
         # Save channel_id in state
         state = get_user_state(call.from_user.id) or {}
         state["private_channel_id"] = channel_id
-        state["private_events"] = {et: list(evs) for et, evs in event_types.items()}
+        state["private_events"] = {
+            et: {cat: tuple(ids) for cat, ids in categories.items()}
+            for et, categories in event_types.items()
+        }
         update_user_state(call.from_user.id, state)
         
         send_and_store_message(call.message.chat.id, call.from_user.id, f"Выбери тип мероприятия в канале {channel.name}:", reply_markup=markup)
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.data)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("private_type_"))
-def show_private_type_categories(call: CallbackQuery):
+@callback_router.route(callbacks.PRIVATE_TYPE)
+@edit_in_place
+def show_private_type_categories(call: CallbackQuery, channel_id, event_type):
     try:
-        _, _, channel_id, event_type = call.data.split("_")
         channel = TelegramChannel.objects.get(id=channel_id)
         
         # Get state
@@ -710,85 +1054,128 @@ def show_private_type_categories(call: CallbackQuery):
             send_and_store_message(call.message.chat.id, call.from_user.id, "Произошла ошибка. Пожалуйста, начните сначала.", reply_markup=main_menu_keyboard())
             return
             
-        # Get events for this type
-        events = state["private_events"].get(event_type, [])
+        # Get events for this type, grouped by category
+        categories = state["private_events"].get(event_type, {})
         
-        if not events:
+        if not categories:
             send_and_store_message(call.message.chat.id, call.from_user.id, f"В канале {channel.name} нет мероприятий типа {dict(Event.EVENT_TYPE_CHOICES).get(event_type, event_type)}.", reply_markup=back_to_main_menu_keyboard())
             return
-            
-        # Группируем мероприятия по категориям
-        categories = {}
-        for event in events:
-            if event.category not in categories:
-                categories[event.category] = []
-            categories[event.category].append(event)
         
         # Создаем клавиатуру с категориями
-        markup = InlineKeyboardMarkup()
-        for category in categories.keys():
-            display = dict(Event.CATEGORY_CHOICES).get(category, category)
-            markup.add(InlineKeyboardButton(f"{display}", callback_data=f"private_cat_{channel_id}_{event_type}_{category}"))
-        markup.add(InlineKeyboardButton("🔙 Назад", callback_data=f"private_channel_{channel_id}"))
+        markup = private_categories_keyboard(channel_id, event_type, categories)
         
         # Update state
         state["private_type"] = event_type
-        state["private_events_by_category"] = {cat: list(evs) for cat, evs in categories.items()}
         update_user_state(call.from_user.id, state)
         
         send_and_store_message(call.message.chat.id, call.from_user.id, f"Выбери категорию мероприятий:", reply_markup=markup)
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.data)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("private_cat_"))
-def show_private_category_events(call: CallbackQuery):
+@callback_router.route(callbacks.PRIVATE_CATEGORY)
+@edit_in_place
+def show_private_category_events(call: CallbackQuery, channel_id, event_type, category):
     try:
-        _, _, channel_id, event_type, category = call.data.split("_")
         channel = TelegramChannel.objects.get(id=channel_id)
-        
-        # Get state
-        state = get_user_state(call.from_user.id)
-        if not state or "private_events_by_category" not in state:
-            send_and_store_message(call.message.chat.id, call.from_user.id, "Произошла ошибка. Пожалуйста, начните сначала.", reply_markup=main_menu_keyboard())
-            return
-            
-        # Get events for this category
-        events = state["private_events_by_category"].get(category, [])
-        
-        if not events:
+        listing = {
+            "kind": "private",
+            "channel_id": channel.id,
+            "channel_name": channel.name,
+            "event_type": event_type,
+            "category": category,
+        }
+        if not send_events_page(call.message.chat.id, call.from_user.id, listing):
             send_and_store_message(call.message.chat.id, call.from_user.id, f"В канале {channel.name} нет мероприятий категории {dict(Event.CATEGORY_CHOICES).get(category, category)}.", reply_markup=back_to_main_menu_keyboard())
-            return
-            
-        # Save events in state
-        state["events"] = events
-        state["is_private"] = True
-        update_user_state(call.from_user.id, state)
-        
-        # Format events list
-        text = f"Мероприятия канала {channel.name} ({dict(Event.EVENT_TYPE_CHOICES).get(event_type, event_type)}, {dict(Event.CATEGORY_CHOICES).get(category, category)}):\n\n"
-        for i, event in enumerate(events, 1):
-            weekday = calendar.day_name[event.date_time.weekday()]
-            ru_day = {'Saturday': 'Сб', 'Sunday': 'Вс'}.get(weekday, '')
-            date_str = event.date_time.strftime('%d.%m (%H:%M)')
-            date_str += f" <b>{ru_day}</b>" if ru_day else ''
-            text += f"{i}. {date_str} - {event.name}\n"
-        text += "\nНапиши номер мероприятия, чтобы получить подробности."
-        
-        send_and_store_message(call.message.chat.id, call.from_user.id, text, reply_markup=back_to_main_menu_keyboard())
     except Exception as e:
         handle_error(call.message.chat.id, str(e), call.data)
 
+def classify_update(update):
+    """Ключ чата и полоса приоритета для обновления"""
+    if update.message:
+        text = update.message.text or ""
+        lane = LANE_PRIORITY if text.startswith(PRIORITY_COMMANDS) else LANE_DEFAULT
+        return update.message.chat.id, lane
+    if update.callback_query:
+        call = update.callback_query
+        chat_id = call.message.chat.id if call.message else call.from_user.id
+        lane = LANE_PRIORITY if callback_router.is_priority(call.data) else LANE_DEFAULT
+        return chat_id, lane
+    if update.inline_query:
+        # Запросы одного пользователя (каждое нажатие клавиши) - по порядку
+        return update.inline_query.from_user.id, LANE_DEFAULT
+    return update.update_id, LANE_DEFAULT
+
+def start_dispatcher():
+    """Запуск пула обработки обновлений и очереди исходящих сообщений"""
+    if bot.dispatcher is None:
+        outbox.start()
+        bot.dispatcher = UpdateDispatcher(
+            bot.handle_update,
+            classify_update,
+            num_workers=settings.BOT_WORKERS,
+            max_queue=settings.BOT_QUEUE_SIZE
+        ).start()
+    return bot.dispatcher
+
+def stop_dispatcher():
+    """Остановка пула обработки обновлений"""
+    dispatcher, bot.dispatcher = bot.dispatcher, None
+    if dispatcher is not None:
+        dispatcher.stop(timeout=10)
+        logger.info("Dispatcher stopped: %s", dispatcher.stats())
+    outbox.stop(timeout=10)
+    logger.info("Outbox stopped: %s", outbox.stats())
+
+def process_update(update):
+    """Передача обновления (из вебхука) в обработчики бота"""
+    bot.process_new_updates([update])
+
+_webhook_worker_lock = threading.Lock()
+_webhook_worker_started = False
+
+def start_webhook_worker():
+    """Запуск фоновых задач бота в процессе, принимающем вебхук"""
+    global _webhook_worker_started
+    with _webhook_worker_lock:
+        if _webhook_worker_started:
+            return
+        _webhook_worker_started = True
+    logger.info("Запуск бота в режиме вебхука!")
+    start_cleanup_thread()
+    start_dispatcher()
+    if settings.REMINDERS_ENABLED:
+        reminder_scheduler.start()
+
+def set_webhook(drop_pending_updates=False):
+    """Регистрация вебхука в Telegram"""
+    return bot.set_webhook(
+        url=settings.WEBHOOK_URL,
+        secret_token=settings.WEBHOOK_SECRET,
+        drop_pending_updates=drop_pending_updates
+    )
+
+def delete_webhook(drop_pending_updates=False):
+    """Удаление вебхука (возврат к long polling)"""
+    return bot.delete_webhook(drop_pending_updates=drop_pending_updates)
+
 def RunBot():
     try:
         logger.info("Запуск бота!")
         cleanup_thread = start_cleanup_thread()
+        if settings.METRICS_PORT:
+            start_metrics_server(settings.METRICS_PORT, settings.METRICS_HOST)
+        start_dispatcher()
+        if settings.REMINDERS_ENABLED:
+            reminder_scheduler.start()
         bot.polling(none_stop=True, interval=0)
     except Exception as e:
-        logger.error(f"Ошибка при запуске бота: {e}")
+        logger.error("Ошибка при запуске бота: %s", e)
         raise e
     except KeyboardInterrupt:
         logger.info("Бот остановлен вручную!")
     finally:
+        reminder_scheduler.stop(timeout=30)
+        stop_dispatcher()
         logger.info("Завершение работы бота!")
 
 
@@ -0,0 +1,58 @@
+import time
+
+from django.core.cache import cache as default_cache
+
+
+class CacheNamespace:
+    """Пространство имён кэша с номером версии.
+
+    Версия входит в каждый ключ, поэтому инвалидация всего пространства -
+    это одно увеличение счётчика, а старые записи просто перестают
+    читаться и уходят из кэша по TTL. Версия родителя входит в версию
+    дочернего пространства, а поколение из InvalidationBus делает
+    инвалидацию видимой в других процессах.
+    """
+
+    def __init__(self, name, parent=None, bus=None, cache=None, timeout=None):
+        self.name = name
+        self.parent = parent
+        self.bus = bus
+        self.cache = cache or default_cache
+        self.timeout = timeout
+        self.version_key = f"ns_version_{name}"
+
+    def version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            # Начальное значение от времени: если счётчик вытеснен из кэша,
+            # записи под старыми версиями не оживут
+            version = time.time_ns()
+            if not self.cache.add(self.version_key, version, None):
+                version = self.cache.get(self.version_key, version)
+        parts = [str(version)]
+        if self.bus is not None:
+            parts.append(str(self.bus.generation(self.name)))
+        if self.parent is not None:
+            parts.append(self.parent.version())
+        return ".".join(parts)
+
+    def key(self, key):
+        return f"{self.name}:{self.version()}:{key}"
+
+    def get(self, key, default=None):
+        return self.cache.get(self.key(key), default)
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(self.key(key), value, self.timeout if timeout is None else timeout)
+
+    def delete(self, key):
+        self.cache.delete(self.key(key))
+
+    def invalidate(self):
+        """Сброс всех записей пространства (и дочерних пространств) за O(1)"""
+        try:
+            self.cache.incr(self.version_key)
+        except ValueError:
+            self.cache.set(self.version_key, time.time_ns(), None)
+        if self.bus is not None:
+            self.bus.publish(self.name)
@@ -0,0 +1,230 @@
+import logging
+
+from main.metrics import instrumented
+from main.models import Event
+from main.pagination import PAGE_NEXT, PAGE_PREV
+
+logger = logging.getLogger(__name__)
+
+# Формат callback_data: версия, код типа кнопки и поля через SEPARATOR,
+# например "1g:2n9c" - "Иду" на мероприятие 123456. Числа и индексы
+# вариантов (тип, категория) записываются в base36, поэтому данные короткие
+# и не зависят от символов "_" в значениях.
+VERSION = "1"
+SEPARATOR = ":"
+# Лимит Telegram на длину callback_data (в байтах)
+MAX_LENGTH = 64
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def to_base36(number):
+    if number < 0:
+        raise ValueError(f"Negative number in callback data: {number}")
+    digits = []
+    while True:
+        number, digit = divmod(number, 36)
+        digits.append(DIGITS[digit])
+        if not number:
+            return "".join(reversed(digits))
+
+
+def from_base36(text):
+    # int() допускает знак, пробелы и "_" - в данных кнопок их не бывает
+    if not text or text.strip(DIGITS):
+        raise ValueError(f"Invalid number in callback data: {text!r}")
+    return int(text, 36)
+
+
+def from_decimal(text):
+    if not text.isdigit():
+        raise ValueError(f"Invalid number in callback data: {text!r}")
+    return int(text)
+
+
+class IntField:
+    """Целое неотрицательное число (id)"""
+
+    def encode(self, value):
+        return to_base36(int(value))
+
+    def decode(self, text):
+        return from_base36(text)
+
+    def from_legacy(self, text):
+        return from_decimal(text)
+
+
+class ChoiceField:
+    """Значение из фиксированного списка: записывается его индекс"""
+
+    def __init__(self, values):
+        self.values = tuple(values)
+        self._index = {value: position for position, value in enumerate(self.values)}
+
+    def encode(self, value):
+        return to_base36(self._index[value])
+
+    def decode(self, text):
+        return self.values[from_base36(text)]
+
+    def from_legacy(self, text):
+        if text not in self._index:
+            raise ValueError(f"Unknown value {text!r}")
+        return text
+
+
+class CursorField:
+    """Курсор страницы "микросекунды_id" (см. main.pagination)"""
+
+    def encode(self, value):
+        micros, event_id = value.split("_")
+        return f"{to_base36(int(micros))}-{to_base36(int(event_id))}"
+
+    def decode(self, text):
+        micros, event_id = text.split("-")
+        return f"{from_base36(micros)}_{from_base36(event_id)}"
+
+    def from_legacy(self, text):
+        micros, event_id = text.split("_")
+        return f"{from_decimal(micros)}_{from_decimal(event_id)}"
+
+
+EVENT_TYPE_FIELD = ChoiceField(value for value, _ in Event.EVENT_TYPE_CHOICES)
+CATEGORY_FIELD = ChoiceField(value for value, _ in Event.CATEGORY_CHOICES)
+ID_FIELD = IntField()
+
+
+class CallbackType:
+    """Тип кнопки: код, поля и старый текстовый формат (для кнопок, уже отправленных пользователям).
+
+    legacy - префикс старого формата ("going_"), поля в нём разделены "_",
+    последнее поле забирает остаток строки. Без полей legacy - вся строка.
+    """
+
+    def __init__(self, name, code, fields=(), legacy=None, priority=False):
+        self.name = name
+        self.code = code
+        self.fields = tuple(fields)
+        self.legacy = legacy
+        self.priority = priority
+
+    def pack(self, *values):
+        """callback_data кнопки"""
+        if len(values) != len(self.fields):
+            raise ValueError(f"{self.name} expects {len(self.fields)} fields, got {len(values)}")
+        data = SEPARATOR.join([VERSION + self.code] + [field.encode(value) for field, value in zip(self.fields, values)])
+        if len(data.encode("utf-8")) > MAX_LENGTH:
+            raise ValueError(f"Callback data for {self.name} is longer than {MAX_LENGTH} bytes: {data}")
+        return data
+
+    def unpack(self, parts):
+        if len(parts) != len(self.fields):
+            raise ValueError(f"{self.name} expects {len(self.fields)} fields, got {len(parts)}")
+        return tuple(field.decode(part) for field, part in zip(self.fields, parts))
+
+    def unpack_legacy(self, rest):
+        if not self.fields:
+            return ()
+        parts = rest.split("_", len(self.fields) - 1)
+        if len(parts) != len(self.fields):
+            raise ValueError(f"{self.name} expects {len(self.fields)} fields, got {len(parts)}")
+        return tuple(field.from_legacy(part) for field, part in zip(self.fields, parts))
+
+    def __repr__(self):
+        return f"CallbackType({self.name})"
+
+
+BACK_MAIN = CallbackType("back_main", "b", legacy="back_main")
+EVENT_TYPE = CallbackType("event_type", "t", [EVENT_TYPE_FIELD], legacy="event_type_")
+CATEGORY = CallbackType("category", "c", [EVENT_TYPE_FIELD, CATEGORY_FIELD], legacy="category_")
+PAGE = CallbackType("page", "p", [ChoiceField([PAGE_NEXT, PAGE_PREV]), CursorField()], legacy="page_")
+GOING = CallbackType("going", "g", [ID_FIELD], legacy="going_", priority=True)
+EDIT_STATUS = CallbackType("edit_status", "e", [ChoiceField(["going", "delete"]), ID_FIELD], legacy="edit_status_", priority=True)
+MAYBE_EVENTS = CallbackType("maybe_events", "m", legacy="maybe_events")
+MAYBE_CATEGORY = CallbackType("maybe_category", "n", [CATEGORY_FIELD], legacy="maybe_cat_")
+MY_EVENTS = CallbackType("my_events", "y", legacy="my_events")
+MY_CATEGORY = CallbackType("my_category", "u", [CATEGORY_FIELD], legacy="my_cat_")
+CANCEL_ATTENDANCE = CallbackType("cancel_attendance", "x", [ID_FIELD], legacy="cancel_attendance_", priority=True)
+PRIVATE_EVENTS = CallbackType("private_events", "v", legacy="private_events")
+PRIVATE_CHANNEL = CallbackType("private_channel", "h", [ID_FIELD], legacy="private_channel_")
+PRIVATE_TYPE = CallbackType("private_type", "r", [ID_FIELD, EVENT_TYPE_FIELD], legacy="private_type_")
+PRIVATE_CATEGORY = CallbackType("private_category", "s", [ID_FIELD, EVENT_TYPE_FIELD, CATEGORY_FIELD], legacy="private_cat_")
+# Страница результатов поиска: номер первого результата (текст запроса - в состоянии)
+SEARCH_PAGE = CallbackType("search_page", "q", [IntField()])
+
+
+class CallbackRouter:
+    """Маршрутизация нажатий по типу кнопки за один поиск в словаре.
+
+    Новые данные разбираются по коду типа; старые текстовые - по точному
+    совпадению или по префиксу до одного из первых символов "_" (префиксы
+    короткие, поэтому проверок не больше нескольких). Обработчик получает
+    нажатие и разобранные поля.
+    """
+
+    # Сколько первых "_" проверять при поиске старого префикса
+    MAX_LEGACY_PREFIX_PARTS = 3
+
+    def __init__(self):
+        self._types = {}
+        self._legacy_exact = {}
+        self._legacy_prefixes = {}
+        self._handlers = {}
+
+    def route(self, callback_type):
+        """Декоратор обработчика кнопок типа callback_type"""
+        def decorator(handler):
+            self._register(callback_type)
+            self._handlers[callback_type.code] = instrumented(handler)
+            return handler
+        return decorator
+
+    def _register(self, callback_type):
+        if self._types.get(callback_type.code, callback_type) is not callback_type:
+            raise ValueError(f"Callback code {callback_type.code!r} is already used")
+        self._types[callback_type.code] = callback_type
+        if callback_type.legacy is None:
+            return
+        if callback_type.fields:
+            self._legacy_prefixes[callback_type.legacy] = callback_type
+        else:
+            self._legacy_exact[callback_type.legacy] = callback_type
+
+    def resolve(self, data):
+        """(тип кнопки, поля) или (None, None) для неизвестных и повреждённых данных"""
+        if not data:
+            return None, None
+        try:
+            if data[0] == VERSION:
+                head, *parts = data.split(SEPARATOR)
+                callback_type = self._types.get(head[1:])
+                if callback_type is None:
+                    return None, None
+                return callback_type, callback_type.unpack(parts)
+            callback_type = self._legacy_exact.get(data)
+            if callback_type is not None:
+                return callback_type, ()
+            position = -1
+            for _ in range(self.MAX_LEGACY_PREFIX_PARTS):
+                position = data.find("_", position + 1)
+                if position < 0:
+                    break
+                callback_type = self._legacy_prefixes.get(data[:position + 1])
+                if callback_type is not None:
+                    return callback_type, callback_type.unpack_legacy(data[position + 1:])
+        except (ValueError, IndexError, KeyError) as e:
+            logger.warning("Malformed callback data %r: %s", data, e)
+        return None, None
+
+    def is_priority(self, data):
+        callback_type, _ = self.resolve(data)
+        return callback_type is not None and callback_type.priority
+
+    def dispatch(self, call):
+        """Вызов обработчика нажатия; False, если данные не распознаны"""
+        callback_type, args = self.resolve(call.data)
+        handler = self._handlers.get(callback_type.code) if callback_type is not None else None
+        if handler is None:
+            return False
+        handler(call, *args)
+        return True
@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: чем меньше номер, тем раньше обрабатывается
+LANE_PRIORITY = 0
+LANE_DEFAULT = 1
+LANES = (LANE_PRIORITY, LANE_DEFAULT)
+LANE_NAMES = {LANE_PRIORITY: 'priority', LANE_DEFAULT: 'default'}
+
+
+class _ChatQueue:
+    """Очередь обновлений одного чата"""
+    __slots__ = ('items', 'scheduled', 'running')
+
+    def __init__(self):
+        self.items = deque()
+        self.scheduled = None
+        self.running = False
+
+
+class UpdateDispatcher:
+    """Пул потоков для обработки обновлений.
+
+    Обновления одного чата обрабатываются строго по очереди, разные чаты -
+    параллельно. Чат с обновлением из приоритетной полосы выбирается раньше
+    чатов из обычной полосы. Очередь ограничена: при переполнении submit()
+    ждёт освобождения места.
+    """
+
+    def __init__(self, handler, classify, num_workers=4, max_queue=1000, name='dispatch'):
+        self.handler = handler
+        self.classify = classify
+        self.num_workers = num_workers
+        self.max_queue = max_queue
+        self.name = name
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._chats = {}
+        self._ready = {lane: deque() for lane in LANES}
+        self._threads = []
+        self._stopped = False
+        # Счётчики
+        self._pending = 0
+        self._pending_by_lane = {lane: 0 for lane in LANES}
+        self._in_flight = 0
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._wait_total = {lane: 0.0 for lane in LANES}
+        self._wait_max = {lane: 0.0 for lane in LANES}
+        self._wait_count = {lane: 0 for lane in LANES}
+
+    def start(self):
+        """Запуск рабочих потоков"""
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Dispatcher started with %s workers", self.num_workers)
+        return self
+
+    def stop(self, timeout=None):
+        """Остановка рабочих потоков после обработки текущих обновлений"""
+        with self._lock:
+            self._stopped = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, update):
+        """Постановка обновления в очередь чата"""
+        key, lane = self.classify(update)
+        with self._lock:
+            while self._pending >= self.max_queue and not self._stopped:
+                self._not_full.wait()
+            if self._stopped:
+                return False
+            chat = self._chats.get(key)
+            if chat is None:
+                chat = self._chats[key] = _ChatQueue()
+            chat.items.append((lane, time.monotonic(), update))
+            self._pending += 1
+            self._pending_by_lane[lane] += 1
+            self._submitted += 1
+            if not chat.running and (chat.scheduled is None or lane < chat.scheduled):
+                self._schedule(key, chat, lane)
+        return True
+
+    def _schedule(self, key, chat, lane):
+        # Старая запись в менее приоритетной полосе станет устаревшей и будет пропущена
+        chat.scheduled = lane
+        self._ready[lane].append(key)
+        self._not_empty.notify()
+
+    def _next_chat(self):
+        for lane in LANES:
+            ready = self._ready[lane]
+            while ready:
+                key = ready.popleft()
+                chat = self._chats.get(key)
+                if chat is not None and not chat.running and chat.scheduled is not None:
+                    return key, chat
+        return None, None
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                key, chat = self._next_chat()
+                while chat is None:
+                    if self._stopped:
+                        return
+                    self._not_empty.wait()
+                    key, chat = self._next_chat()
+                chat.running = True
+                chat.scheduled = None
+                lane, enqueued_at, update = chat.items.popleft()
+                waited = time.monotonic() - enqueued_at
+                self._pending -= 1
+                self._pending_by_lane[lane] -= 1
+                self._in_flight += 1
+                self._wait_total[lane] += waited
+                self._wait_count[lane] += 1
+                if waited > self._wait_max[lane]:
+                    self._wait_max[lane] = waited
+                self._not_full.notify()
+
+            failed = False
+            try:
+                self.handler(update)
+            except Exception as e:
+                failed = True
+                logger.error("Error while handling update %s: %s", getattr(update, 'update_id', None), e)
+
+            with self._lock:
+                self._in_flight -= 1
+                self._processed += 1
+                if failed:
+                    self._failed += 1
+                chat.running = False
+                if chat.items:
+                    self._schedule(key, chat, min(item[0] for item in chat.items))
+                else:
+                    del self._chats[key]
+
+    def stats(self):
+        """Снимок счётчиков очереди"""
+        with self._lock:
+            return {
+                'workers': self.num_workers,
+                'queue_depth': self._pending,
+                'queue_depth_by_lane': {LANE_NAMES[lane]: self._pending_by_lane[lane] for lane in LANES},
+                'in_flight': self._in_flight,
+                'chats': len(self._chats),
+                'submitted': self._submitted,
+                'processed': self._processed,
+                'failed': self._failed,
+                'wait_seconds_total': {LANE_NAMES[lane]: self._wait_total[lane] for lane in LANES},
+                'wait_seconds_max': {LANE_NAMES[lane]: self._wait_max[lane] for lane in LANES},
+                'wait_count': {LANE_NAMES[lane]: self._wait_count[lane] for lane in LANES},
+            }
@@ -0,0 +1,288 @@
+import copy
+import heapq
+import logging
+import threading
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+
+from django.utils import timezone
+
+from main.metrics import cache_lookup
+from main.models import Event
+from main.pagination import PAGE_PREV, decode_cursor
+from main.routers import primary_reads
+
+logger = logging.getLogger(__name__)
+
+
+def pair_name(event_type, category):
+    """Имя поколения шины для списка мероприятий типа и категории"""
+    return f"events_{event_type}_{category}"
+
+
+def _key(event):
+    return event.date_time, event.id
+
+
+def _add(events, pairs, channels, event):
+    events[event.id] = event
+    insort(pairs.setdefault((event.event_type, event.category), []), _key(event))
+    if event.is_private and event.channel_id is not None:
+        insort(channels.setdefault(event.channel_id, []), _key(event))
+
+
+class EventIndex:
+    """Предстоящие мероприятия в памяти процесса бота.
+
+    Для каждой пары (тип, категория) и для приватных мероприятий каждого
+    канала хранится список ключей (date_time, id), отсортированный по
+    времени; страницы выбираются бинарным поиском. Изменения в этом же
+    процессе применяются по сигналам сохранения и удаления, изменения из
+    других процессов - перезагрузкой только затронутой пары, о которой
+    сообщает шина инвалидации. Начавшиеся мероприятия не попадают в выдачу
+    (нижняя граница - текущее время) и удаляются из памяти sweep().
+
+    Запросы к БД и построение новых списков идут вне блокировки чтения:
+    пока один поток перезагружает индекс, остальные читают прежнее
+    содержимое, а не ждут его.
+    """
+
+    def __init__(self, bus=None, root_name="events"):
+        self.bus = bus
+        self.root_name = root_name
+        self._lock = threading.Lock()
+        # Загрузка из БД: выполняет один поток
+        self._sync_lock = threading.Lock()
+        self._events = {}
+        self._pairs = {}
+        self._channels = {}
+        self._generations = {}
+        self._loaded = False
+        # Увеличивается при каждом изменении содержимого индекса
+        self._version = 0
+
+    # Чтение
+
+    def upcoming(self, event_type, category):
+        """Все предстоящие мероприятия типа и категории"""
+        self._lookup()
+        with self._lock:
+            keys = self._pairs.get((event_type, category), [])
+            return [self._events[event_id] for _, event_id in keys[self._lower(keys):]]
+
+    def channel_events(self, channel_id):
+        """Предстоящие приватные мероприятия канала"""
+        self._lookup()
+        with self._lock:
+            keys = self._channels.get(int(channel_id), [])
+            return [self._events[event_id] for _, event_id in keys[self._lower(keys):]]
+
+    def page(self, listing, cursor=None, direction=None, page_size=10, exclude=()):
+        """Страница списка (как fetch_page): (мероприятия, есть_предыдущая, есть_следующая)"""
+        self._lookup()
+        with self._lock:
+            pair = (listing["event_type"], listing["category"])
+            if listing["kind"] == "private":
+                keys = self._channels.get(int(listing["channel_id"]), [])
+            else:
+                keys = self._pairs.get(pair, [])
+            lower = self._lower(keys)
+
+            def visible(event_id):
+                event = self._events[event_id]
+                return event_id not in exclude and (event.event_type, event.category) == pair
+
+            rows = []
+            if direction == PAGE_PREV and cursor is not None:
+                position = bisect_left(keys, decode_cursor(cursor))
+                for _, event_id in reversed(keys[lower:position]):
+                    if visible(event_id):
+                        rows.append(self._events[event_id])
+                        if len(rows) > page_size:
+                            break
+            else:
+                position = bisect_right(keys, decode_cursor(cursor)) if cursor is not None else lower
+                for _, event_id in keys[max(position, lower):]:
+                    if visible(event_id):
+                        rows.append(self._events[event_id])
+                        if len(rows) > page_size:
+                            break
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if cursor is None:
+            return rows, False, has_more
+        if direction == PAGE_PREV:
+            return rows[::-1], has_more, True
+        return rows, True, has_more
+
+    def public(self, event_type=None, category=None, limit=None):
+        """Предстоящие публичные мероприятия по времени; None - любой тип или категория"""
+        self._lookup()
+        with self._lock:
+            lists = [
+                islice(keys, self._lower(keys), None)
+                for (pair_type, pair_category), keys in self._pairs.items()
+                if event_type in (None, pair_type) and category in (None, pair_category)
+            ]
+            events = (self._events[event_id] for _, event_id in heapq.merge(*lists))
+            return list(islice((event for event in events if not event.is_private), limit))
+
+    def version(self):
+        """Версия содержимого (после подгрузки изменений): меняется при любом изменении мероприятий"""
+        self._lookup()
+        with self._lock:
+            return self._version
+
+    def size(self):
+        """Число мероприятий в памяти"""
+        with self._lock:
+            return len(self._events)
+
+    @staticmethod
+    def _lower(keys):
+        # Первое мероприятие, которое ещё не началось
+        return bisect_left(keys, (timezone.now(),))
+
+    # Изменения
+
+    def upsert(self, event):
+        """Добавление или обновление мероприятия (по сигналу post_save)"""
+        with self._lock:
+            if not self._loaded:
+                return
+            self._remove(event.id)
+            if event.date_time >= timezone.now():
+                self._insert(copy.copy(event))
+            self._version += 1
+
+    def remove(self, event_id):
+        """Удаление мероприятия (по сигналу post_delete)"""
+        with self._lock:
+            self._remove(event_id)
+            self._version += 1
+
+    def sweep(self):
+        """Удаление из памяти начавшихся мероприятий; возвращает их число"""
+        removed = 0
+        with self._lock:
+            for index in (self._pairs, self._channels):
+                for keys in index.values():
+                    del keys[:self._lower(keys)]
+            for event_id in [event_id for event_id, event in self._events.items()
+                             if event.date_time < timezone.now()]:
+                del self._events[event_id]
+                removed += 1
+        if removed:
+            logger.info("Evicted %s past events from the index", removed)
+        return removed
+
+    def clear(self):
+        """Сброс индекса: следующее чтение загрузит его заново"""
+        with self._lock:
+            self._events, self._pairs, self._channels = {}, {}, {}
+            self._loaded = False
+
+    def _insert(self, event):
+        _add(self._events, self._pairs, self._channels, event)
+
+    def _remove(self, event_id):
+        event = self._events.pop(event_id, None)
+        if event is None:
+            return
+        key = _key(event)
+        lists = [self._pairs.get((event.event_type, event.category))]
+        if event.is_private and event.channel_id is not None:
+            lists.append(self._channels.get(event.channel_id))
+        for keys in lists:
+            if keys:
+                position = bisect_left(keys, key)
+                if position < len(keys) and keys[position] == key:
+                    del keys[position]
+
+    # Синхронизация с БД
+
+    def _generation_names(self):
+        return [self.root_name] + [
+            pair_name(event_type, category)
+            for event_type, _ in Event.EVENT_TYPE_CHOICES
+            for category, _ in Event.CATEGORY_CHOICES
+        ]
+
+    def _lookup(self):
+        # Промах - чтение, которому пришлось загрузить данные из БД
+        cache_lookup("event_index", not self._sync())
+
+    def _sync(self):
+        """Подгрузка изменений; True, если что-то читалось из БД"""
+        current = None
+        if self.bus is not None:
+            current = {name: self.bus.generation(name) for name in self._generation_names()}
+        if not self._changes(current):
+            return False
+        # Загруженный индекс не ждёт чужую загрузку: читается прежнее содержимое
+        if not self._sync_lock.acquire(blocking=not self._loaded):
+            return False
+        try:
+            # Пока ждали, загрузку мог выполнить другой поток
+            changes = self._changes(current)
+            if changes is True:
+                self._load(current)
+            else:
+                for event_type, category in changes:
+                    self._load_pair(event_type, category, current)
+            return bool(changes)
+        finally:
+            self._sync_lock.release()
+
+    def _changes(self, current):
+        """Что перечитать из БД: True - всё, иначе список пар (тип, категория)"""
+        with self._lock:
+            if not self._loaded:
+                return True
+            if current is None:
+                return []
+            if current[self.root_name] != self._generations.get(self.root_name):
+                return True
+            return [
+                (event_type, category)
+                for event_type, _ in Event.EVENT_TYPE_CHOICES
+                for category, _ in Event.CATEGORY_CHOICES
+                if current[pair_name(event_type, category)] != self._generations.get(pair_name(event_type, category))
+            ]
+
+    def _load(self, generations=None):
+        # Новые структуры строятся отдельно и подменяют старые целиком:
+        # загрузка, прерванная ошибкой, не оставляет индекс пустым
+        events, pairs, channels = {}, {}, {}
+        # Поколения читаются с основной БД - данные оттуда же
+        with primary_reads():
+            for event in Event.objects.filter(date_time__gte=timezone.now()).order_by("date_time", "id"):
+                _add(events, pairs, channels, event)
+        with self._lock:
+            self._events, self._pairs, self._channels = events, pairs, channels
+            if generations is not None:
+                self._generations = dict(generations)
+            self._loaded = True
+            self._version += 1
+        logger.info("Loaded %s upcoming events into the index", len(events))
+
+    def _load_pair(self, event_type, category, generations=None):
+        with primary_reads():
+            events = list(Event.objects.filter(
+                event_type=event_type,
+                category=category,
+                date_time__gte=timezone.now()
+            ).order_by("date_time", "id"))
+        with self._lock:
+            for _, event_id in list(self._pairs.get((event_type, category), [])):
+                self._remove(event_id)
+            for event in events:
+                # Мероприятие могло перейти из другой пары
+                self._remove(event.id)
+                self._insert(event)
+            if generations is not None:
+                name = pair_name(event_type, category)
+                self._generations[name] = generations[name]
+            self._version += 1
+        logger.info("Reloaded %s %s events in the index", event_type, category)
@@ -0,0 +1,313 @@
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+logger = logging.getLogger(__name__)
+
+METHOD_PATH = re.compile(r"^/bot[^/]+/(\w+)$")
+# Методы, ответ на которые завершает обработку нажатия (сообщение с клавиатурой)
+REPLY_METHODS = ("sendMessage", "editMessageText", "editMessageReplyMarkup")
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+
+class FakeBotAPI:
+    """Локальная замена Telegram Bot API для нагрузочных тестов.
+
+    Реализует getUpdates (long polling), sendMessage, deleteMessage,
+    editMessageText, editMessageReplyMarkup и answerCallbackQuery; на прочие
+    методы отвечает успехом. Добавляет задержку и случайные ответы 429.
+    Бот подключается к серверу через TELEGRAM_API_URL.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._updates_ready = threading.Condition(self._lock)
+        self._outbound_ready = threading.Condition(self._lock)
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._outbound = {}
+        self.method_counts = {}
+        self.rate_limited = 0
+        self.server = None
+
+    # HTTP-сервер
+
+    def start(self, host="127.0.0.1", port=8081):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                api.handle_http(self)
+
+            do_POST = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info("Fake Bot API listening on http://%s:%s", host, self.server.server_port)
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    @property
+    def api_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def handle_http(self, request):
+        url = urlparse(request.path)
+        match = METHOD_PATH.match(url.path)
+        if not match:
+            return self.respond(request, 404, {"ok": False, "error_code": 404, "description": "Not Found"})
+        params = dict(parse_qsl(url.query))
+        length = int(request.headers.get("Content-Length") or 0)
+        if length:
+            body = request.rfile.read(length).decode("utf-8")
+            if request.headers.get("Content-Type", "").startswith("application/json"):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_qsl(body))
+        status, payload = self.call(match.group(1), params)
+        self.respond(request, status, payload)
+
+    @staticmethod
+    def respond(request, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    # Методы Bot API
+
+    def call(self, method, params):
+        with self._lock:
+            self.method_counts[method] = self.method_counts.get(method, 0) + 1
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": self.get_updates(params)}
+        if method == "getMe":
+            return 200, {"ok": True, "result": BOT_USER}
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            with self._lock:
+                self.rate_limited += 1
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+
+        if method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            chat_id = int(params.get("chat_id", 0))
+            if method == "sendMessage":
+                message_id = next(self._message_ids)
+            else:
+                message_id = int(params.get("message_id", 0))
+            markup = params.get("reply_markup")
+            if isinstance(markup, str):
+                markup = json.loads(markup)
+            self.record(chat_id, method, params.get("text"), markup, message_id)
+            return 200, {"ok": True, "result": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }}
+        return 200, {"ok": True, "result": True}
+
+    def get_updates(self, params):
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", 100))
+        timeout = float(params.get("timeout", 0))
+        deadline = time.monotonic() + timeout
+        with self._updates_ready:
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._updates_ready.wait(remaining)
+            return self._updates[:limit]
+
+    # Очередь входящих и журнал исходящих сообщений
+
+    def push_update(self, update):
+        """Постановка обновления в очередь getUpdates"""
+        with self._updates_ready:
+            update["update_id"] = next(self._update_ids)
+            self._updates.append(update)
+            self._updates_ready.notify_all()
+        return update
+
+    def new_update_id(self):
+        return next(self._update_ids)
+
+    def new_message_id(self):
+        return next(self._message_ids)
+
+    def record(self, chat_id, method, text, markup, message_id):
+        with self._outbound_ready:
+            self._outbound.setdefault(chat_id, []).append({
+                "at": time.monotonic(),
+                "method": method,
+                "text": text or "",
+                "markup": markup,
+                "message_id": message_id,
+            })
+            self._outbound_ready.notify_all()
+
+    def outbound_count(self, chat_id):
+        with self._lock:
+            return len(self._outbound.get(chat_id, ()))
+
+    def wait_reply(self, chat_id, since, timeout):
+        """Ожидание исходящего сообщения с клавиатурой после позиции since"""
+        deadline = time.monotonic() + timeout
+        with self._outbound_ready:
+            while True:
+                for message in self._outbound.get(chat_id, [])[since:]:
+                    if message["method"] in REPLY_METHODS and message["markup"]:
+                        return message
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._outbound_ready.wait(remaining)
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)]
+
+
+class LoadGenerator:
+    """Имитация N пользователей, которые кликают по меню бота"""
+
+    def __init__(self, api, users=10, duration=30.0, reply_timeout=10.0, webhook_url=None, webhook_secret=None,
+                 first_chat_id=10_000_000):
+        self.api = api
+        self.users = users
+        self.duration = duration
+        self.reply_timeout = reply_timeout
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.first_chat_id = first_chat_id
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.timeouts = 0
+        self.sent = 0
+
+    def run(self):
+        started = time.monotonic()
+        deadline = started + self.duration
+        threads = [
+            threading.Thread(target=self.user_loop, args=(self.first_chat_id + i, deadline), daemon=True)
+            for i in range(self.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        return {
+            "mode": "webhook" if self.webhook_url else "polling",
+            "users": self.users,
+            "elapsed": elapsed,
+            "updates": self.sent,
+            "handled": len(self.latencies),
+            "timeouts": self.timeouts,
+            "updates_per_second": len(self.latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(self.latencies, 0.50) * 1000,
+            "p95_ms": percentile(self.latencies, 0.95) * 1000,
+            "p99_ms": percentile(self.latencies, 0.99) * 1000,
+            "rate_limited": self.api.rate_limited,
+            "api_calls": dict(self.api.method_counts),
+        }
+
+    def user_loop(self, chat_id, deadline):
+        reply = None
+        while time.monotonic() < deadline:
+            update = self.next_update(chat_id, reply)
+            since = self.api.outbound_count(chat_id)
+            pushed_at = time.monotonic()
+            self.deliver(update)
+            reply = self.api.wait_reply(chat_id, since, self.reply_timeout)
+            with self._lock:
+                self.sent += 1
+                if reply is None:
+                    self.timeouts += 1
+                else:
+                    self.latencies.append(reply["at"] - pushed_at)
+
+    def next_update(self, chat_id, reply):
+        """Следующее действие: кнопка из последней клавиатуры, номер из списка или /start"""
+        user = {"id": chat_id, "is_bot": False, "first_name": "Load", "username": f"load{chat_id}"}
+        chat = {"id": chat_id, "type": "private"}
+        buttons = [
+            button["callback_data"]
+            for row in (reply or {}).get("markup", {}).get("inline_keyboard", [])
+            for button in row if "callback_data" in button
+        ] if reply else []
+        numbers = re.findall(r"^(\d+)\. ", reply["text"], re.MULTILINE) if reply else []
+
+        if numbers and random.random() < 0.5:
+            return {"message": {
+                "message_id": self.api.new_message_id(), "date": int(time.time()),
+                "chat": chat, "from": user, "text": random.choice(numbers),
+            }}
+        if buttons:
+            return {"callback_query": {
+                "id": str(random.getrandbits(48)), "chat_instance": str(chat_id), "from": user,
+                "data": random.choice(buttons),
+                "message": {
+                    "message_id": reply["message_id"], "date": int(time.time()),
+                    "chat": chat, "from": BOT_USER, "text": reply["text"],
+                },
+            }}
+        return {"message": {
+            "message_id": self.api.new_message_id(), "date": int(time.time()),
+            "chat": chat, "from": user, "text": "/start",
+        }}
+
+    def deliver(self, update):
+        if not self.webhook_url:
+            self.api.push_update(update)
+            return
+        update["update_id"] = self.api.new_update_id()
+        request = urllib.request.Request(
+            self.webhook_url,
+            data=json.dumps(update).encode("utf-8"),
+            headers={
+                "Content-Type": "application/json",
+                "X-Telegram-Bot-Api-Secret-Token": self.webhook_secret or "",
+            },
+        )
+        try:
+            urllib.request.urlopen(request, timeout=self.reply_timeout).close()
+        except OSError as e:
+            logger.warning("Webhook delivery failed: %s", e)
@@ -0,0 +1,136 @@
+import codecs
+import csv
+import logging
+import time
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from main.bot_handlers import invalidate_event_cache
+from main.models import Event, TelegramChannel
+
+logger = logging.getLogger(__name__)
+
+# Колонки CSV: name, location, address, event_type, category, date_time,
+# details, link_2gis, is_private[, channel_name]
+MIN_COLUMNS = 9
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class ImportResult:
+    """Итоги импорта: число созданных мероприятий, ошибки и скорость"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+        self.warnings = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class EventCSVImporter:
+    """Потоковый импорт мероприятий из CSV.
+
+    Файл читается построчно, каналы загружаются одним запросом, строки
+    проверяются до записи и сохраняются через bulk_create пачками в одной
+    транзакции. bulk_create не отправляет post_save, поэтому кэш
+    инвалидируется один раз для затронутых пар (тип, категория).
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.event_types = {choice for choice, _ in Event.EVENT_TYPE_CHOICES}
+        self.categories = {choice for choice, _ in Event.CATEGORY_CHOICES}
+
+    def run(self, csv_file):
+        result = ImportResult()
+        started = time.monotonic()
+        channels = dict(TelegramChannel.objects.values_list('name', 'id'))
+        affected = set()
+        batch = []
+
+        reader = csv.reader(codecs.iterdecode(csv_file, 'utf-8-sig'))
+        next(reader, None)  # Skip header row
+
+        with transaction.atomic():
+            for line_number, row in enumerate(reader, start=2):
+                if not any(cell.strip() for cell in row):
+                    continue
+                result.rows += 1
+                try:
+                    event = self.build_event(row, channels, result, line_number)
+                except ValueError as e:
+                    result.errors.append(f"Row {line_number}: {e}")
+                    continue
+                batch.append(event)
+                affected.add((event.event_type, event.category))
+                if len(batch) >= self.batch_size:
+                    result.created += self.flush(batch)
+            result.created += self.flush(batch)
+            transaction.on_commit(lambda: self.invalidate(affected))
+
+        result.elapsed = time.monotonic() - started
+        logger.info(
+            "CSV import: %s events from %s rows in %.2fs (%.0f rows/s), %s errors",
+            result.created, result.rows, result.elapsed, result.rows_per_second, len(result.errors)
+        )
+        return result
+
+    def build_event(self, row, channels, result, line_number):
+        """Проверка строки и создание несохранённого Event"""
+        if len(row) < MIN_COLUMNS:
+            raise ValueError(f"expected at least {MIN_COLUMNS} columns, got {len(row)}")
+        name, location, address, event_type, category = (cell.strip() for cell in row[:5])
+        if not name:
+            raise ValueError("name is empty")
+        if event_type not in self.event_types:
+            raise ValueError(f"unknown event_type '{event_type}'")
+        if category not in self.categories:
+            raise ValueError(f"unknown category '{category}'")
+        try:
+            date_time = timezone.make_aware(datetime.strptime(row[5].strip(), DATE_FORMAT))
+        except ValueError:
+            raise ValueError(f"invalid date_time '{row[5]}', expected {DATE_FORMAT}")
+        is_private = row[8].strip().lower() == 'true'
+
+        # Get channel if event is private and channel name is provided
+        channel_id = None
+        channel_name = row[9].strip() if len(row) > 9 else ''
+        if is_private and channel_name:
+            channel_id = channels.get(channel_name)
+            if channel_id is None:
+                result.warnings.append(
+                    f"Row {line_number}: channel '{channel_name}' not found for event '{name}'. "
+                    f"Event will be created without channel."
+                )
+
+        return Event(
+            name=name,
+            location=location,
+            address=address,
+            event_type=event_type,
+            category=category,
+            date_time=date_time,
+            details=row[6] or None,
+            link_2gis=row[7] or None,
+            is_private=is_private,
+            channel_id=channel_id
+        )
+
+    def flush(self, batch):
+        if not batch:
+            return 0
+        Event.objects.bulk_create(batch, batch_size=self.batch_size)
+        created = len(batch)
+        batch.clear()
+        return created
+
+    @staticmethod
+    def invalidate(affected):
+        for event_type, category in affected:
+            invalidate_event_cache(event_type, category)
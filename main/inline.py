@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.utils import timezone
+
+from main.metrics import cache_lookup
+from main.models import Event
+from main.search import query_words, search_events
+
+
+def _stems(choices):
+    # Слово запроса совпадает с вариантом, если это его значение ("concert")
+    # или оно начинается с названия без последней буквы ("концерты", "встречи")
+    return [(value, display.lower()[:-1]) for value, display in choices]
+
+
+EVENT_TYPE_STEMS = _stems(Event.EVENT_TYPE_CHOICES)
+CATEGORY_STEMS = _stems(Event.CATEGORY_CHOICES)
+
+
+def _match_choice(word, stems):
+    for value, stem in stems:
+        if word == value or word.startswith(stem):
+            return value
+    return None
+
+
+def normalize_query(text):
+    """(тип, категория, слова для поиска) из текста inline-запроса.
+
+    Слова, названные типом или категорией мероприятия, становятся фильтрами,
+    остальные - текстом полнотекстового поиска. Регистр, пунктуация и
+    лишние пробелы не влияют на результат.
+    """
+    event_type = category = None
+    words = []
+    for word in query_words(text):
+        value = _match_choice(word, EVENT_TYPE_STEMS) if event_type is None else None
+        if value is not None:
+            event_type = value
+            continue
+        value = _match_choice(word, CATEGORY_STEMS) if category is None else None
+        if value is not None:
+            category = value
+            continue
+        words.append(word)
+    return event_type, category, " ".join(words)
+
+
+class InlineResults:
+    """Результаты inline-запросов, запомненные по нормализованному запросу.
+
+    Запись живёт ttl секунд и устаревает раньше, если изменилась версия
+    индекса мероприятий (в этом или, через шину инвалидации, в другом
+    процессе). Одинаковые запросы, пришедшие одновременно, ждут одну
+    загрузку: популярный запрос стоит одного обращения к БД за ttl.
+    Без текста выдача берётся из индекса в памяти, с текстом - из FTS5.
+    """
+
+    def __init__(self, index, ttl=60, max_results=200, max_entries=1000, max_candidates=1000,
+                 name="inline_results"):
+        self.index = index
+        self.ttl = ttl
+        self.max_results = max_results
+        self.max_entries = max_entries
+        self.max_candidates = max_candidates
+        self.name = name
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._loading = {}
+
+    def get(self, text):
+        """(предстоящие мероприятия по запросу, сколько секунд ещё актуален результат)"""
+        key = normalize_query(text)
+        version = self.index.version()
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    cache_lookup(self.name, True)
+                    return self._upcoming(entry[2]), entry[1] - time.monotonic()
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # Тот же запрос уже загружается другим потоком
+            loading.wait()
+        cache_lookup(self.name, False)
+        try:
+            events = self._load(*key)
+            expires_at = time.monotonic() + self.ttl
+            with self._lock:
+                self._entries[key] = (version, expires_at, events)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+        return self._upcoming(events), float(self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        """Число запомненных запросов"""
+        with self._lock:
+            return len(self._entries)
+
+    def _load(self, event_type, category, words):
+        if not words:
+            return self.index.public(event_type, category, self.max_results)
+        events, _ = search_events(
+            words, 0, self.max_results, self.max_candidates, event_type=event_type, category=category
+        )
+        return events
+
+    @staticmethod
+    def _upcoming(events):
+        # Запомненная выдача могла устареть по времени: начавшиеся мероприятия не показываем
+        now = timezone.now()
+        return [event for event in events if event.date_time >= now]
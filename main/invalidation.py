@@ -0,0 +1,58 @@
+import logging
+import threading
+import time
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from main.models import CacheGeneration
+from main.routers import primary_reads
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBus:
+    """Шина инвалидации кэша между процессами через таблицу поколений.
+
+    Процесс, изменивший данные (обычно админка), увеличивает поколение
+    ключа в БД. Процессы бота сравнивают поколение, сохранённое рядом со
+    значением в кэше, с текущим. Снимок таблицы перечитывается не чаще
+    одного раза в poll_interval секунд, поэтому проверка при каждом
+    чтении почти бесплатна.
+    """
+
+    def __init__(self, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._snapshot = {}
+        self._refreshed_at = 0.0
+
+    def publish(self, *names):
+        """Увеличение поколения ключей (видно всем процессам после коммита)"""
+        with transaction.atomic():
+            for name in names:
+                # update() не применяет auto_now: время изменения задаётся явно
+                bump = {'generation': F('generation') + 1, 'updated_at': timezone.now()}
+                updated = CacheGeneration.objects.filter(name=name).update(**bump)
+                if not updated:
+                    _, created = CacheGeneration.objects.get_or_create(name=name, defaults={'generation': 1})
+                    if not created:
+                        CacheGeneration.objects.filter(name=name).update(**bump)
+        # Следующее чтение в этом процессе сразу увидит новое поколение
+        self._refreshed_at = 0.0
+        logger.info("Published cache invalidation for %s", ', '.join(names))
+
+    def generation(self, name):
+        """Текущее поколение ключа"""
+        if time.monotonic() - self._refreshed_at > self.poll_interval:
+            self.refresh()
+        return self._snapshot.get(name, 0)
+
+    def refresh(self):
+        # С основной БД, как и перезагрузки по поколениям (см. ReplicaRouter)
+        with primary_reads():
+            snapshot = dict(CacheGeneration.objects.values_list('name', 'generation'))
+        with self._lock:
+            self._snapshot = snapshot
+            self._refreshed_at = time.monotonic()
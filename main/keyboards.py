@@ -1,72 +1,204 @@
+import threading
+from functools import lru_cache
+
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from main.models import Event
+from main import callbacks
+from main.models import Event, TelegramChannel
+from main.pagination import PAGE_NEXT, PAGE_PREV
+from main.routers import primary_reads
 
-def main_menu_keyboard():
+# Клавиатуры возвращаются уже сериализованными в JSON (telebot передаёт строку
+# в reply_markup как есть): постоянные собираются один раз при импорте,
+# клавиатуры с параметрами запоминаются по аргументам
+
+EVENT_TYPE_NAMES = dict(Event.EVENT_TYPE_CHOICES)
+CATEGORY_NAMES = dict(Event.CATEGORY_CHOICES)
+# Сколько клавиатур с параметрами хранить для каждой функции
+MEMO_SIZE = 1024
+
+
+def _main_menu():
     markup = InlineKeyboardMarkup()
     markup.row(
-        InlineKeyboardButton("🌐 Онлайн", callback_data="event_type_online"),
-        InlineKeyboardButton("🏙 Оффлайн", callback_data="event_type_offline"),
-        InlineKeyboardButton("🔀 Гибрид", callback_data="event_type_hybrid")
+        InlineKeyboardButton("🌐 Онлайн", callback_data=callbacks.EVENT_TYPE.pack("online")),
+        InlineKeyboardButton("🏙 Оффлайн", callback_data=callbacks.EVENT_TYPE.pack("offline")),
+        InlineKeyboardButton("🔀 Гибрид", callback_data=callbacks.EVENT_TYPE.pack("hybrid"))
     )
     markup.row(
-        InlineKeyboardButton("📋 Мои мероприятия", callback_data="my_events"),
-        InlineKeyboardButton("🔒 Приватные", callback_data="private_events")
+        InlineKeyboardButton("📋 Мои мероприятия", callback_data=callbacks.MY_EVENTS.pack()),
+        InlineKeyboardButton("🔒 Приватные", callback_data=callbacks.PRIVATE_EVENTS.pack())
     )
-    return markup
+    return markup.to_json()
 
-def category_keyboard(event_type):
+def _category_menu(event_type):
     markup = InlineKeyboardMarkup()
     markup.row(
-        InlineKeyboardButton("🎶 Концерты", callback_data=f"category_{event_type}_concert"),
-        InlineKeyboardButton("💬 Встречи", callback_data=f"category_{event_type}_meeting")
+        InlineKeyboardButton("🎶 Концерты", callback_data=callbacks.CATEGORY.pack(event_type, "concert")),
+        InlineKeyboardButton("💬 Встречи", callback_data=callbacks.CATEGORY.pack(event_type, "meeting"))
     )
     markup.row(
-        InlineKeyboardButton("🏃 Марафоны", callback_data=f"category_{event_type}_marathon"),
-        InlineKeyboardButton("📚 Тренинги", callback_data=f"category_{event_type}_training")
+        InlineKeyboardButton("🏃 Марафоны", callback_data=callbacks.CATEGORY.pack(event_type, "marathon")),
+        InlineKeyboardButton("📚 Тренинги", callback_data=callbacks.CATEGORY.pack(event_type, "training"))
     )
-    return markup
+    return markup.to_json()
 
-def attendance_keyboard(event_id):
+def _single_button(text, callback_data):
     markup = InlineKeyboardMarkup()
-    markup.row(
-        InlineKeyboardButton("✅ Иду", callback_data=f"going_{event_id}")
-    )
-    markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_main"))
+    markup.add(InlineKeyboardButton(text, callback_data=callback_data))
+    return markup.to_json()
+
+MAIN_MENU = _main_menu()
+CATEGORY_MENUS = {event_type: _category_menu(event_type) for event_type in EVENT_TYPE_NAMES}
+BACK_TO_MAIN = _single_button("🔙 Назад", callbacks.BACK_MAIN.pack())
+MY_EVENTS = _single_button("📋 Мои мероприятия", callbacks.MY_EVENTS.pack())
+
+def main_menu_keyboard():
+    return MAIN_MENU
+
+def category_keyboard(event_type):
+    markup = CATEGORY_MENUS.get(event_type)
+    if markup is None:
+        markup = _category_menu(event_type)
     return markup
 
 def back_to_main_menu_keyboard():
-    markup = InlineKeyboardMarkup()
-    markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_main"))
-    return markup
+    return BACK_TO_MAIN
 
 def my_events_keyboard():
+    return MY_EVENTS
+
+@lru_cache(maxsize=MEMO_SIZE)
+def attendance_keyboard(event_id):
     markup = InlineKeyboardMarkup()
-    markup.add(InlineKeyboardButton("📋 Мои мероприятия", callback_data="my_events"))
-    return markup
+    markup.row(
+        InlineKeyboardButton("✅ Иду", callback_data=callbacks.GOING.pack(event_id))
+    )
+    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=callbacks.BACK_MAIN.pack()))
+    return markup.to_json()
 
-def my_events_category_keyboard(categories):
+@lru_cache(maxsize=MEMO_SIZE)
+def categories_keyboard(callback_type, categories, fields=(), back_callback=None):
+    """Кнопка на каждую категорию из кортежа categories (callback_type.pack(*fields, категория))"""
     markup = InlineKeyboardMarkup()
     for category in categories:
-        display = dict(Event.CATEGORY_CHOICES).get(category, category)
-        markup.add(InlineKeyboardButton(f"{display}", callback_data=f"my_cat_{category}"))
-    markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_main"))
-    return markup
+        markup.add(InlineKeyboardButton(
+            CATEGORY_NAMES.get(category, category),
+            callback_data=callback_type.pack(*fields, category)
+        ))
+    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=back_callback or callbacks.BACK_MAIN.pack()))
+    return markup.to_json()
+
+def my_events_category_keyboard(categories):
+    return categories_keyboard(callbacks.MY_CATEGORY, tuple(categories))
 
+@lru_cache(maxsize=MEMO_SIZE)
 def my_event_actions_keyboard(event_id):
     markup = InlineKeyboardMarkup()
     markup.row(
         # InlineKeyboardButton("🎫 Купить билет", callback_data=f"buy_ticket_{event_id}"),
-        InlineKeyboardButton("❌ Отменить участие", callback_data=f"cancel_attendance_{event_id}")
+        InlineKeyboardButton("❌ Отменить участие", callback_data=callbacks.CANCEL_ATTENDANCE.pack(event_id))
     )
-    markup.add(InlineKeyboardButton("🔙 Назад", callback_data="my_events"))
-    return markup
+    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=callbacks.MY_EVENTS.pack()))
+    return markup.to_json()
 
 def private_channels_keyboard(channels):
     markup = InlineKeyboardMarkup()
     for channel in channels:
-        markup.add(InlineKeyboardButton(f"{channel.name}", callback_data=f"private_channel_{channel.id}"))
-    markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_main"))
-    return markup
+        markup.add(InlineKeyboardButton(f"{channel.name}", callback_data=callbacks.PRIVATE_CHANNEL.pack(channel.id)))
+    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=callbacks.BACK_MAIN.pack()))
+    return markup.to_json()
+
+@lru_cache(maxsize=MEMO_SIZE)
+def private_types_keyboard(channel_id, event_types):
+    """Типы мероприятий приватного канала"""
+    markup = InlineKeyboardMarkup()
+    for event_type in event_types:
+        display = EVENT_TYPE_NAMES.get(event_type, event_type)
+        markup.add(InlineKeyboardButton(display, callback_data=callbacks.PRIVATE_TYPE.pack(channel_id, event_type)))
+    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=callbacks.BACK_MAIN.pack()))
+    return markup.to_json()
+
+def private_categories_keyboard(channel_id, event_type, categories):
+    """Категории мероприятий типа event_type в приватном канале"""
+    return categories_keyboard(
+        callbacks.PRIVATE_CATEGORY,
+        tuple(categories),
+        fields=(channel_id, event_type),
+        back_callback=callbacks.PRIVATE_CHANNEL.pack(channel_id)
+    )
+
+@lru_cache(maxsize=MEMO_SIZE)
+def events_page_keyboard(prev_cursor=None, next_cursor=None, back_callback=None):
+    markup = InlineKeyboardMarkup()
+    buttons = []
+    if prev_cursor:
+        buttons.append(InlineKeyboardButton("⬅️ Предыдущие", callback_data=callbacks.PAGE.pack(PAGE_PREV, prev_cursor)))
+    if next_cursor:
+        buttons.append(InlineKeyboardButton("Следующие ➡️", callback_data=callbacks.PAGE.pack(PAGE_NEXT, next_cursor)))
+    if buttons:
+        markup.row(*buttons)
+    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=back_callback or callbacks.BACK_MAIN.pack()))
+    return markup.to_json()
+
+@lru_cache(maxsize=MEMO_SIZE)
+def search_page_keyboard(prev_offset=None, next_offset=None):
+    """Страницы результатов поиска (None - нет страницы)"""
+    markup = InlineKeyboardMarkup()
+    buttons = []
+    if prev_offset is not None:
+        buttons.append(InlineKeyboardButton("⬅️ Предыдущие", callback_data=callbacks.SEARCH_PAGE.pack(prev_offset)))
+    if next_offset is not None:
+        buttons.append(InlineKeyboardButton("Следующие ➡️", callback_data=callbacks.SEARCH_PAGE.pack(next_offset)))
+    if buttons:
+        markup.row(*buttons)
+    markup.add(InlineKeyboardButton("🔙 Назад", callback_data=callbacks.BACK_MAIN.pack()))
+    return markup.to_json()
+
+
+class ChannelsKeyboard:
+    """Клавиатура списка приватных каналов, собранная один раз.
+
+    Сбрасывается при сохранении или удалении TelegramChannel; в других
+    процессах - по поколению name в шине инвалидации.
+    """
+
+    def __init__(self, bus=None, name="channels"):
+        self.bus = bus
+        self.name = name
+        self._lock = threading.Lock()
+        self._markup = None
+        self._loaded = False
+        self._version = 0
+        self._generation = None
+
+    def get(self):
+        """JSON клавиатуры или None, если каналов нет"""
+        self._sync()
+        with self._lock:
+            if self._loaded:
+                return self._markup
+            version = self._version
+        # Сбрасывается по поколению шины: читаем с основной БД
+        with primary_reads():
+            channels = list(TelegramChannel.objects.only("id", "name").order_by("id"))
+        markup = private_channels_keyboard(channels) if channels else None
+        with self._lock:
+            # Сброс во время чтения: прочитанное могло устареть, не сохраняем
+            if version == self._version:
+                self._markup, self._loaded = markup, True
+        return markup
 
+    def invalidate(self):
+        with self._lock:
+            self._markup, self._loaded = None, False
+            self._version += 1
 
+    def _sync(self):
+        if self.bus is None:
+            return
+        generation = self.bus.generation(self.name)
+        if generation != self._generation:
+            if self._generation is not None:
+                self.invalidate()
+            self._generation = generation
@@ -0,0 +1,109 @@
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Очередь может быть заполнена: ждём места, чтобы поток записи точно остановился
+        self.queue.put(self._sentinel)
+
+
+class BackgroundHandler(QueueHandler):
+    """Запись логов в фоновом потоке.
+
+    Рабочий поток только кладёт запись в очередь: подстановка аргументов,
+    форматирование и запись в поток вывода выполняются потоком записи.
+    Поэтому аргументы записи не должны меняться после вызова логгера
+    (состояния и id сообщений - копии и примитивы). При переполнении
+    очереди записи ниже WARNING отбрасываются, а не блокируют обработчик.
+    """
+
+    def __init__(self, stream=None, max_queue=10000):
+        super().__init__(queue.Queue(max_queue))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self.listener = _Listener(self.queue, self.target)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Форматирование откладывается до потока записи
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+            self.queue.put(record)
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            if self.dropped:
+                self.target.handle(logging.makeLogRecord({
+                    'name': __name__,
+                    'levelno': logging.WARNING,
+                    'levelname': 'WARNING',
+                    'msg': 'Dropped %d log records because the log queue was full',
+                    'args': (self.dropped,),
+                }))
+            self.target.close()
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """Выборка для частых записей: доля sample_rate и не больше per_second в секунду.
+
+    Записи уровня WARNING и выше проходят всегда.
+    """
+
+    def __init__(self, sample_rate=1.0, per_second=None, name=''):
+        super().__init__(name)
+        self.sample_rate = sample_rate
+        self.per_second = per_second
+        self._lock = threading.Lock()
+        self._tokens = per_second or 0
+        self._updated = time.monotonic()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return False
+        if not self.per_second:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.per_second, self._tokens + (now - self._updated) * self.per_second)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - один JSON-объект в строке"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
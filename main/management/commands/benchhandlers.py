@@ -0,0 +1,206 @@
+import logging
+import statistics
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from telebot.types import CallbackQuery
+
+from main import bot_handlers as handlers
+from main import callbacks
+from main.benchmark import StubBotAPI, make_message, make_callback, make_inline_query, create_dataset
+from main.models import Event
+from main.pagination import PAGE_NEXT, encode_cursor
+
+BENCH_TELEGRAM_ID = 777000
+
+# Бюджет SQL-запросов на один вызов обработчика при холодном кэше Django
+# (индекс мероприятий, кэш telegram_id -> pk и клавиатура каналов живут весь процесс
+# и уже прогреты).
+# Не зависит от размера данных: рост числа запросов вместе с данными - N+1.
+QUERY_BUDGETS = {
+    "start": 1,
+    "select_event_type": 0,
+    "select_category": 1,
+    "paginate_events": 1,
+    "handle_event_number": 2,
+    "mark_attendance": 7,
+    "show_my_events_categories": 1,
+    "show_my_category_events": 1,
+    "handle_cancel_attendance": 4,
+    "show_private_channels": 0,
+    "show_private_channel_events": 2,
+    "show_private_type_categories": 1,
+    "show_private_category_events": 2,
+    "search_command": 1,
+    "paginate_search": 1,
+    "fallback_handler": 1,
+    "inline_events": 1,
+    "back_to_main": 0,
+}
+
+
+def scenario(user, channel):
+    """Проход пользователя по меню: (обработчик, фабрика входящего объекта, ожидаемый текст).
+
+    Ожидаемый текст подтверждает, что шаг прошёл основной путь, а не ответ
+    об ошибке, пустой странице или номере вне списка.
+    """
+    user_id = BENCH_TELEGRAM_ID
+    # Публичное мероприятие, на которое пользователь ещё не записан: запись
+    # создаётся, а не упирается в существующую
+    event_id = Event.objects.filter(
+        event_type="online", category="concert", is_private=False
+    ).exclude(attendance__user=user).order_by("date_time", "id").values_list("id", flat=True).first()
+
+    def first_page_cursor():
+        events = Event.objects.filter(event_type="online", category="concert").order_by("date_time", "id")
+        last = events[handlers.PAGE_SIZE - 1:handlers.PAGE_SIZE].first() or events.last()
+        return encode_cursor(last)
+
+    return [
+        ("start", lambda: make_message("/start", user_id), "С возвращением"),
+        ("select_event_type", lambda: make_callback(callbacks.EVENT_TYPE.pack("online"), user_id),
+         "Выберите категорию"),
+        ("select_category", lambda: make_callback(callbacks.CATEGORY.pack("online", "concert"), user_id),
+         "Доступные concert мероприятия"),
+        # Вторая страница: нумерация продолжается
+        ("paginate_events", lambda: make_callback(callbacks.PAGE.pack(PAGE_NEXT, first_page_cursor()), user_id),
+         f"\n{handlers.PAGE_SIZE + 1}. "),
+        # Карточка мероприятия
+        ("handle_event_number", lambda: make_message(str(handlers.PAGE_SIZE + 1), user_id), "📍 Location, Address"),
+        ("mark_attendance", lambda: make_callback(callbacks.GOING.pack(event_id), user_id), "Ты отметил"),
+        ("show_my_events_categories", lambda: make_callback(callbacks.MY_EVENTS.pack(), user_id),
+         "Выберите категорию ваших мероприятий"),
+        ("show_my_category_events", lambda: make_callback(callbacks.MY_CATEGORY.pack("concert"), user_id),
+         "Ваши мероприятия в категории"),
+        ("handle_cancel_attendance", lambda: make_callback(callbacks.CANCEL_ATTENDANCE.pack(event_id), user_id),
+         "Ты отменил"),
+        ("show_private_channels", lambda: make_callback(callbacks.PRIVATE_EVENTS.pack(), user_id),
+         "Выберите приватный канал"),
+        ("show_private_channel_events", lambda: make_callback(callbacks.PRIVATE_CHANNEL.pack(channel.id), user_id),
+         "Выбери тип мероприятия в канале"),
+        ("show_private_type_categories", lambda: make_callback(callbacks.PRIVATE_TYPE.pack(channel.id, "online"), user_id),
+         "Выбери категорию мероприятий"),
+        ("show_private_category_events",
+         lambda: make_callback(callbacks.PRIVATE_CATEGORY.pack(channel.id, "online", "concert"), user_id),
+         "Мероприятия канала"),
+        ("search_command", lambda: make_message("/search Event", user_id), "Найдено по запросу"),
+        ("paginate_search", lambda: make_callback(callbacks.SEARCH_PAGE.pack(handlers.PAGE_SIZE), user_id),
+         f"\n{handlers.PAGE_SIZE + 1}. "),
+        # Свободный текст - поиск
+        ("fallback_handler", lambda: make_message("Event 5", user_id), "Найдено по запросу «Event 5»"),
+        # Первый вызов - промах запомненной выдачи, дальше - из памяти
+        ("inline_events", lambda: make_inline_query("онлайн концерты Event", user_id), '"type": "article"'),
+        ("back_to_main", lambda: make_callback(callbacks.BACK_MAIN.pack(), user_id), "Выберите тип мероприятия"),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark bot handlers on synthetic data and fail on query budget regressions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000',
+                            help='Comma-separated numbers of events to benchmark with')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed runs per handler (the first, cold run is used for query counts)')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database between runs')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size]
+        if options['verbosity'] < 2:
+            # Построчные INFO-логи обработчиков заглушают таблицу результатов
+            logging.getLogger('main').setLevel(logging.WARNING)
+        if not handlers.bot.token:
+            # Запросы всё равно не уходят в сеть, но telebot требует токен
+            handlers.bot.token = "0:bench"
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with StubBotAPI() as api:
+                results = [row for size in sizes for row in self.run_size(size, options['repeat'], api)]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        self.report(results)
+        failures = [
+            f"{row['handler']} (size {row['size']}): {row['queries']} queries, budget {row['budget']}"
+            for row in results if row['queries'] > row['budget']
+        ] + [
+            f"{row['handler']} (size {row['size']}): {row['errors'][0]}"
+            for row in results if row['errors']
+        ]
+        if failures:
+            raise CommandError("Handler regressions:\n" + "\n".join(failures))
+
+    def run_size(self, size, repeat, api):
+        # У списка online/concert должна быть вторая страница, иначе шаги
+        # пагинации и выбора номера проходят ветку "больше нет"
+        user, channel = create_dataset(size, BENCH_TELEGRAM_ID, min_per_list=handlers.PAGE_SIZE + 1)
+        # В таблице - фактическое число мероприятий (с добавленными)
+        size = Event.objects.count()
+        # Индекс мероприятий загружается один раз на процесс: замеряем уже загруженный
+        handlers.event_index.clear()
+        handlers.event_index.upcoming("online", "concert")
+        # Пользователи пересозданы: их pk в кэше telegram_id -> pk устарели
+        handlers.user_resolver.invalidate()
+        # Каналы пересозданы: клавиатура списка каналов собирается заново и дальше берётся из памяти
+        handlers.channels_keyboard.invalidate()
+        handlers.channels_keyboard.get()
+        steps = scenario(user, channel)
+        samples = {name: [] for name, _, _ in steps}
+        rows = {}
+        for iteration in range(repeat):
+            for name, make_update, expected in steps:
+                update = make_update()
+                # Нажатия идут через маршрутизатор (разбор callback_data), сообщения - напрямую
+                if isinstance(update, CallbackQuery):
+                    handler = handlers.callback_router.dispatch
+                else:
+                    handler = getattr(handlers, name)
+                # Холодный кэш и свежий снимок поколений: считаем запросы самого обработчика
+                cache.clear()
+                handlers.invalidation_bus.refresh()
+                api.reset()
+                tracemalloc.start()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    handler(update)
+                    elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                samples[name].append(elapsed)
+                if iteration == 0:
+                    calls = api.reset()
+                    errors = api.errors(calls)
+                    texts = api.texts(calls)
+                    if not errors and not any(expected in text for text in texts):
+                        errors = [f"expected {expected!r} in the reply, got {texts!r:.300}"]
+                    rows[name] = {
+                        'handler': name,
+                        'size': size,
+                        'queries': len(queries),
+                        'budget': QUERY_BUDGETS[name],
+                        'api_calls': len(calls),
+                        'peak_kib': peak / 1024,
+                        'errors': errors,
+                    }
+        for name, row in rows.items():
+            row['median_ms'] = statistics.median(samples[name]) * 1000
+        return list(rows.values())
+
+    def report(self, results):
+        self.stdout.write(f"{'handler':32} {'size':>7} {'queries':>7} {'budget':>6} {'api':>4} {'median ms':>10} {'peak KiB':>9}")
+        for row in results:
+            line = (
+                f"{row['handler']:32} {row['size']:>7} {row['queries']:>7} {row['budget']:>6} "
+                f"{row['api_calls']:>4} {row['median_ms']:>10.2f} {row['peak_kib']:>9.1f}"
+            )
+            if row['queries'] > row['budget'] or row['errors']:
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
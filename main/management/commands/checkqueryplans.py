@@ -0,0 +1,95 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from main.bot_handlers import listing_queryset
+from main.models import User, Event, Attendance, TelegramChannel, CacheGeneration
+from main.pagination import page_queryset, encode_cursor
+from main.reminders import ReminderScheduler
+
+# Полный просмотр таблицы: SQLite "SCAN <table>" без индекса, PostgreSQL "Seq Scan"
+FULL_SCAN_PATTERNS = [
+    re.compile(r"\bSCAN (?!CONSTANT ROW)(\S+)$"),
+    re.compile(r"\bSeq Scan on (\S+)"),
+]
+
+
+def handler_queries():
+    """Запросы горячих путей бота: (название, queryset, допустим ли полный просмотр)"""
+    now = timezone.now()
+    user = User(id=1, telegram_id="1")
+    cursor = encode_cursor(Event(id=1, date_time=now))
+    browse = {"kind": "category", "event_type": "online", "category": "concert"}
+    private = {"kind": "private", "event_type": "online", "category": "concert", "channel_id": 1, "channel_name": ""}
+    mine = {"kind": "my", "category": "concert"}
+
+    return [
+        ("user_resolver: lookup", User.objects.filter(telegram_id="1").values_list("pk", "is_admin"), False),
+        ("select_category: first page", page_queryset(listing_queryset(browse, user.pk)), False),
+        ("select_category: next page", page_queryset(listing_queryset(browse, user.pk), cursor), False),
+        ("select_category: prev page", page_queryset(listing_queryset(browse, user.pk), cursor, "prev"), False),
+        ("show_my_category_events: page", page_queryset(listing_queryset(mine, user.pk), cursor), False),
+        ("show_private_category_events: page", page_queryset(listing_queryset(private, user.pk), cursor), False),
+        ("event index: load", Event.objects.filter(date_time__gte=now).order_by("date_time", "id"), False),
+        ("event index: pair reload", Event.objects.filter(
+            event_type="online",
+            category="concert",
+            date_time__gte=now
+        ).order_by("date_time", "id"), False),
+        ("get_cached_user_events", Event.objects.filter(
+            attendance__user__telegram_id="1",
+            attendance__status="going",
+            date_time__gte=now
+        ).order_by("date_time"), False),
+        ("attending_event_ids", Attendance.objects.filter(
+            user_id=1,
+            status="going"
+        ).values_list("event_id", flat=True), False),
+        ("handle_event_number: event", Event.objects.filter(id=1), False),
+        ("handle_event_number: attendance", Attendance.objects.filter(user_id=1, event_id=1), False),
+        ("mark_attendance / cancel_attendance", Attendance.objects.filter(user=user, event_id=1), False),
+        ("reminders: due events", ReminderScheduler(None).due_events(now, 60, 1440), False),
+        ("reminders: attendee batch", Attendance.objects.filter(
+            event_id=1,
+            status="going",
+            id__gt=0
+        ).order_by("id").values_list("id", "user_id", "user__telegram_id")[:200], False),
+        # Список каналов показывается целиком, таблица маленькая
+        ("show_private_channels", TelegramChannel.objects.all(), True),
+        # Снимок поколений кэша читается целиком, в таблице десятки строк
+        ("invalidation bus refresh", CacheGeneration.objects.values_list("name", "generation"), True),
+    ]
+
+
+def full_scans(plan):
+    tables = []
+    for line in plan.splitlines():
+        for pattern in FULL_SCAN_PATTERNS:
+            match = pattern.search(line.strip())
+            if match:
+                tables.append(match.group(1))
+    return tables
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on every bot handler query and fail on full table scans'
+
+    def handle(self, *args, **options):
+        failures = []
+        for name, queryset, allow_scan in handler_queries():
+            plan = queryset.explain()
+            scans = full_scans(plan)
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{name}:\n{plan}\n")
+            if scans and not allow_scan:
+                failures.append(f"{name}: full scan of {', '.join(scans)}")
+                self.stdout.write(self.style.ERROR(f"FAIL {name}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok   {name}"))
+
+        if failures:
+            raise CommandError(
+                f"{len(failures)} queries do full table scans on {connection.vendor}:\n" + "\n".join(failures)
+            )
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from event_bot import settings
+from main.fake_api import FakeBotAPI, LoadGenerator
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake Bot API and simulate users clicking through the bot menus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--users', type=int, default=20, help='Concurrent simulated users')
+        parser.add_argument('--duration', type=float, default=30.0, help='Test duration in seconds')
+        parser.add_argument('--warmup', type=float, default=2.0,
+                            help='Seconds to wait for the bot to connect before starting')
+        parser.add_argument('--latency-ms', type=float, default=0.0, help='Added latency per API call')
+        parser.add_argument('--jitter-ms', type=float, default=0.0, help='Random extra latency per API call')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of API calls answered with 429')
+        parser.add_argument('--retry-after', type=int, default=1, help='retry_after sent with 429 answers')
+        parser.add_argument('--reply-timeout', type=float, default=10.0)
+        parser.add_argument('--webhook-url', help='Deliver updates to this webhook instead of getUpdates')
+        parser.add_argument('--spawn-bot', action='store_true',
+                            help='Start "runbot" against the fake API for the duration of the test (polling mode)')
+
+    def handle(self, *args, **options):
+        api = FakeBotAPI(
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+            retry_after=options['retry_after'],
+        ).start(options['host'], options['port'])
+        self.stdout.write(f"Fake Bot API: TELEGRAM_API_URL={api.api_url}")
+
+        bot_process = None
+        if options['spawn_bot']:
+            if options['webhook_url']:
+                raise CommandError('--spawn-bot starts a polling bot and cannot be combined with --webhook-url')
+            env = dict(os.environ, TELEGRAM_API_URL=api.api_url)
+            env.setdefault('TOKENBOT', '0:loadtest')
+            bot_process = subprocess.Popen(
+                [sys.executable, 'manage.py', 'runbot'],
+                cwd=settings.BASE_DIR,
+                env=env,
+            )
+        else:
+            self.stdout.write("Point the bot at the URL above and start it now")
+
+        try:
+            time.sleep(options['warmup'])
+            result = LoadGenerator(
+                api,
+                users=options['users'],
+                duration=options['duration'],
+                reply_timeout=options['reply_timeout'],
+                webhook_url=options['webhook_url'],
+                webhook_secret=settings.WEBHOOK_SECRET,
+            ).run()
+        finally:
+            if bot_process is not None:
+                bot_process.terminate()
+                bot_process.wait(timeout=10)
+            api.stop()
+
+        self.stdout.write(
+            f"mode={result['mode']} users={result['users']} elapsed={result['elapsed']:.1f}s "
+            f"updates={result['updates']} handled={result['handled']} timeouts={result['timeouts']}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['updates_per_second']:.1f} updates/s, latency p50={result['p50_ms']:.1f}ms "
+            f"p95={result['p95_ms']:.1f}ms p99={result['p99_ms']:.1f}ms"
+        ))
+        self.stdout.write(f"429 answers: {result['rate_limited']}")
+        for method, count in sorted(result['api_calls'].items()):
+            self.stdout.write(f"  {method}: {count}")
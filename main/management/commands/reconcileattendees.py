@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from main.attendance import actual_attendee_count, recount_attendees
+from main.models import Event
+
+
+class Command(BaseCommand):
+    help = 'Recompute Event.attendee_count from attendances and fix drifted counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Events per UPDATE (one short transaction per batch)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many counters have drifted'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Event.objects.aggregate(last=Max('id'))['last'] or 0
+        fixed = 0
+        # Пачки по диапазону id: запись в БД не блокируется надолго
+        for start in range(0, last_id, batch_size):
+            events = Event.objects.filter(id__gt=start, id__lte=start + batch_size)
+            if options['dry_run']:
+                fixed += events.exclude(attendee_count=actual_attendee_count()).count()
+            else:
+                fixed += recount_attendees(events)
+        action = "Found" if options['dry_run'] else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{action} {fixed} drifted attendee counters (up to event id {last_id})"))
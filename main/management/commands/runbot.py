@@ -1,8 +1,37 @@
-from django.core.management.base import BaseCommand
-from main.bot_handlers import RunBot
+from django.core.management.base import BaseCommand, CommandError
+from event_bot import settings
+from main.bot_handlers import RunBot, set_webhook, delete_webhook
 
 class Command(BaseCommand):
     help = 'Run bot'
 
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument(
+            '--set-webhook',
+            action='store_true',
+            help='Register WEBHOOK_URL in Telegram instead of starting long polling'
+        )
+        group.add_argument(
+            '--delete-webhook',
+            action='store_true',
+            help='Unregister the webhook and exit'
+        )
+        parser.add_argument(
+            '--drop-pending',
+            action='store_true',
+            help='Drop pending updates when (un)registering the webhook'
+        )
+
     def handle(self, *args, **options):
-        RunBot()
\ No newline at end of file
+        if options['set_webhook']:
+            if not settings.WEBHOOK_URL or not settings.WEBHOOK_SECRET:
+                raise CommandError('WEBHOOK_URL and WEBHOOK_SECRET must be set to register the webhook')
+            set_webhook(drop_pending_updates=options['drop_pending'])
+            self.stdout.write(self.style.SUCCESS(f"Webhook set to {settings.WEBHOOK_URL}"))
+            return
+        if options['delete_webhook']:
+            delete_webhook(drop_pending_updates=options['drop_pending'])
+            self.stdout.write(self.style.SUCCESS("Webhook deleted"))
+            return
+        RunBot()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from main.bot_handlers import reminder_scheduler, outbox
+
+
+class Command(BaseCommand):
+    help = 'Send event reminders to attendees (use with REMINDERS_ENABLED=false in the bot processes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process due reminders once and exit instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        outbox.start()
+        try:
+            if options['once']:
+                sent = reminder_scheduler.run_once()
+                self.stdout.write(self.style.SUCCESS(f"Queued {sent} reminders"))
+            else:
+                reminder_scheduler.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Дожидаемся отправки поставленных в очередь напоминаний
+            outbox.stop()
+            self.stdout.write(f"Outbox: {outbox.stats()}")
@@ -0,0 +1,57 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from main.routers import PRIMARY, REPLICA, replica_configured
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database to SQLITE_REPLICA_PATH (the read replica of the bot)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Repeat the copy every N seconds instead of copying once '
+                 '(keep it below REPLICA_PIN_SECONDS)'
+        )
+
+    def handle(self, *args, **options):
+        if settings.DB_ENGINE != 'sqlite':
+            raise CommandError("syncreplica copies SQLite files; a PostgreSQL replica is kept by streaming replication")
+        if not replica_configured():
+            raise CommandError("Read replica is not configured, set SQLITE_REPLICA_PATH")
+        interval = options['interval']
+        try:
+            while True:
+                started = time.monotonic()
+                pages = self.sync()
+                self.stdout.write(f"Copied {pages} pages in {(time.monotonic() - started) * 1000:.0f} ms")
+                if interval <= 0:
+                    break
+                time.sleep(max(interval - (time.monotonic() - started), 0))
+        except KeyboardInterrupt:
+            pass
+
+    def sync(self):
+        """Копия основной БД в файл реплики через backup API SQLite.
+
+        Копируется согласованный снимок, бот при этом продолжает писать.
+        Копия пишется прямо в файл реплики, а не заменяет его: открытые
+        соединения бота с репликой видят новые данные со следующего запроса.
+        """
+        source = sqlite3.connect(connections.databases[PRIMARY]['NAME'])
+        target = sqlite3.connect(connections.databases[REPLICA]['NAME'])
+        try:
+            timeout = settings.SQLITE_BUSY_TIMEOUT
+            source.execute(f"PRAGMA busy_timeout = {timeout}")
+            target.execute(f"PRAGMA busy_timeout = {timeout}")
+            source.backup(target)
+            return target.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            target.close()
+            source.close()
@@ -0,0 +1,267 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин гистограмм (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Границы корзин числа SQL-запросов на одно обновление
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class Registry:
+    """Набор метрик процесса в текстовом формате Prometheus.
+
+    Кроме метрик, которые обновляются по месту, можно зарегистрировать
+    функцию stats() компонента (очереди, хранилища): её значения читаются
+    только при отдаче метрик.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._stats = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix, stats, documentation, label='key'):
+        """Снимок stats() как метрики {prefix}_{ключ}; вложенные словари - с меткой label"""
+        with self._lock:
+            self._stats.append((prefix, stats, documentation, label))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics, stats = list(self._metrics), list(self._stats)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+        for prefix, function, documentation, label in stats:
+            try:
+                snapshot = function()
+            except Exception as e:
+                logger.warning("Could not collect %s metrics: %s", prefix, e)
+                continue
+            if not isinstance(snapshot, dict):
+                snapshot = {'': snapshot}
+            for key, value in snapshot.items():
+                name = f'{prefix}_{key}' if key else prefix
+                if isinstance(value, dict):
+                    samples = [(_format_labels((label,), (sub,)), sub_value) for sub, sub_value in value.items()]
+                else:
+                    samples = [('', value)]
+                samples = [(labels, value) for labels, value in samples if isinstance(value, (int, float))]
+                if not samples:
+                    continue
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} untyped')
+                lines.extend(f'{name}{labels} {_format_value(value)}' for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(label) for label in labels)
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик"""
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values]
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам (le - верхняя граница корзины)"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        # Индекс первой корзины, в которую попадает значение (последняя - +Inf)
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts[0][position] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+# Обработчики бота
+HANDLER_SECONDS = Histogram(
+    'bot_handler_seconds', 'Handler execution time', ('handler',)
+)
+HANDLER_ERRORS = Counter(
+    'bot_handler_errors_total', 'Exceptions raised by handlers', ('handler',)
+)
+HANDLER_DB_QUERIES = Histogram(
+    'bot_handler_db_queries', 'SQL queries per handler call', ('handler',), buckets=QUERY_COUNT_BUCKETS
+)
+HANDLER_DB_SECONDS = Counter(
+    'bot_handler_db_seconds_total', 'Time spent in SQL queries by handlers', ('handler',)
+)
+# Исходящие запросы к Bot API
+TELEGRAM_API_SECONDS = Histogram(
+    'telegram_api_request_seconds', 'Bot API request time', ('method',)
+)
+TELEGRAM_API_REQUESTS = Counter(
+    'telegram_api_requests_total', 'Bot API requests by result', ('method', 'result')
+)
+# Кэши в памяти процесса
+CACHE_REQUESTS = Counter(
+    'bot_cache_requests_total', 'Cache lookups by result (hit or miss)', ('cache', 'result')
+)
+
+
+def cache_lookup(cache_name, hit):
+    """Учёт обращения к кэшу"""
+    CACHE_REQUESTS.inc(cache_name, 'hit' if hit else 'miss')
+
+
+class _QueryTimer:
+    """execute_wrapper: число и время SQL-запросов в текущем потоке"""
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+@contextmanager
+def track_handler(name):
+    """Время выполнения обработчика, его SQL-запросы (во всех БД, включая реплику) и исключения"""
+    timer = _QueryTimer()
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for alias_connection in connections.all():
+                stack.enter_context(alias_connection.execute_wrapper(timer))
+            yield
+    except Exception:
+        HANDLER_ERRORS.inc(name)
+        raise
+    finally:
+        HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+        HANDLER_DB_QUERIES.observe(timer.count, name)
+        HANDLER_DB_SECONDS.inc(name, amount=timer.seconds)
+
+
+def instrumented(function):
+    """Обработчик, учитываемый в метриках под своим именем"""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with track_handler(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Metrics request from %s: %s", self.client_address[0], format % args)
+
+
+def start_metrics_server(port, host='0.0.0.0', registry=REGISTRY):
+    """HTTP-сервер /metrics в фоновом потоке (для процесса runbot без Django-сервера)"""
+    handler = type('MetricsRequestHandler', (_MetricsRequestHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logger.info("Metrics server listening on %s:%s", host, server.server_address[1])
+    return server
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_cachegeneration'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['user', 'status', 'event'], name='attendance_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['event_type', 'category', 'date_time', 'id'], name='event_type_cat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['channel', 'is_private', 'date_time', 'id'], name='event_channel_private_idx'),
+        ),
+    ]
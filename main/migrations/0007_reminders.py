@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_event_attendance_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReminderRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset_minutes', models.PositiveIntegerField()),
+                ('last_attendance_id', models.PositiveBigIntegerField(default=0)),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['event', 'status', 'id'], name='attendance_event_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date_time'], name='event_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='reminderrun',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.event'),
+        ),
+        migrations.AddField(
+            model_name='reminderdelivery',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='main.reminderrun'),
+        ),
+        migrations.AddField(
+            model_name='reminderdelivery',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.user'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='reminderrun',
+            unique_together={('event', 'offset_minutes')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='reminderdelivery',
+            unique_together={('run', 'user')},
+        ),
+    ]
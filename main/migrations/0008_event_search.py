@@ -0,0 +1,73 @@
+# Полнотекстовый поиск мероприятий: таблица FTS5 над main_event и триггеры синхронизации
+
+from django.db import migrations
+
+# Внешнее содержимое (content=main_event): в индексе только термы, текст берётся
+# из main_event по rowid = id. Префиксные индексы ускоряют запросы "слово*".
+# Вес полей в bm25: название, место, адрес, описание
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE main_event_fts USING fts5(
+        name, location, address, details,
+        content='main_event', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    "INSERT INTO main_event_fts(main_event_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 2.0, 1.0)')",
+    """
+    CREATE TRIGGER main_event_fts_insert AFTER INSERT ON main_event BEGIN
+        INSERT INTO main_event_fts(rowid, name, location, address, details)
+        VALUES (new.id, new.name, new.location, new.address, new.details);
+    END
+    """,
+    """
+    CREATE TRIGGER main_event_fts_delete AFTER DELETE ON main_event BEGIN
+        INSERT INTO main_event_fts(main_event_fts, rowid, name, location, address, details)
+        VALUES ('delete', old.id, old.name, old.location, old.address, old.details);
+    END
+    """,
+    """
+    CREATE TRIGGER main_event_fts_update AFTER UPDATE OF name, location, address, details ON main_event BEGIN
+        INSERT INTO main_event_fts(main_event_fts, rowid, name, location, address, details)
+        VALUES ('delete', old.id, old.name, old.location, old.address, old.details);
+        INSERT INTO main_event_fts(rowid, name, location, address, details)
+        VALUES (new.id, new.name, new.location, new.address, new.details);
+    END
+    """,
+    # Уже существующие мероприятия
+    "INSERT INTO main_event_fts(main_event_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS main_event_fts_insert",
+    "DROP TRIGGER IF EXISTS main_event_fts_delete",
+    "DROP TRIGGER IF EXISTS main_event_fts_update",
+    "DROP TABLE IF EXISTS main_event_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 есть только в SQLite
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_reminders'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
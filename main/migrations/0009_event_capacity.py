@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-17 04:16
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# SQLite добавляет поле с default пересозданием таблицы main_event, при этом
+# удаляются триггеры полнотекстового индекса из 0008_event_search
+TRIGGERS_SQL = [
+    sql for sql in import_module('main.migrations.0008_event_search').CREATE_SQL
+    if 'CREATE TRIGGER' in sql
+]
+
+COUNT_ATTENDEES_SQL = """
+    UPDATE main_event SET attendee_count = (
+        SELECT COUNT(*) FROM main_attendance
+        WHERE main_attendance.event_id = main_event.id AND main_attendance.status = 'going'
+    )
+"""
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in ('main_event_fts_insert', 'main_event_fts_delete', 'main_event_fts_update'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for sql in TRIGGERS_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_event_search'),
+    ]
+
+    operations = [
+        # При откате выполняется последней - после удаления полей
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='event',
+            name='attendee_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunSQL(COUNT_ATTENDEES_SQL, migrations.RunSQL.noop),
+    ]
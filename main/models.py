@@ -45,10 +45,30 @@ class Event(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_private = models.BooleanField(default=False)
     channel = models.ForeignKey(TelegramChannel, on_delete=models.SET_NULL, null=True, blank=True)
+    # Число мест (пусто - без ограничения)
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    # Число участников со статусом "going". Меняется только запросами с F()
+    # в main.attendance (проверка мест и увеличение - один UPDATE); расхождения
+    # исправляет команда reconcileattendees
+    attendee_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Просмотр по типу и категории, сортировка и keyset-пагинация по (date_time, id)
+            models.Index(fields=['event_type', 'category', 'date_time', 'id'], name='event_type_cat_date_idx'),
+            # Приватные мероприятия канала
+            models.Index(fields=['channel', 'is_private', 'date_time', 'id'], name='event_channel_private_idx'),
+            # Поиск мероприятий, о которых пора напомнить
+            models.Index(fields=['date_time'], name='event_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def is_full(self):
+        return self.capacity is not None and self.attendee_count >= self.capacity
+
 
 class Attendance(models.Model):
     STATUS_CHOICES = [
@@ -62,6 +82,51 @@ class Attendance(models.Model):
 
     class Meta:
         unique_together = ('user', 'event')
+        indexes = [
+            # Мероприятия пользователя с заданным статусом (покрывающий индекс)
+            models.Index(fields=['user', 'status', 'event'], name='attendance_user_status_idx'),
+            # Участники мероприятия пачками по id (рассылка напоминаний)
+            models.Index(fields=['event', 'status', 'id'], name='attendance_event_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username or self.user.telegram_id} - {self.event.name} ({self.status})"
+
+
+class CacheGeneration(models.Model):
+    """Счётчик поколения кэша, общий для процессов админки и бота"""
+    name = models.CharField(max_length=100, unique=True)
+    generation = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.generation})"
+
+
+class ReminderRun(models.Model):
+    """Рассылка напоминания о мероприятии за offset_minutes до начала"""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    offset_minutes = models.PositiveIntegerField()
+    # Последняя обработанная запись Attendance: с неё рассылка продолжается после перезапуска
+    last_attendance_id = models.PositiveBigIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    # Рассылку ведёт один процесс: до этого времени её не берут другие
+    locked_until = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('event', 'offset_minutes')
+
+    def __str__(self):
+        return f"{self.event.name} (-{self.offset_minutes} мин.)"
+
+
+class ReminderDelivery(models.Model):
+    """Отправленное напоминание: повторно этому пользователю не отправляется"""
+    run = models.ForeignKey(ReminderRun, on_delete=models.CASCADE, related_name='deliveries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('run', 'user')
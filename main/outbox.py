@@ -0,0 +1,465 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from requests.exceptions import RequestException
+from telebot.apihelper import ApiTelegramException
+
+from main.metrics import TELEGRAM_API_SECONDS, TELEGRAM_API_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Состояния исходящего запроса
+QUEUED = 'queued'
+SENDING = 'sending'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+COUNTERS = {'send': 'sent', 'edit': 'edited', 'delete': 'deleted', 'answer': 'answered', 'inline': 'answered_inline'}
+# Запросы, на которые распространяется лимит сообщений в чат
+MESSAGE_METHODS = ('send', 'edit')
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """Через сколько секунд появится токен (0 - уже есть)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now, seconds):
+        """Запрет на seconds секунд (ответ 429 с retry_after)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class OutboundJob:
+    """Исходящий запрос к Bot API: отправка, правка или удаление сообщения, ответ на нажатие или inline-запрос"""
+    __slots__ = ('chat_id', 'method', 'args', 'kwargs', 'state', 'attempts', 'enqueued_at',
+                 'message_id', 'delete_after_send')
+
+    def __init__(self, chat_id, method, args=(), kwargs=None, message_id=None):
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.state = QUEUED
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+        self.message_id = message_id
+        self.delete_after_send = False
+
+
+class Outbox:
+    """Очередь исходящих сообщений бота.
+
+    Сообщения одного чата уходят строго по порядку. Отправка ограничена
+    общим ведром токенов (лимит бота) и ведром на каждый чат; удаления
+    расходуют только общее. На ответ 429 чат ставится на паузу retry_after,
+    запрос повторяется. Удаление ещё не отправленного сообщения отменяет
+    обе операции. Пока очередь не запущена, запросы выполняются сразу
+    в вызывающем потоке.
+
+    id отправленного заменяемого сообщения записывается в last_messages
+    (общее хранилище): предыдущее меню находят другие процессы бота и этот
+    же процесс после перезапуска. Локально хранятся только сами запросы -
+    для объединения ещё не отправленных.
+    """
+
+    def __init__(self, bot, global_rate=30.0, chat_rate=1.0, chat_burst=3, num_workers=4, max_queue=5000,
+                 max_retries=3, max_chats=10000, last_messages=None, name='outbox'):
+        self.bot = bot
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.num_workers = num_workers
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.last_messages = last_messages
+        self.name = name
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        # Общий лимит без всплесков: не больше global_rate запросов в любую секунду
+        self._global = TokenBucket(global_rate, 1, time.monotonic())
+        self._chat_buckets = OrderedDict()
+        self._queues = {}
+        self._busy = set()
+        self._ready = []
+        self._seq = itertools.count()
+        # Последнее заменяемое сообщение каждого чата (удаляется перед следующим)
+        self._last = OrderedDict()
+        # Запись в last_messages: проверка "запрос всё ещё последний" и запись
+        # не разделяются удалением (порядок блокировок: _store_lock, затем _lock)
+        self._store_lock = threading.Lock()
+        self._threads = []
+        self._running = False
+        self._stopped = False
+        # Счётчики
+        self._pending = 0
+        self._in_flight = 0
+        self._counts = {'sent': 0, 'edited': 0, 'deleted': 0, 'answered': 0, 'answered_inline': 0, 'coalesced': 0, 'edit_fallbacks': 0, 'rate_limited': 0, 'retried': 0, 'failed': 0}
+        self._delay_total = 0.0
+        self._delay_max = 0.0
+        self._api_time_total = 0.0
+
+    def start(self):
+        """Запуск рабочих потоков"""
+        with self._lock:
+            self._running = True
+            self._stopped = False
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Outbox started with %s workers, %s msg/s", self.num_workers, self.global_rate)
+        return self
+
+    def stop(self, timeout=None):
+        """Остановка после отправки накопленных сообщений (не дольше timeout на поток)"""
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+            self._not_full.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._lock:
+            self._running = False
+
+    # Постановка запросов
+
+    def send(self, chat_id, *args, replace=False, **kwargs):
+        """Отправка сообщения; replace - удалить его перед следующим заменяемым"""
+        job = OutboundJob(chat_id, 'send', args, kwargs)
+        with self._lock:
+            if replace:
+                self._track(chat_id, job)
+            if self._running:
+                self._enqueue(job)
+                return job
+        self._execute(job)
+        return job
+
+    def edit(self, chat_id, message_id, *args, **kwargs):
+        """Замена текста и клавиатуры заменяемого сообщения (вместо удаления и новой отправки)"""
+        job = OutboundJob(chat_id, 'edit', args, kwargs, message_id=message_id)
+        with self._lock:
+            previous = self._last.get(chat_id)
+            if previous is not None and previous.method == 'edit' and previous.state == QUEUED \
+                    and previous.message_id == message_id:
+                # Правка того же сообщения ещё в очереди: достаточно последней
+                previous.args, previous.kwargs = args, kwargs
+                self._counts['coalesced'] += 1
+                return previous
+            self._track(chat_id, job)
+            if self._running:
+                self._enqueue(job)
+                return job
+        self._execute(job)
+        return job
+
+    def delete(self, chat_id, message_id):
+        """Удаление сообщения"""
+        job = OutboundJob(chat_id, 'delete', message_id=message_id)
+        with self._lock:
+            if self._running:
+                self._enqueue(job)
+                return job
+        self._execute(job)
+        return job
+
+    def answer_callback(self, chat_id, callback_query_id, *args, **kwargs):
+        """Ответ на нажатие кнопки: уходит раньше остальных сообщений чата"""
+        # Для ответа на нажатие message_id хранит id callback-запроса
+        job = OutboundJob(chat_id, 'answer', args, kwargs, message_id=callback_query_id)
+        with self._lock:
+            if self._running:
+                self._enqueue(job, first=True)
+                return job
+        self._execute(job)
+        return job
+
+    def answer_inline(self, user_id, inline_query_id, results, **kwargs):
+        """Ответ на inline-запрос: уходит раньше остальных запросов пользователя"""
+        # Для inline-ответа message_id хранит id запроса
+        job = OutboundJob(user_id, 'inline', (results,), kwargs, message_id=inline_query_id)
+        with self._lock:
+            if self._running:
+                self._enqueue(job, first=True)
+                return job
+        self._execute(job)
+        return job
+
+    def is_last(self, chat_id, message_id):
+        """Является ли сообщение последним заменяемым сообщением чата"""
+        with self._lock:
+            job = self._last.get(chat_id)
+            if job is not None:
+                return job.message_id == message_id and job.state not in (CANCELLED, FAILED)
+        # Меню отправлено другим процессом или до перезапуска
+        return self.last_messages is not None and self.last_messages.get(chat_id) == message_id
+
+    def delete_last(self, chat_id):
+        """Удаление последнего заменяемого сообщения чата"""
+        with self._lock:
+            job = self._last.pop(chat_id, None)
+            message_id = None if job is None else self._release(job)
+        if self.last_messages is not None:
+            with self._store_lock:
+                if job is None:
+                    message_id = self.last_messages.get(chat_id)
+                self.last_messages.delete(chat_id)
+        if message_id is not None:
+            self.delete(chat_id, message_id)
+
+    def _release(self, job):
+        """Снятие заменяемого запроса; id сообщения, которое осталось удалить (None - нечего)"""
+        if job.state == QUEUED:
+            # Сообщение ещё не ушло: не отправляем и не удаляем,
+            # а от правки остаётся только удаление исходного сообщения
+            queue = self._queues[job.chat_id]
+            queue.remove(job)
+            if not queue and job.chat_id not in self._busy:
+                del self._queues[job.chat_id]
+            job.state = CANCELLED
+            self._pending -= 1
+            self._counts['coalesced'] += 1
+            self._not_full.notify()
+            return job.message_id if job.method == 'edit' else None
+        if job.state == SENDING:
+            job.delete_after_send = True
+            return None
+        return job.message_id if job.state == DONE else None
+
+    def _remember(self, job):
+        """Запись id отправленного заменяемого сообщения в общее хранилище"""
+        with self._store_lock:
+            with self._lock:
+                current = self._last.get(job.chat_id) is job
+            if current:
+                self.last_messages.set(job.chat_id, job.message_id)
+
+    def _track(self, chat_id, job):
+        self._last[chat_id] = job
+        self._last.move_to_end(chat_id)
+        if len(self._last) > self.max_chats:
+            self._last.popitem(last=False)
+
+    def _enqueue(self, job, first=False):
+        while self._pending >= self.max_queue and not self._stopped:
+            self._not_full.wait()
+        queue = self._queues.get(job.chat_id)
+        if queue is None:
+            queue = self._queues[job.chat_id] = deque()
+        if first:
+            queue.appendleft(job)
+        else:
+            queue.append(job)
+        self._pending += 1
+        if job.chat_id not in self._busy and (len(queue) == 1 or first):
+            self._schedule(job.chat_id, time.monotonic())
+
+    def _schedule(self, chat_id, ready_at):
+        heapq.heappush(self._ready, (ready_at, next(self._seq), chat_id))
+        self._wakeup.notify()
+
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+            if len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    # Рабочие потоки
+
+    def _next_job(self):
+        """Следующий запрос, для которого есть токены; None - подождать"""
+        while self._ready:
+            now = time.monotonic()
+            ready_at, _, chat_id = self._ready[0]
+            if ready_at > now:
+                return None, ready_at - now
+            queue = self._queues.get(chat_id)
+            if not queue or chat_id in self._busy:
+                heapq.heappop(self._ready)
+                continue
+            job = queue[0]
+            delay = self._global.delay(now)
+            if job.method in MESSAGE_METHODS:
+                delay = max(delay, self._chat_bucket(chat_id, now).delay(now))
+            if delay:
+                heapq.heapreplace(self._ready, (now + delay, next(self._seq), chat_id))
+                continue
+            heapq.heappop(self._ready)
+            self._global.take(now)
+            if job.method in MESSAGE_METHODS:
+                self._chat_bucket(chat_id, now).take(now)
+            queue.popleft()
+            job.state = SENDING
+            self._busy.add(chat_id)
+            self._pending -= 1
+            self._in_flight += 1
+            self._not_full.notify()
+            return job, None
+        return None, None
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                job, timeout = self._next_job()
+                while job is None:
+                    if self._stopped and not self._pending:
+                        return
+                    self._wakeup.wait(timeout)
+                    job, timeout = self._next_job()
+
+            retry_after = self._execute(job)
+
+            with self._lock:
+                self._in_flight -= 1
+                self._busy.discard(job.chat_id)
+                now = time.monotonic()
+                queue = self._queues[job.chat_id]
+                if retry_after is not None:
+                    job.state = QUEUED
+                    queue.appendleft(job)
+                    self._pending += 1
+                    self._counts['retried'] += 1
+                    self._schedule(job.chat_id, now + retry_after)
+                    continue
+                if job.delete_after_send and job.state == DONE:
+                    queue.append(OutboundJob(job.chat_id, 'delete', message_id=job.message_id))
+                    self._pending += 1
+                if queue:
+                    self._schedule(job.chat_id, now)
+                else:
+                    del self._queues[job.chat_id]
+                if self._stopped:
+                    self._wakeup.notify_all()
+
+    def _execute(self, job):
+        """Выполнение запроса; возвращает паузу перед повтором или None"""
+        job.attempts += 1
+        started = time.monotonic()
+        retry_after = None
+        result = 'error'
+        try:
+            if job.method == 'send':
+                job.message_id = self.bot.send_message(job.chat_id, *job.args, **job.kwargs).message_id
+            elif job.method == 'edit':
+                self._edit(job)
+            elif job.method == 'answer':
+                self.bot.answer_callback_query(job.message_id, *job.args, **job.kwargs)
+            elif job.method == 'inline':
+                self.bot.answer_inline_query(job.message_id, *job.args, **job.kwargs)
+            else:
+                self.bot.delete_message(job.chat_id, job.message_id)
+            job.state = DONE
+            result = 'ok'
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                result = 'rate_limited'
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                with self._lock:
+                    self._counts['rate_limited'] += 1
+                    # Лимит мог быть общим: притормаживаем всю отправку
+                    self._global.pause(time.monotonic(), retry_after)
+                    if job.method in MESSAGE_METHODS:
+                        self._chat_bucket(job.chat_id, time.monotonic()).pause(time.monotonic(), retry_after)
+            elif job.method in ('delete', 'answer', 'inline'):
+                # Сообщение уже удалено, нажатие или inline-запрос устарели - не ошибка доставки
+                job.state = DONE
+                logger.debug("Could not %s %s in chat %s: %s", job.method, job.message_id, job.chat_id, e)
+            else:
+                job.state = FAILED
+                logger.warning("Could not send message to chat %s: %s", job.chat_id, e)
+        except RequestException as e:
+            result = 'network_error'
+            retry_after = job.attempts
+            logger.warning("Network error while calling %s for chat %s: %s", job.method, job.chat_id, e)
+        finally:
+            finished = time.monotonic()
+            TELEGRAM_API_SECONDS.observe(finished - started, job.method)
+            TELEGRAM_API_REQUESTS.inc(job.method, result)
+
+        if retry_after is not None and (not self._running or job.attempts > self.max_retries):
+            # Без очереди (или после исчерпания попыток) не повторяем
+            job.state = FAILED
+            retry_after = None
+            logger.warning("Giving up on %s for chat %s after %s attempts", job.method, job.chat_id, job.attempts)
+
+        with self._lock:
+            self._api_time_total += finished - started
+            if job.state == DONE:
+                self._counts[COUNTERS[job.method]] += 1
+                delay = finished - job.enqueued_at
+                self._delay_total += delay
+                self._delay_max = max(self._delay_max, delay)
+            elif job.state == FAILED:
+                self._counts['failed'] += 1
+        if job.state == DONE and job.method in MESSAGE_METHODS and self.last_messages is not None:
+            self._remember(job)
+        return retry_after
+
+    def _edit(self, job):
+        try:
+            self.bot.edit_message_text(*job.args, chat_id=job.chat_id, message_id=job.message_id, **job.kwargs)
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                raise
+            if 'message is not modified' in e.description:
+                return
+            # Сообщение нельзя изменить (удалено, слишком старое): отправляем новое
+            logger.debug("Could not edit message %s in chat %s: %s", job.message_id, job.chat_id, e)
+            old_message_id = job.message_id
+            job.message_id = self.bot.send_message(job.chat_id, *job.args, **job.kwargs).message_id
+            try:
+                self.bot.delete_message(job.chat_id, old_message_id)
+            except ApiTelegramException:
+                pass
+            with self._lock:
+                self._counts['edit_fallbacks'] += 1
+
+    def stats(self):
+        """Снимок счётчиков очереди"""
+        with self._lock:
+            delivered = sum(self._counts[name] for name in COUNTERS.values())
+            return {
+                'workers': self.num_workers,
+                'queue_depth': self._pending,
+                'in_flight': self._in_flight,
+                'chats': len(self._queues),
+                **self._counts,
+                'delivery_seconds_total': self._delay_total,
+                'delivery_seconds_max': self._delay_max,
+                'delivery_seconds_avg': self._delay_total / delivered if delivered else 0.0,
+                'api_seconds_total': self._api_time_total,
+            }
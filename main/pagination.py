@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+PAGE_NEXT = "next"
+PAGE_PREV = "prev"
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(event):
+    """Курсор страницы: (date_time в микросекундах, id) - короткий для callback_data"""
+    return f"{(event.date_time - EPOCH) // MICROSECOND}_{event.id}"
+
+
+def decode_cursor(cursor):
+    micros, event_id = cursor.split("_")
+    return EPOCH + timedelta(microseconds=int(micros)), int(event_id)
+
+
+def page_queryset(queryset, cursor=None, direction=PAGE_NEXT, page_size=10):
+    """Запрос страницы: page_size + 1 строк после (или перед) курсором"""
+    if cursor is None:
+        return queryset.order_by("date_time", "id")[:page_size + 1]
+    date_time, event_id = decode_cursor(cursor)
+    if direction == PAGE_PREV:
+        return queryset.filter(
+            Q(date_time__lt=date_time) | Q(date_time=date_time, id__lt=event_id)
+        ).order_by("-date_time", "-id")[:page_size + 1]
+    return queryset.filter(
+        Q(date_time__gt=date_time) | Q(date_time=date_time, id__gt=event_id)
+    ).order_by("date_time", "id")[:page_size + 1]
+
+
+def fetch_page(queryset, cursor=None, direction=PAGE_NEXT, page_size=10):
+    """Keyset-пагинация по (date_time, id).
+
+    Загружает не больше page_size + 1 строк независимо от номера страницы.
+    Возвращает (мероприятия, есть_предыдущая, есть_следующая).
+    """
+    rows = list(page_queryset(queryset, cursor, direction, page_size))
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if cursor is None:
+        return rows, False, has_more
+    if direction == PAGE_PREV:
+        return rows[::-1], has_more, True
+    return rows, True, has_more
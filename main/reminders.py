@@ -0,0 +1,162 @@
+import html
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.db import transaction, close_old_connections
+from django.db.models import Exists, OuterRef, Q, F
+from django.utils import timezone
+
+from main.models import Event, Attendance, ReminderRun, ReminderDelivery
+from main.outbox import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def reminder_text(event):
+    """Текст напоминания о мероприятии"""
+    text = f"⏰ Напоминание: скоро начнётся <b>{html.escape(event.name)}</b>\n"
+    text += f"📍 {html.escape(event.location)}, {html.escape(event.address)}\n"
+    text += f"📅 {event.date_time.strftime('%d.%m.%Y %H:%M')}\n"
+    if event.link_2gis:
+        text += f"🔗 <a href='{html.escape(event.link_2gis)}'>Ссылка на 2ГИС</a>"
+    return text
+
+
+class ReminderScheduler:
+    """Напоминания участникам (статус 'going') за offsets минут до начала мероприятия.
+
+    Окна напоминаний не пересекаются: о мероприятии, до которого осталось
+    меньше следующего отступа, напоминание за больший отступ не отправляется.
+    Участники читаются пачками по id; перед отправкой пачки получатели
+    записываются в ReminderDelivery, а курсор - в ReminderRun, поэтому после
+    перезапуска рассылка продолжается без повторов. Рассылку одного
+    мероприятия одновременно ведёт только один процесс (аренда locked_until).
+    Скорость ограничена rate сообщений в секунду, чтобы в общем лимите
+    бота оставалось место для ответов пользователям.
+    """
+
+    def __init__(self, outbox, offsets=(1440, 60), batch_size=200, rate=20.0, poll_interval=60.0, lease=300):
+        self.outbox = outbox
+        self.offsets = sorted(set(offsets))
+        self.batch_size = batch_size
+        self.rate = rate
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self._bucket = TokenBucket(rate, 1, time.monotonic())
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запуск фонового потока"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='reminders', daemon=True)
+        self._thread.start()
+        logger.info("Reminder scheduler started, offsets %s min", self.offsets)
+        return self
+
+    def stop(self, timeout=None):
+        """Остановка после отправки текущей пачки"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("Reminder scheduler error: %s", e)
+            finally:
+                close_old_connections()
+            self._stop.wait(self.poll_interval)
+
+    def run_once(self, now=None):
+        """Один проход по всем окнам; возвращает число отправленных напоминаний"""
+        now = now or timezone.now()
+        sent = 0
+        lower = 0
+        for offset in self.offsets:
+            for event in self.due_events(now, lower, offset):
+                if self._stop.is_set():
+                    return sent
+                sent += self.deliver(event, offset)
+            lower = offset
+        return sent
+
+    def due_events(self, now, lower, offset):
+        """Мероприятия, до начала которых от lower до offset минут и рассылка не завершена"""
+        finished = ReminderRun.objects.filter(
+            event=OuterRef('pk'),
+            offset_minutes=offset,
+            finished_at__isnull=False
+        )
+        return Event.objects.filter(
+            date_time__gt=now + timedelta(minutes=lower),
+            date_time__lte=now + timedelta(minutes=offset)
+        ).filter(~Exists(finished)).order_by('date_time')
+
+    def _claim(self, run, held=None):
+        """Захват или продление аренды рассылки; None - её ведёт другой процесс"""
+        now = timezone.now()
+        until = now + timedelta(seconds=self.lease)
+        free = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+        if held is not None:
+            free |= Q(locked_until=held)
+        claimed = ReminderRun.objects.filter(free, pk=run.pk, finished_at__isnull=True).update(locked_until=until)
+        return until if claimed else None
+
+    def deliver(self, event, offset):
+        """Рассылка напоминания одного мероприятия"""
+        run, _ = ReminderRun.objects.get_or_create(event=event, offset_minutes=offset)
+        held = self._claim(run)
+        if held is None:
+            return 0
+        # Курсор читается после захвата: его мог сдвинуть предыдущий владелец
+        run.refresh_from_db(fields=['last_attendance_id'])
+        text = reminder_text(event)
+        sent = 0
+        cursor = run.last_attendance_id
+        while not self._stop.is_set():
+            batch = list(
+                Attendance.objects.filter(event=event, status='going', id__gt=cursor)
+                .order_by('id')
+                .values_list('id', 'user_id', 'user__telegram_id')[:self.batch_size]
+                .iterator(chunk_size=self.batch_size)
+            )
+            if not batch:
+                ReminderRun.objects.filter(pk=run.pk).update(finished_at=timezone.now(), locked_until=None)
+                logger.info("Reminders for event %s (-%s min) finished", event.id, offset)
+                break
+            cursor = batch[-1][0]
+            already = set(
+                ReminderDelivery.objects.filter(run=run, user_id__in=[user_id for _, user_id, _ in batch])
+                .values_list('user_id', flat=True)
+            )
+            recipients = [(user_id, telegram_id) for _, user_id, telegram_id in batch if user_id not in already]
+            with transaction.atomic():
+                ReminderDelivery.objects.bulk_create(
+                    [ReminderDelivery(run=run, user_id=user_id) for user_id, _ in recipients],
+                    ignore_conflicts=True
+                )
+                ReminderRun.objects.filter(pk=run.pk).update(
+                    last_attendance_id=cursor,
+                    sent=F('sent') + len(recipients)
+                )
+            for _, telegram_id in recipients:
+                self._wait_for_token()
+                self.outbox.send(int(telegram_id), text)
+            sent += len(recipients)
+            held = self._claim(run, held)
+            if held is None:
+                logger.warning("Lost reminder lease for event %s (-%s min)", event.id, offset)
+                break
+        return sent
+
+    def _wait_for_token(self):
+        delay = self._bucket.delay(time.monotonic())
+        if delay:
+            time.sleep(delay)
+        self._bucket.take(time.monotonic())
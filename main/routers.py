@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+
+_local = threading.local()
+
+
+class PrimaryPins:
+    """Пользователи, недавно писавшие в БД: window секунд их чтение идёт с основной БД.
+
+    Окно должно быть больше отставания реплики, иначе пользователь может
+    не увидеть только что сделанную запись.
+    """
+
+    def __init__(self, window=10.0, max_size=10000):
+        self.window = window
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._until = OrderedDict()
+
+    def pin(self, key):
+        with self._lock:
+            self._until[key] = time.monotonic() + self.window
+            self._until.move_to_end(key)
+            if len(self._until) > self.max_size:
+                self._until.popitem(last=False)
+
+    def is_pinned(self, key):
+        with self._lock:
+            until = self._until.get(key)
+            if until is None:
+                return False
+            if until < time.monotonic():
+                del self._until[key]
+                return False
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._until.clear()
+
+
+pins = PrimaryPins(window=getattr(settings, 'REPLICA_PIN_SECONDS', 10.0))
+
+
+def replica_configured():
+    return REPLICA in connections.databases
+
+
+@contextmanager
+def replica_reads(key):
+    """Чтение моделей бота с реплики для обновления пользователя key.
+
+    Не действует, если пользователь закреплён за основной БД, внутри
+    транзакции и в обработчиках с use_primary. Любая запись через ORM
+    закрепляет пользователя за основной БД.
+    """
+    previous = getattr(_local, 'key', None)
+    _local.key = key
+    try:
+        yield
+    finally:
+        _local.key = previous
+
+
+@contextmanager
+def primary_reads():
+    """Чтение с основной БД без закрепления пользователя.
+
+    Для общих кэшей процесса, которые сверяются с поколениями шины
+    инвалидации (индекс мероприятий, кэш пользователей, клавиатура каналов):
+    поколения и данные читаются из одной БД, независимо от того, чьё
+    обновление вызвало перезагрузку.
+    """
+    previous = getattr(_local, 'primary', False)
+    _local.primary = True
+    try:
+        yield
+    finally:
+        _local.primary = previous
+
+
+def use_primary(handler):
+    """Обработчик, который пишет в БД: всё его чтение - с основной БД, после него пользователь закреплён"""
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        try:
+            with primary_reads():
+                return handler(*args, **kwargs)
+        finally:
+            key = getattr(_local, 'key', None)
+            if key is not None:
+                pins.pin(key)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Чтение моделей приложения main в replica_reads() - с реплики, остальное - с основной БД.
+
+    Админка, фоновые задачи и команды не входят в replica_reads() и всегда
+    работают с основной БД. Таблица кэша Django (состояния пользователей)
+    не относится к main и тоже читается с основной БД. Поколения шины
+    инвалидации (CacheGeneration) и данные общих кэшей процесса, которые
+    по ним перезагружаются, читаются с основной БД (primary_reads): снимок
+    поколений общий для процесса, и реплика, отстающая от него, записала
+    бы в кэш старые данные под новым поколением.
+    """
+
+    def db_for_read(self, model, **hints):
+        key = getattr(_local, 'key', None)
+        if key is None or getattr(_local, 'primary', False) or model._meta.app_label != 'main':
+            return None
+        if not replica_configured() or connections[PRIMARY].in_atomic_block or pins.is_pinned(key):
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        key = getattr(_local, 'key', None)
+        if key is not None:
+            pins.pin(key)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
@@ -0,0 +1,99 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from main.models import Event
+
+# Таблица FTS5 над main_event (см. миграцию 0008_event_search). Индекс
+# обновляют триггеры на main_event, поэтому в него попадают и bulk_create,
+# и update(). Пересоздание таблицы main_event (миграции SQLite с _remake_table)
+# удаляет триггеры - такая миграция должна создать их заново.
+FTS_TABLE = "main_event_fts"
+# Сколько слов запроса учитывать и минимальная длина запроса
+MAX_TERMS = 8
+MIN_QUERY_LENGTH = 2
+
+_TERM = re.compile(r"\w+")
+
+# bm25 считается для каждого совпадения: для слов, которые есть в большой доле
+# мероприятий, это сотни миллисекунд на миллионе строк. Поэтому ранжируются
+# только последние добавленные max_candidates подходящих совпадений (новые
+# мероприятия - в основном предстоящие); для избирательных запросов это все
+# совпадения. Прошедшие и приватные мероприятия отбрасываются до этого
+# ограничения: иначе, например, после импорта архива из CSV последние
+# совпадения оказались бы прошедшими и выдача - пустой. rank вычисляется
+# только для строк, прошедших фильтр.
+SEARCH_SQL = f"""
+    SELECT e.id, e.name, e.location, e.address, e.date_time, e.details, e.link_2gis,
+           e.event_type, e.category
+    FROM (
+        SELECT {FTS_TABLE}.rowid AS rowid, {FTS_TABLE}.rank AS rank
+        FROM {FTS_TABLE}
+        JOIN main_event candidate ON candidate.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s
+          AND candidate.date_time >= %s AND NOT candidate.is_private
+          AND (%s IS NULL OR candidate.event_type = %s) AND (%s IS NULL OR candidate.category = %s)
+        ORDER BY {FTS_TABLE}.rowid DESC LIMIT %s
+    ) AS found
+    JOIN main_event e ON e.id = found.rowid
+    ORDER BY found.rank, e.date_time, e.id
+    LIMIT %s OFFSET %s
+"""
+
+
+def query_words(text):
+    """Слова запроса в нижнем регистре, без пунктуации"""
+    return _TERM.findall(text.lower())
+
+
+def match_expression(text):
+    """Запрос FTS5 из текста пользователя: все слова, последнее - как префикс.
+
+    Префиксный поиск объединяет списки документов всех подходящих термов и
+    на частых словах в разы дороже точного, поэтому префиксом считается
+    только последнее (возможно, недописанное) слово. Слова берутся в кавычки,
+    поэтому операторы FTS5 (AND, NEAR, *, ...) в тексте пользователя не
+    интерпретируются. Пустая строка - искать нечего.
+    """
+    terms = [f'"{term}"' for term in query_words(text)[:MAX_TERMS]]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_events(text, offset=0, page_size=10, max_candidates=1000, event_type=None, category=None):
+    """Предстоящие публичные мероприятия по тексту, по релевантности (bm25) и дате.
+
+    event_type и category (если заданы) дополнительно ограничивают выдачу.
+
+    Возвращает (мероприятия страницы, есть_следующая); загружает не больше
+    page_size + 1 строк одним запросом.
+    """
+    expression = match_expression(text)
+    if not expression:
+        return [], False
+    if connection.vendor != "sqlite":
+        return _search_substrings(query_words(text)[:MAX_TERMS], offset, page_size, event_type, category)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = [expression, now, event_type, event_type, category, category, max_candidates, page_size + 1, offset]
+    rows = list(Event.objects.raw(SEARCH_SQL, params))
+    return rows[:page_size], len(rows) > page_size
+
+
+def _search_substrings(words, offset, page_size, event_type, category):
+    # Таблица FTS5 есть только в SQLite: в других БД каждое слово ищется
+    # подстрокой в полях мероприятия, выдача - по дате
+    events = Event.objects.filter(date_time__gte=timezone.now(), is_private=False)
+    if event_type:
+        events = events.filter(event_type=event_type)
+    if category:
+        events = events.filter(category=category)
+    for word in words:
+        events = events.filter(
+            Q(name__icontains=word) | Q(location__icontains=word) |
+            Q(address__icontains=word) | Q(details__icontains=word)
+        )
+    rows = list(events.order_by("date_time", "id")[offset:offset + page_size + 1])
+    return rows[:page_size], len(rows) > page_size
@@ -0,0 +1,138 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+class StateStore(ABC):
+    """Хранилище состояний диалога пользователей.
+
+    Состояние - небольшой словарь из примитивов (id сообщений, кортежи id
+    мероприятий), поэтому его можно хранить вне процесса.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, user_id):
+        """Состояние пользователя (копия) или None"""
+
+    @abstractmethod
+    def set(self, user_id, state):
+        """Сохранение состояния на ttl секунд"""
+
+    @abstractmethod
+    def delete(self, user_id):
+        """Удаление состояния"""
+
+    def cleanup(self):
+        """Удаление устаревших состояний, возвращает их количество"""
+        return 0
+
+    def size(self):
+        """Число хранимых состояний (None, если неизвестно)"""
+        return None
+
+
+class MemoryStateStore(StateStore):
+    """Состояния в памяти процесса с вытеснением по LRU и TTL"""
+
+    def __init__(self, ttl, max_size=10000):
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            item = self._data.get(user_id)
+            if item is None:
+                return None
+            stored_at, state = item
+            if time.time() - stored_at > self.ttl:
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+            return dict(state)
+
+    def set(self, user_id, state):
+        with self._lock:
+            self._data[user_id] = (time.time(), dict(state))
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def cleanup(self):
+        now = time.time()
+        with self._lock:
+            expired = [user_id for user_id, (stored_at, _) in self._data.items() if now - stored_at > self.ttl]
+            for user_id in expired:
+                del self._data[user_id]
+        return len(expired)
+
+    def size(self):
+        return len(self._data)
+
+
+class CacheStateStore(StateStore):
+    """Состояния в кэше Django, общем для нескольких процессов бота"""
+
+    def __init__(self, ttl, alias='default'):
+        super().__init__(ttl)
+        self.cache = caches[alias]
+
+    @staticmethod
+    def key(user_id):
+        return f"user_state_{user_id}"
+
+    def get(self, user_id):
+        return self.cache.get(self.key(user_id))
+
+    def set(self, user_id, state):
+        self.cache.set(self.key(user_id), dict(state), self.ttl)
+
+    def delete(self, user_id):
+        self.cache.delete(self.key(user_id))
+
+
+class LastMessageStore:
+    """id последнего заменяемого сообщения чата (меню) в хранилище StateStore.
+
+    Хранилище отдельное от состояний пользователей: записи пишет поток
+    очереди отправки после ответа Telegram, и они не должны вытеснять
+    состояния диалогов. С общим хранилищем предыдущее меню находит любой
+    процесс бота, в том числе после перезапуска.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def key(chat_id):
+        return f"last_message_{chat_id}"
+
+    def get(self, chat_id):
+        item = self.store.get(self.key(chat_id))
+        return item["message_id"] if item else None
+
+    def set(self, chat_id, message_id):
+        self.store.set(self.key(chat_id), {"message_id": message_id})
+
+    def delete(self, chat_id):
+        self.store.delete(self.key(chat_id))
+
+
+def create_state_store(backend, ttl, max_size=10000, cache_alias='default'):
+    """Создание хранилища состояний по имени бэкенда"""
+    if backend == 'memory':
+        return MemoryStateStore(ttl, max_size=max_size)
+    if backend == 'cache':
+        return CacheStateStore(ttl, alias=cache_alias)
+    raise ValueError(f"Unknown state backend: {backend}")
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from main.models import Event
+
+
+def create_event(**fields):
+    return Event.objects.create(
+        name="Concert",
+        location="Location",
+        address="Address",
+        event_type="online",
+        category="concert",
+        date_time=timezone.now() + timedelta(days=1),
+        **fields
+    )
+
+
+class EventSaveTests(TestCase):
+
+    def test_resave_deleted_event_inserts_it(self):
+        event = create_event()
+        Event.objects.filter(pk=event.pk).delete()
+        event.save()
+        self.assertTrue(Event.objects.filter(pk=event.pk).exists())
+
+    def test_full_save_writes_attendee_count(self):
+        event = create_event()
+        event.attendee_count = 3
+        event.save()
+        self.assertEqual(Event.objects.get(pk=event.pk).attendee_count, 3)
+
+
+class EventAdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "password")
+
+    def test_change_keeps_concurrent_attendee_count(self):
+        event = create_event(capacity=10)
+        loaded = Event.objects.get(pk=event.pk)
+        # Пока страница открыта, через бота записались участники
+        Event.objects.filter(pk=event.pk).update(attendee_count=4)
+
+        loaded.name = "Renamed"
+        request = RequestFactory().post("/")
+        request.user = self.admin
+        site._registry[Event].save_model(request, loaded, None, change=True)
+
+        event.refresh_from_db()
+        self.assertEqual((event.name, event.attendee_count), ("Renamed", 4))
+
+    def test_change_form(self):
+        event = create_event(capacity=10, attendee_count=2)
+        self.client.force_login(self.admin)
+        local = timezone.localtime(event.date_time)
+        response = self.client.post(reverse("admin:main_event_change", args=[event.pk]), {
+            "name": "Renamed",
+            "location": "Location",
+            "address": "Address",
+            "event_type": "offline",
+            "category": "concert",
+            "date_time_0": local.strftime("%d.%m.%Y"),
+            "date_time_1": local.strftime("%H:%M:%S"),
+            "capacity": "20",
+        })
+
+        self.assertEqual(response.status_code, 302)
+        event.refresh_from_db()
+        self.assertEqual((event.name, event.event_type, event.capacity, event.attendee_count), ("Renamed", "offline", 20, 2))
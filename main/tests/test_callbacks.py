@@ -0,0 +1,133 @@
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from main import callbacks
+from main.callbacks import CallbackRouter, CallbackType, MAX_LENGTH, VERSION
+from main.pagination import PAGE_NEXT, PAGE_PREV
+
+ALL_TYPES = [value for value in vars(callbacks).values() if isinstance(value, CallbackType)]
+
+
+def make_router():
+    """Маршрутизатор со всеми типами кнопок; обработчик возвращает свои аргументы"""
+    router = CallbackRouter()
+    for callback_type in ALL_TYPES:
+        router.route(callback_type)(lambda call, *args, name=callback_type.name: call.handled.append((name, args)))
+    return router
+
+
+class CallbackCodecTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = make_router()
+
+    def test_round_trip(self):
+        samples = [
+            (callbacks.BACK_MAIN, ()),
+            (callbacks.EVENT_TYPE, ("hybrid",)),
+            (callbacks.CATEGORY, ("offline", "training")),
+            (callbacks.PAGE, (PAGE_NEXT, "1792000000000000_123456")),
+            (callbacks.PAGE, (PAGE_PREV, "0_1")),
+            (callbacks.GOING, (0,)),
+            (callbacks.GOING, (2 ** 63 - 1,)),
+            (callbacks.EDIT_STATUS, ("delete", 42)),
+            (callbacks.MAYBE_EVENTS, ()),
+            (callbacks.MAYBE_CATEGORY, ("marathon",)),
+            (callbacks.MY_EVENTS, ()),
+            (callbacks.MY_CATEGORY, ("meeting",)),
+            (callbacks.CANCEL_ATTENDANCE, (987654321,)),
+            (callbacks.PRIVATE_EVENTS, ()),
+            (callbacks.PRIVATE_CHANNEL, (7,)),
+            (callbacks.PRIVATE_TYPE, (7, "online")),
+            (callbacks.PRIVATE_CATEGORY, (2 ** 63 - 1, "hybrid", "training")),
+            (callbacks.SEARCH_PAGE, (120,)),
+        ]
+        self.assertEqual({callback_type for callback_type, _ in samples}, set(ALL_TYPES))
+        for callback_type, values in samples:
+            data = callback_type.pack(*values)
+            self.assertTrue(data.startswith(VERSION), data)
+            self.assertLessEqual(len(data.encode("utf-8")), MAX_LENGTH, data)
+            self.assertEqual(self.router.resolve(data), (callback_type, values), data)
+
+    def test_sent_v1_payloads(self):
+        # Кнопки версии 1, уже отправленные пользователям: разбор не должен меняться
+        payloads = {
+            "1b": (callbacks.BACK_MAIN, ()),
+            "1t:2": (callbacks.EVENT_TYPE, ("hybrid",)),
+            "1c:1:3": (callbacks.CATEGORY, ("offline", "training")),
+            "1p:1:3f-z": (callbacks.PAGE, (PAGE_PREV, "123_35")),
+            "1g:2n9c": (callbacks.GOING, (123456,)),
+            "1e:0:16": (callbacks.EDIT_STATUS, ("going", 42)),
+            "1n:2": (callbacks.MAYBE_CATEGORY, ("marathon",)),
+            "1u:0": (callbacks.MY_CATEGORY, ("concert",)),
+            "1x:a": (callbacks.CANCEL_ATTENDANCE, (10,)),
+            "1h:1": (callbacks.PRIVATE_CHANNEL, (1,)),
+            "1r:1:0": (callbacks.PRIVATE_TYPE, (1, "online")),
+            "1s:1:0:0": (callbacks.PRIVATE_CATEGORY, (1, "online", "concert")),
+            "1q:a": (callbacks.SEARCH_PAGE, (10,)),
+        }
+        for data, expected in payloads.items():
+            self.assertEqual(self.router.resolve(data), expected, data)
+
+    def test_legacy_payloads(self):
+        # Текстовый формат до версии 1
+        payloads = {
+            "back_main": (callbacks.BACK_MAIN, ()),
+            "event_type_online": (callbacks.EVENT_TYPE, ("online",)),
+            "category_offline_concert": (callbacks.CATEGORY, ("offline", "concert")),
+            "page_next_1792000000000000_15": (callbacks.PAGE, (PAGE_NEXT, "1792000000000000_15")),
+            "going_123456": (callbacks.GOING, (123456,)),
+            "edit_status_delete_77": (callbacks.EDIT_STATUS, ("delete", 77)),
+            "maybe_events": (callbacks.MAYBE_EVENTS, ()),
+            "maybe_cat_marathon": (callbacks.MAYBE_CATEGORY, ("marathon",)),
+            "my_events": (callbacks.MY_EVENTS, ()),
+            "my_cat_training": (callbacks.MY_CATEGORY, ("training",)),
+            "cancel_attendance_9": (callbacks.CANCEL_ATTENDANCE, (9,)),
+            "private_events": (callbacks.PRIVATE_EVENTS, ()),
+            "private_channel_3": (callbacks.PRIVATE_CHANNEL, (3,)),
+            "private_type_3_hybrid": (callbacks.PRIVATE_TYPE, (3, "hybrid")),
+            "private_cat_3_hybrid_meeting": (callbacks.PRIVATE_CATEGORY, (3, "hybrid", "meeting")),
+        }
+        for data, expected in payloads.items():
+            self.assertEqual(self.router.resolve(data), expected, data)
+        self.assertTrue(self.router.is_priority("going_1"))
+        self.assertTrue(self.router.is_priority("cancel_attendance_1"))
+        self.assertFalse(self.router.is_priority("my_events"))
+
+    def test_unknown_data(self):
+        for data in ["", "1", "1z", "1z:1", "back", "buy_ticket_5", "category"]:
+            self.assertEqual(self.router.resolve(data), (None, None), data)
+
+    def test_malformed_data(self):
+        # Известный тип с повреждёнными полями: None и предупреждение в логе
+        for data in ["1g", "1g:1:2", "1g:-1", "1g:+1", "1g:1_0", "1g: 1", "1t:9", "1p:0:1-", "going_",
+                     "going_abc", "going_-1", "category_online_party", "private_type_x_online", "page_next_5"]:
+            with self.assertLogs("main.callbacks", "WARNING"):
+                self.assertEqual(self.router.resolve(data), (None, None), data)
+
+    def test_pack_validates(self):
+        with self.assertRaises(ValueError):
+            callbacks.CATEGORY.pack("online")
+        with self.assertRaises(ValueError):
+            callbacks.GOING.pack(-1)
+        with self.assertRaises(KeyError):
+            callbacks.EVENT_TYPE.pack("virtual")
+
+    def test_codes_are_unique(self):
+        codes = [callback_type.code for callback_type in ALL_TYPES]
+        self.assertEqual(len(codes), len(set(codes)))
+        router = CallbackRouter()
+        router.route(callbacks.GOING)(lambda call, event_id: None)
+        with self.assertRaises(ValueError):
+            router.route(CallbackType("clash", callbacks.GOING.code))(lambda call: None)
+
+    def test_dispatch(self):
+        call = SimpleNamespace(data="going_5", handled=[])
+        self.assertTrue(self.router.dispatch(call))
+        call.data = callbacks.PRIVATE_TYPE.pack(5, "offline")
+        self.assertTrue(self.router.dispatch(call))
+        call.data = "unknown"
+        self.assertFalse(self.router.dispatch(call))
+        self.assertEqual(call.handled, [("going", (5,)), ("private_type", (5, "offline"))])
+
@@ -0,0 +1,141 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from main.dispatch import UpdateDispatcher, LANE_PRIORITY, LANE_DEFAULT
+
+
+def classify(update):
+    """Обновление в тестах - кортеж (чат, полоса, номер)"""
+    chat, lane, _ = update
+    return chat, lane
+
+
+class UpdateDispatcherTests(SimpleTestCase):
+
+    def make_dispatcher(self, handler, num_workers=4, max_queue=1000):
+        dispatcher = UpdateDispatcher(handler, classify, num_workers=num_workers, max_queue=max_queue, name='test')
+        self.addCleanup(dispatcher.stop, 5)
+        return dispatcher.start()
+
+    def test_same_chat_in_order_and_never_concurrent(self):
+        lock = threading.Lock()
+        handled = {'a': [], 'b': [], 'c': []}
+        active = set()
+        overlaps = []
+
+        def handler(update):
+            chat, _, number = update
+            with lock:
+                if chat in active:
+                    overlaps.append(update)
+                active.add(chat)
+            time.sleep(0.001)
+            with lock:
+                active.discard(chat)
+                handled[chat].append(number)
+
+        dispatcher = self.make_dispatcher(handler)
+        for number in range(30):
+            for chat in handled:
+                lane = LANE_PRIORITY if number % 3 == 0 else LANE_DEFAULT
+                dispatcher.submit((chat, lane, number))
+        dispatcher.stop(5)
+
+        self.assertEqual(overlaps, [])
+        for chat, numbers in handled.items():
+            self.assertEqual(numbers, list(range(30)), chat)
+
+    def test_different_chats_in_parallel(self):
+        barrier = threading.Barrier(2, timeout=5)
+        passed = []
+
+        def handler(update):
+            barrier.wait()
+            passed.append(update[0])
+
+        dispatcher = self.make_dispatcher(handler, num_workers=2)
+        dispatcher.submit(('a', LANE_DEFAULT, 0))
+        dispatcher.submit(('b', LANE_DEFAULT, 0))
+        dispatcher.stop(5)
+
+        # Барьер пройден, только если оба чата обрабатывались одновременно
+        self.assertEqual(sorted(passed), ['a', 'b'])
+        self.assertEqual(dispatcher.stats()['failed'], 0)
+
+    def test_priority_lane_first(self):
+        gate = threading.Event()
+        handled = []
+
+        def handler(update):
+            if update[0] == 'busy':
+                gate.wait(5)
+            handled.append(update[0])
+
+        dispatcher = self.make_dispatcher(handler, num_workers=1)
+        dispatcher.submit(('busy', LANE_DEFAULT, 0))
+        # Единственный поток занят: остальные обновления ждут в очереди
+        while dispatcher.stats()['in_flight'] == 0:
+            time.sleep(0.001)
+        dispatcher.submit(('b', LANE_DEFAULT, 0))
+        dispatcher.submit(('c', LANE_DEFAULT, 0))
+        dispatcher.submit(('d', LANE_PRIORITY, 0))
+        dispatcher.submit(('e', LANE_PRIORITY, 0))
+        gate.set()
+        dispatcher.stop(5)
+
+        self.assertEqual(handled, ['busy', 'd', 'e', 'b', 'c'])
+
+    def test_priority_update_does_not_overtake_its_chat(self):
+        gate = threading.Event()
+        handled = []
+
+        def handler(update):
+            if update[0] == 'busy':
+                gate.wait(5)
+            handled.append((update[0], update[2]))
+
+        dispatcher = self.make_dispatcher(handler, num_workers=1)
+        dispatcher.submit(('busy', LANE_DEFAULT, 0))
+        while dispatcher.stats()['in_flight'] == 0:
+            time.sleep(0.001)
+        dispatcher.submit(('a', LANE_DEFAULT, 1))
+        dispatcher.submit(('b', LANE_DEFAULT, 1))
+        dispatcher.submit(('a', LANE_PRIORITY, 2))
+        gate.set()
+        dispatcher.stop(5)
+
+        # Приоритетное обновление поднимает весь чат 'a', но внутри чата
+        # порядок сохраняется: сначала 1, затем 2
+        self.assertEqual(handled, [('busy', 0), ('a', 1), ('a', 2), ('b', 1)])
+
+    def test_stop_drains_queue_and_joins_workers(self):
+        handled = []
+        lock = threading.Lock()
+
+        def handler(update):
+            if update[2] % 10 == 0:
+                raise ValueError("boom")
+            time.sleep(0.0005)
+            with lock:
+                handled.append(update)
+
+        dispatcher = self.make_dispatcher(handler, num_workers=3, max_queue=20)
+        with self.assertLogs('main.dispatch', 'ERROR') as logs:
+            for number in range(100):
+                self.assertTrue(dispatcher.submit((number % 7, LANE_DEFAULT, number)))
+            threads = list(dispatcher._threads)
+            dispatcher.stop(5)
+
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        stats = dispatcher.stats()
+        self.assertEqual(stats['processed'], 100)
+        self.assertEqual(stats['failed'], 10)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['chats'], 0)
+        self.assertEqual(len(handled), 90)
+        self.assertEqual(len(logs.records), 10)
+        # После остановки новые обновления не принимаются
+        self.assertFalse(dispatcher.submit((0, LANE_DEFAULT, 100)))
@@ -0,0 +1,131 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import timedelta
+
+from django.db import connections
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from main.event_index import EventIndex, pair_name
+from main.invalidation import InvalidationBus
+from main.keyboards import ChannelsKeyboard
+from main.models import Event, TelegramChannel, User
+from main.routers import PRIMARY, REPLICA, pins, replica_reads, use_primary
+from main.users import UserResolver
+
+READER = 1
+WRITER = 2
+
+
+def create_event(name):
+    return Event.objects.create(
+        name=name,
+        location="Location",
+        address="Address",
+        event_type="online",
+        category="concert",
+        date_time=timezone.now() + timedelta(days=1),
+    )
+
+
+class LaggingReplicaTests(TransactionTestCase):
+    """Реплика - копия основной БД, которая обновляется только в sync_replica()"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Реплика подключается после проверок тестового раннера: её файл
+        # создаётся копией основной БД, а не миграциями
+        cls.directory = tempfile.mkdtemp()
+        connections.databases[REPLICA] = {
+            **connections.databases[PRIMARY],
+            'NAME': os.path.join(cls.directory, 'replica.sqlite3'),
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.databases[REPLICA]
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def setUp(self):
+        pins.clear()
+        self.addCleanup(pins.clear)
+        self.bus = InvalidationBus(poll_interval=0)
+        self.sync_replica()
+
+    def sync_replica(self):
+        connections[PRIMARY].ensure_connection()
+        target = sqlite3.connect(connections.databases[REPLICA]['NAME'])
+        try:
+            connections[PRIMARY].connection.backup(target)
+        finally:
+            target.close()
+
+    def refresh_as_writer(self):
+        # Снимок поколений обновляет обработчик с use_primary другого пользователя
+        with replica_reads(WRITER):
+            use_primary(self.bus.refresh)()
+
+    def test_replica_lags(self):
+        event = create_event("New")
+        with replica_reads(READER):
+            self.assertFalse(Event.objects.filter(id=event.id).exists())
+        with replica_reads(WRITER):
+            self.assertTrue(use_primary(Event.objects.filter(id=event.id).exists)())
+
+    def test_event_index_pair_reload(self):
+        index = EventIndex(bus=self.bus)
+        old = create_event("Old")
+        self.sync_replica()
+        with replica_reads(READER):
+            self.assertEqual([event.id for event in index.upcoming("online", "concert")], [old.id])
+
+        new = create_event("New")
+        self.bus.publish(pair_name("online", "concert"))
+        self.refresh_as_writer()
+
+        with replica_reads(READER):
+            self.assertEqual([event.id for event in index.upcoming("online", "concert")], [old.id, new.id])
+
+    def test_event_index_full_reload(self):
+        index = EventIndex(bus=self.bus)
+        with replica_reads(READER):
+            self.assertEqual(index.upcoming("online", "concert"), [])
+
+        new = create_event("New")
+        self.bus.publish(index.root_name)
+        self.refresh_as_writer()
+
+        with replica_reads(READER):
+            self.assertEqual([event.id for event in index.upcoming("online", "concert")], [new.id])
+
+    def test_user_resolver(self):
+        resolver = UserResolver(bus=self.bus)
+        user = User.objects.create(telegram_id="100", username="user")
+        self.sync_replica()
+        with replica_reads(READER):
+            self.assertFalse(resolver.resolve("100").is_admin)
+
+        User.objects.filter(pk=user.pk).update(is_admin=True)
+        self.bus.publish(resolver.name)
+        self.refresh_as_writer()
+
+        with replica_reads(READER):
+            self.assertTrue(resolver.resolve("100").is_admin)
+
+    def test_channels_keyboard(self):
+        keyboard = ChannelsKeyboard(bus=self.bus)
+        with replica_reads(READER):
+            self.assertIsNone(keyboard.get())
+
+        TelegramChannel.objects.create(channel_id="c", name="Channel")
+        self.bus.publish(keyboard.name)
+        self.refresh_as_writer()
+
+        with replica_reads(READER):
+            self.assertIn("Channel", keyboard.get())
@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from main.models import Event, TelegramChannel
+from main.search import search_events
+
+
+def create_event(name, days, **fields):
+    return Event.objects.create(
+        name=name,
+        location="Location",
+        address="Address",
+        event_type=fields.pop("event_type", "online"),
+        category=fields.pop("category", "concert"),
+        date_time=timezone.now() + timedelta(days=days),
+        **fields
+    )
+
+
+class SearchEventsTests(TestCase):
+
+    def test_upcoming_match_behind_many_past_matches(self):
+        upcoming = create_event("Jazz evening", days=3)
+        # Архив после импорта: более поздние строки, все прошедшие или приватные
+        channel = TelegramChannel.objects.create(channel_id="c", name="Channel")
+        for i in range(30):
+            create_event(f"Jazz archive {i}", days=-i - 1)
+        for i in range(10):
+            create_event(f"Jazz private {i}", days=5, is_private=True, channel=channel)
+
+        events, has_next = search_events("jazz", max_candidates=10)
+
+        self.assertEqual([event.id for event in events], [upcoming.id])
+        self.assertFalse(has_next)
+
+    def test_filters_before_candidate_limit(self):
+        concert = create_event("Jazz concert", days=2)
+        for i in range(20):
+            create_event(f"Jazz meeting {i}", days=2, category="meeting")
+
+        events, _ = search_events("jazz", max_candidates=5, category="concert")
+        self.assertEqual([event.id for event in events], [concert.id])
+
+        events, _ = search_events("jazz", max_candidates=5, event_type="offline")
+        self.assertEqual(events, [])
+
+    def test_pages_and_ranking(self):
+        for i in range(5):
+            create_event(f"Rock {i}", days=i + 1, details="jazz")
+        by_name = create_event("Jazz", days=10)
+
+        first, has_next = search_events("jazz", page_size=3)
+        second, has_more = search_events("jazz", offset=3, page_size=3)
+
+        # Совпадение в названии весит больше, чем в описании
+        self.assertEqual(first[0].id, by_name.id)
+        self.assertTrue(has_next)
+        self.assertFalse(has_more)
+        self.assertEqual(len({event.id for event in first + second}), 6)
+
+    def test_empty_query(self):
+        create_event("Jazz", days=1)
+        self.assertEqual(search_events("  !? "), ([], False))
@@ -0,0 +1,151 @@
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from main.metrics import cache_lookup
+from main.models import User
+from main.routers import primary_reads
+
+logger = logging.getLogger(__name__)
+
+UserRef = namedtuple("UserRef", ["pk", "is_admin"])
+
+
+class UserResolver:
+    """LRU-кэш telegram_id -> (pk, is_admin) в памяти процесса.
+
+    Обработчики фильтруют по pk пользователя и не делают отдельный запрос
+    User.objects.get(telegram_id=...). Изменения пользователей в админке
+    (в том числе из другого процесса) сбрасывают кэш через шину инвалидации.
+    """
+
+    def __init__(self, max_size=10000, bus=None, name="users"):
+        self.max_size = max_size
+        self.bus = bus
+        self.name = name
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+        self._telegram_ids = {}
+        self._generation = None
+
+    def resolve(self, telegram_id):
+        """pk и флаг администратора; User.DoesNotExist, если пользователь не зарегистрирован"""
+        telegram_id = str(telegram_id)
+        self._sync()
+        with self._lock:
+            ref = self._users.get(telegram_id)
+            if ref is not None:
+                self._users.move_to_end(telegram_id)
+        cache_lookup(self.name, ref is not None)
+        if ref is not None:
+            return ref
+        # Кэш общий для процесса и сбрасывается по поколению шины: читаем с основной БД
+        with primary_reads():
+            row = User.objects.filter(telegram_id=telegram_id).values_list("pk", "is_admin").first()
+        if row is None:
+            raise User.DoesNotExist("User matching query does not exist.")
+        ref = UserRef(*row)
+        self._remember(telegram_id, ref)
+        return ref
+
+    def register(self, telegram_id, username):
+        """Регистрация: (UserRef, создан ли пользователь).
+
+        Для существующего пользователя обновляется username. /start обычно
+        присылает уже зарегистрированный пользователь, поэтому сначала идёт
+        UPDATE ... RETURNING (один запрос), а если строки нет - INSERT ...
+        ON CONFLICT DO NOTHING RETURNING: строку возвращает только вставка.
+        Если пользователя одновременно вставил другой запрос, обновление
+        повторяется.
+        """
+        telegram_id = str(telegram_id)
+        self._sync()
+        while True:
+            row = self._update(telegram_id, username)
+            created = row is None
+            if created:
+                row = self._insert(telegram_id, username)
+            if row is not None:
+                break
+        ref = UserRef(row[0], bool(row[1]))
+        self._remember(telegram_id, ref)
+        return ref, created
+
+    @staticmethod
+    def _returning():
+        # RETURNING в INSERT и UPDATE: PostgreSQL и SQLite 3.35+ (MariaDB - только в INSERT)
+        return connection.vendor in ("postgresql", "sqlite") and connection.features.can_return_columns_from_insert
+
+    def _update(self, telegram_id, username):
+        """(pk, is_admin) обновлённого пользователя; None, если его нет"""
+        if not self._returning():
+            if not User.objects.filter(telegram_id=telegram_id).update(username=username):
+                return None
+            return User.objects.filter(telegram_id=telegram_id).values_list("pk", "is_admin").first()
+        table = connection.ops.quote_name(User._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET username = %s WHERE telegram_id = %s RETURNING id, is_admin",
+                [username, telegram_id]
+            )
+            return cursor.fetchone()
+
+    def _insert(self, telegram_id, username):
+        """(pk, is_admin) вставленного пользователя; None, если он уже есть"""
+        if not self._returning():
+            try:
+                with transaction.atomic():
+                    user = User.objects.create(telegram_id=telegram_id, username=username)
+            except IntegrityError:
+                return None
+            return user.pk, user.is_admin
+        table = connection.ops.quote_name(User._meta.db_table)
+        created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (telegram_id, username, is_admin, created_at) "
+                f"VALUES (%s, %s, %s, %s) "
+                f"ON CONFLICT (telegram_id) DO NOTHING "
+                f"RETURNING id, is_admin",
+                [telegram_id, username, False, created_at]
+            )
+            return cursor.fetchone()
+
+    def invalidate(self, telegram_id=None, pk=None):
+        """Сброс записи пользователя (по telegram_id или pk) или всего кэша"""
+        with self._lock:
+            if telegram_id is None and pk is None:
+                self._users.clear()
+                self._telegram_ids.clear()
+                return
+            if pk is not None:
+                telegram_id = self._telegram_ids.pop(pk, telegram_id)
+            if telegram_id is not None:
+                ref = self._users.pop(str(telegram_id), None)
+                if ref is not None:
+                    self._telegram_ids.pop(ref.pk, None)
+
+    def size(self):
+        with self._lock:
+            return len(self._users)
+
+    def _remember(self, telegram_id, ref):
+        with self._lock:
+            self._users[telegram_id] = ref
+            self._users.move_to_end(telegram_id)
+            self._telegram_ids[ref.pk] = telegram_id
+            if len(self._users) > self.max_size:
+                _, evicted = self._users.popitem(last=False)
+                self._telegram_ids.pop(evicted.pk, None)
+
+    def _sync(self):
+        if self.bus is None:
+            return
+        generation = self.bus.generation(self.name)
+        if generation != self._generation:
+            if self._generation is not None:
+                self.invalidate()
+            self._generation = generation
@@ -0,0 +1,48 @@
+import hmac
+import logging
+
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from telebot.types import Update
+
+from event_bot import settings
+from main.bot_handlers import process_update
+from main.metrics import REGISTRY, CONTENT_TYPE
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+@csrf_exempt
+@require_POST
+def telegram_webhook(request):
+    """Приём обновлений от Telegram в режиме вебхука"""
+    secret = request.headers.get(SECRET_TOKEN_HEADER, '')
+    if not settings.WEBHOOK_SECRET or not hmac.compare_digest(secret, settings.WEBHOOK_SECRET):
+        logger.warning("Webhook request with invalid secret token rejected")
+        return HttpResponseForbidden()
+
+    try:
+        update = Update.de_json(request.body.decode('utf-8'))
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning("Invalid webhook payload: %s", e)
+        return HttpResponseBadRequest()
+    if update is None:
+        return HttpResponseBadRequest()
+
+    process_update(update)
+    return HttpResponse()
+
+
+@require_GET
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus (только с METRICS_TOKEN)"""
+    if not settings.METRICS_TOKEN:
+        raise Http404()
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+        logger.warning("Metrics request with invalid token rejected")
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)